@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Benchmark dos codecs de serialização do runtime (Task 3).
+
+Mede codificação, decodificação e tamanho dos payloads em cada codec
+(INPUT_CODEC/OUTPUT_CODEC) com dados realistas:
+- entrada: métricas no formato do coletor (cpu_percent-N, virtual_memory-*,
+  net_io_counters_eth0-*) para hosts com vários números de CPUs
+- saída: o resultado de prints/metrics.json, replicado para mais CPUs
+
+A linha "json+str" reproduz o caminho original (decode_responses=True:
+bytes -> str -> json.loads). Uso:
+
+    python scripts/benchmark_codecs.py [--cpus 8 64 256] [--iterations 2000]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT_DIR, 'task3'))
+
+import runtime  # noqa: E402
+
+
+def build_input(num_cpus: int) -> dict:
+    """Cria uma amostra no formato publicado pelo coletor de métricas."""
+    rng = random.Random(num_cpus)
+    sample = {
+        'timestamp': '2025-11-22 19:17:50.093270',
+        'net_io_counters_eth0-bytes_sent1': rng.randint(10 ** 9, 10 ** 11),
+        'net_io_counters_eth0-bytes_recv1': rng.randint(10 ** 9, 10 ** 11),
+        'virtual_memory-total': 16 * 1024 ** 3,
+        'virtual_memory-used': rng.randint(10 ** 9, 10 ** 10),
+        'virtual_memory-percent': rng.uniform(0, 100),
+        'virtual_memory-cached': rng.randint(10 ** 8, 10 ** 10),
+        'virtual_memory-buffers': rng.randint(10 ** 7, 10 ** 9),
+    }
+    for cpu in range(num_cpus):
+        sample[f'cpu_percent-{cpu}'] = round(rng.uniform(0, 100), 1)
+    return sample
+
+
+def build_output(num_cpus: int) -> dict:
+    """Replica o resultado de prints/metrics.json para num_cpus CPUs."""
+    with open(os.path.join(ROOT_DIR, 'prints', 'metrics.json')) as f:
+        base = json.load(f)
+
+    averages = [value for key, value in base.items() if key.startswith('avg-util-cpu')]
+    result = {key: value for key, value in base.items() if not key.startswith('avg-util-cpu')}
+    for cpu in range(num_cpus):
+        result[f'avg-util-cpu{cpu}-60sec'] = averages[cpu % len(averages)]
+    result['num_cpus_monitored'] = num_cpus
+    return result
+
+
+def available_codecs() -> dict:
+    """Codecs do runtime disponíveis neste ambiente."""
+    codecs = {'json': runtime.JSON_CODEC}
+    if runtime.orjson is not None:
+        codecs['orjson'] = runtime.FAST_JSON_CODEC
+    if runtime.MSGPACK_CODEC is not None:
+        codecs['msgpack'] = runtime.MSGPACK_CODEC
+    codecs['zlib'] = runtime.ZLIB_CODEC
+    return codecs
+
+
+def measure(func, iterations: int) -> float:
+    """Melhor tempo médio por chamada (µs) em 3 repetições."""
+    return min(timeit.repeat(func, number=iterations, repeat=3)) / iterations * 1e6
+
+
+def bench_payload(label: str, payload: dict, iterations: int) -> dict:
+    """Mede todos os codecs para um payload e imprime a tabela."""
+    print(f"📦 {label}")
+    print(f"   {'codec':10s} {'encode':>10s} {'decode':>10s} {'bytes':>8s}")
+
+    results = {}
+    for name, codec in available_codecs().items():
+        encoded = codec.encode(payload)
+        raw = encoded.encode() if isinstance(encoded, str) else encoded
+        assert codec.decode(raw) == payload
+
+        encode_us = measure(lambda: codec.encode(payload), iterations)
+        decode_us = measure(lambda: codec.decode(raw), iterations)
+        results[name] = {'encode_us': round(encode_us, 2), 'decode_us': round(decode_us, 2), 'bytes': len(raw)}
+        print(f"   {name:10s} {encode_us:8.1f}µs {decode_us:8.1f}µs {len(raw):8d}")
+
+    # Caminho original: resposta decodificada para str antes do json.loads
+    raw = runtime.JSON_CODEC.encode(payload).encode()
+    decode_us = measure(lambda: json.loads(raw.decode()), iterations)
+    results['json+str'] = {'decode_us': round(decode_us, 2), 'bytes': len(raw)}
+    print(f"   {'json+str':10s} {'-':>10s} {decode_us:8.1f}µs {len(raw):8d}")
+
+    fastest = min((name for name in results if name != 'json+str'), key=lambda name: results[name]['decode_us'])
+    print(f"   🚀 decode mais rápido: {fastest} "
+          f"({results['json+str']['decode_us'] / results[fastest]['decode_us']:.1f}x vs json+str)")
+    print()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--cpus', type=int, nargs='+', default=[8, 64, 256], help='Números de CPUs por host')
+    parser.add_argument('--iterations', type=int, default=2000, help='Chamadas por medição')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("  Benchmark de Codecs - Task 3")
+    print("=" * 60)
+    print(f"🧩 Codecs: {', '.join(available_codecs())}")
+    print(f"🔁 Iterações: {args.iterations} por medição")
+    print()
+
+    summary = {}
+    for num_cpus in args.cpus:
+        summary[f'input-{num_cpus}cpu'] = bench_payload(
+            f"Entrada ({num_cpus} CPUs)", build_input(num_cpus), args.iterations)
+        summary[f'output-{num_cpus}cpu'] = bench_payload(
+            f"Saída ({num_cpus} CPUs)", build_output(num_cpus), args.iterations)
+
+    print(json.dumps(summary))
+
+
+if __name__ == '__main__':
+    main()
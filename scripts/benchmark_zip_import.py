@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Benchmark de inicialização do runtime (Task 3) com pacotes ZIP.
+
+Compara o tempo para carregar o handler de um ZIP com dependências
+"vendorizadas" em dois caminhos:
+- extract: extrair o ZIP inteiro, percorrer a árvore (os.walk) e carregar o
+  módulo do disco (caminho original do runtime)
+- zipimport: montar o índice de módulos a partir do diretório do ZIP e
+  importar direto do arquivo (ZIP_IMPORT_MODE=zip/auto)
+
+Cada medição roda em um processo novo, para não aproveitar módulos já
+importados. Uso:
+
+    python scripts/benchmark_zip_import.py [--files 2000] [--runs 5]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import zipfile
+
+
+RUNTIME_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'task3')
+
+HANDLER_SOURCE = '''
+from vendored.lib0 import mod0, mod1, mod2
+
+def handler(input, context):
+    return {'value': mod0.VALUE + mod1.VALUE + mod2.VALUE}
+'''
+
+MODULE_SOURCE = '''
+VALUE = {index}
+
+def helper_{index}(data):
+    """Função de exemplo para dar volume ao módulo."""
+    total = 0
+    for item in data:
+        total += item * {index}
+    return total
+''' + '\n'.join(f"CONSTANT_{i} = {i}" for i in range(50))
+
+EXTRACT_CODE = '''
+import os, sys, tempfile, time, zipfile
+sys.path.insert(0, {runtime_dir!r})
+import runtime
+
+start = time.perf_counter()
+extract_dir = tempfile.mkdtemp(prefix='bench_', dir={work_dir!r})
+with zipfile.ZipFile({zip_path!r}) as zip_ref:
+    zip_ref.extractall(extract_dir)
+sys.path.insert(0, extract_dir)
+module_file = None
+for root, dirs, files in os.walk(extract_dir):
+    if 'handler_module.py' in files:
+        module_file = os.path.join(root, 'handler_module.py')
+        break
+module = runtime.load_module_from_path(module_file, 'handler_module')
+assert module.handler({{}}, None)['value'] == 3
+print('RESULT', time.perf_counter() - start)
+'''
+
+ZIPIMPORT_CODE = '''
+import posixpath, sys, time, zipfile
+sys.path.insert(0, {runtime_dir!r})
+import runtime
+
+start = time.perf_counter()
+with zipfile.ZipFile({zip_path!r}) as zip_ref:
+    modules = {{posixpath.basename(name)[:-3]: name for name in zip_ref.namelist() if name.endswith('.py')}}
+assert 'handler_module' in modules
+sys.path.insert(0, {zip_path!r})
+module = runtime.load_module_from_zip('handler_module')
+assert module.handler({{}}, None)['value'] == 3
+print('RESULT', time.perf_counter() - start)
+'''
+
+
+def build_bundle(path: str, num_files: int):
+    """Cria um ZIP com o handler e num_files módulos vendorizados."""
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zip_ref:
+        zip_ref.writestr('handler_module.py', HANDLER_SOURCE)
+        zip_ref.writestr('vendored/__init__.py', '')
+
+        per_lib = 100
+        for lib in range((num_files + per_lib - 1) // per_lib):
+            zip_ref.writestr(f'vendored/lib{lib}/__init__.py', '')
+            for index in range(min(per_lib, num_files - lib * per_lib)):
+                zip_ref.writestr(f'vendored/lib{lib}/mod{index}.py', MODULE_SOURCE.format(index=index))
+
+
+def measure(code: str) -> float:
+    """Executa o código em um processo novo e retorna o tempo medido por ele."""
+    output = subprocess.run(
+        [sys.executable, '-c', code],
+        capture_output=True, text=True, check=True
+    ).stdout
+    for line in output.splitlines():
+        if line.startswith('RESULT'):
+            return float(line.split()[1])
+    raise RuntimeError(f"Saída inesperada: {output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--files', type=int, default=2000, help='Módulos vendorizados no ZIP')
+    parser.add_argument('--runs', type=int, default=5, help='Execuções por estratégia')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        zip_path = os.path.join(work_dir, 'function.zip')
+        build_bundle(zip_path, args.files)
+
+        print("=" * 60)
+        print("  Benchmark de Inicialização com ZIP - Task 3")
+        print("=" * 60)
+        print(f"📦 ZIP: {args.files} módulos | {os.path.getsize(zip_path) / 1024:.0f} KB")
+        print(f"🔁 Execuções: {args.runs} por estratégia")
+        print()
+
+        strategies = {
+            'extract': EXTRACT_CODE,
+            'zipimport': ZIPIMPORT_CODE,
+        }
+        results = {}
+
+        for name, template in strategies.items():
+            code = template.format(runtime_dir=RUNTIME_DIR, zip_path=zip_path, work_dir=work_dir)
+            times = [measure(code) for _ in range(args.runs)]
+            results[name] = statistics.median(times)
+            print(f"⏱️  {name:10s} mediana {results[name] * 1000:8.1f}ms | "
+                  f"min {min(times) * 1000:8.1f}ms | max {max(times) * 1000:8.1f}ms")
+
+        print()
+        print(f"🚀 zipimport é {results['extract'] / results['zipimport']:.1f}x mais rápido que extract")
+        print(json.dumps({name: round(value * 1000, 2) for name, value in results.items()}))
+
+
+if __name__ == '__main__':
+    main()
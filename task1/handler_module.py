@@ -5,31 +5,402 @@ Este módulo implementa uma função handler que processa dados de monitoramento
 de CPU, memória e rede, calculando:
 - Porcentagem de tráfego de saída de rede
 - Porcentagem de memória em cache
-- Média móvel de utilização de CPU nos últimos 60 segundos
+- Média móvel de utilização de CPU nos últimos 60 segundos (e, opcionalmente,
+  em janelas maiores configuradas via CPU_AVG_WINDOWS, ex: "60,300,900")
+
+As janelas podem ser contadas em amostras (CPU_WINDOW_MODE=samples, padrão,
+assume uma amostra a cada CPU_SAMPLE_PERIOD segundos) ou em tempo real a
+partir do campo 'timestamp' (CPU_WINDOW_MODE=time), com média ponderada pelo
+intervalo entre amostras.
+
+Também exporta:
+- handler_batch: usado pelo runtime customizado (Task 3) para processar em
+  lote as amostras acumuladas (ex: após uma queda do Redis)
+- handler_hosts: processa de uma vez as amostras de vários hosts com NumPy
 """
 
-from typing import Any, Dict, List
+from array import array
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Union
 import json
+import os
 
+try:
+    import numpy as np
+except ImportError:  # handler_hosts requer NumPy; handler e handler_batch não
+    np = None
 
-def handler(input: dict, context: object) -> Dict[str, Any]:
+
+# Coletor de métricas a cada 5 segundos
+# Para média móvel de 60 segundos, precisamos dos últimos 12 valores (60/5 = 12);
+# o tamanho de cada janela vem de _window_sizes()
+SAMPLE_PERIOD = int(os.getenv('CPU_SAMPLE_PERIOD', 5))
+
+# Janelas de média móvel em segundos (ex: "60,300,900" = 60s, 5min e 15min).
+# Cada janela gera a chave avg-util-cpu<id>-<segundos>sec
+AVG_WINDOWS = [int(w) for w in os.getenv('CPU_AVG_WINDOWS', '60').split(',') if w.strip()]
+
+# 'samples': janela = últimas N amostras (N = segundos / SAMPLE_PERIOD)
+# 'time': janela = amostras dos últimos N segundos segundo o campo 'timestamp'
+CPU_WINDOW_MODE = os.getenv('CPU_WINDOW_MODE', 'samples').lower()
+
+# Distância (em unidades da última casa, já escalada) de um empate x.5 abaixo
+# da qual a média da soma acumulada é refeita com sum(), como no original
+ROUNDING_TIE_TOLERANCE = 1e-6
+
+
+class RollingWindow:
     """
-    Função handler para processar métricas de recursos do sistema.
+    Médias móveis de uma CPU em O(1) por amostra, para várias janelas.
     
-    Args:
-        input: Dicionário contendo métricas coletadas do sistema (CPU, memória, rede)
-        context: Objeto de contexto contendo informações de ambiente e estado persistente
+    Os valores ficam em um buffer circular (array de doubles) com o tamanho
+    da maior janela, e cada janela mantém sua soma acumulada: a cada amostra
+    soma-se o valor novo e subtrai-se o que saiu da janela. As somas são
+    recalculadas do zero a cada volta completa do buffer para não acumular
+    erro de ponto flutuante.
+    
+    A soma acumulada pode diferir de sum(janela) no último bit, o que só muda
+    a saída quando a média cai em um empate do arredondamento (ex: x.xx5):
+    nesses casos mean(index, digits) refaz a soma com sum(), e o resultado
+    arredondado é idêntico ao do handler original.
+    """
+    
+    __slots__ = ('sizes', 'values', 'pos', 'count', 'sums', 'pushes_since_resum')
+    
+    def __init__(self, sizes: List[int]):
+        self.sizes = list(sizes)
+        self.values = array('d', bytes(8 * max(self.sizes)))
+        self.pos = 0
+        self.count = 0
+        self.sums = [0.0] * len(self.sizes)
+        self.pushes_since_resum = 0
+    
+    def push(self, value: float, timestamp: Optional[float] = None):
+        """Adiciona uma amostra a todas as janelas (timestamp é ignorado)."""
+        values = self.values
+        capacity = len(values)
         
-    Returns:
-        Dicionário JSON-encodable com as métricas calculadas
+        for i, size in enumerate(self.sizes):
+            if self.count >= size:
+                self.sums[i] -= values[(self.pos - size) % capacity]
+            self.sums[i] += value
+        
+        values[self.pos] = value
+        self.pos = (self.pos + 1) % capacity
+        self.count = min(self.count + 1, capacity)
+        
+        self.pushes_since_resum += 1
+        if self.pushes_since_resum >= capacity:
+            self._resum()
+    
+    def _resum(self):
+        """Recalcula as somas exatamente a partir do buffer."""
+        history = self.tolist()
+        self.sums = [_sum_in_order(history[-size:]) for size in self.sizes]
+        self.pushes_since_resum = 0
+    
+    def mean(self, index: int = 0, digits: Optional[int] = None) -> float:
+        """
+        Média da janela sizes[index] sobre as amostras disponíveis.
+        
+        Com digits (casas do arredondamento feito pelo chamador), uma média
+        perto de um empate é recalculada como sum(janela) / len(janela).
+        """
+        size = min(self.count, self.sizes[index])
+        mean = self.sums[index] / size
+        if digits is not None and _near_rounding_tie(mean, digits):
+            mean = sum(self.tolist()[-size:]) / size
+        return mean
+    
+    def tolist(self) -> List[float]:
+        """Valores armazenados em ordem cronológica."""
+        capacity = len(self.values)
+        start = (self.pos - self.count) % capacity
+        return [self.values[(start + i) % capacity] for i in range(self.count)]
+
+
+class TimeWindow:
     """
+    Médias móveis de uma CPU em janelas de tempo, ponderadas pelo intervalo.
     
-    # Inicializar dicionário de resultados
-    results = {}
+    cpu_percent é a utilização desde a leitura anterior, então cada amostra
+    vale pelo intervalo (timestamp anterior, timestamp]. Cada janela guarda
+    esses segmentos e a área (valor x duração) acumulada; segmentos que saem
+    da janela são descartados pelo início, e o segmento que cruza o limite
+    entra apenas com a parte de dentro. Com amostras regulares a cada 5s, a
+    média de 60s é a média das últimas 12 amostras, como no modo 'samples'.
     
-    # ========================================================================
-    # 1. CALCULAR PORCENTAGEM DE TRÁFEGO DE SAÍDA DE REDE
-    # ========================================================================
+    A primeira amostra vale por SAMPLE_PERIOD segundos. Amostras sem
+    timestamp assumem o anterior + SAMPLE_PERIOD; amostras fora de ordem ou
+    repetidas são ignoradas.
+    """
+    
+    __slots__ = ('spans', 'segments', 'areas', 'last_ts', 'pushes_since_resum')
+    
+    def __init__(self, spans: List[float]):
+        self.spans = list(spans)
+        self.segments = [deque() for _ in self.spans]  # (início, fim, valor)
+        self.areas = [0.0] * len(self.spans)
+        self.last_ts = None
+        self.pushes_since_resum = 0
+    
+    def push(self, value: float, timestamp: Optional[float] = None):
+        """Adiciona a amostra medida em timestamp (segundos) a todas as janelas."""
+        if timestamp is None:
+            timestamp = SAMPLE_PERIOD if self.last_ts is None else self.last_ts + SAMPLE_PERIOD
+        
+        if self.last_ts is not None and timestamp <= self.last_ts:
+            return
+        
+        start = timestamp - SAMPLE_PERIOD if self.last_ts is None else self.last_ts
+        self.last_ts = timestamp
+        
+        for i, span in enumerate(self.spans):
+            segments = self.segments[i]
+            segments.append((start, timestamp, value))
+            self.areas[i] += value * (timestamp - start)
+            
+            # Descartar segmentos que terminaram antes do início da janela
+            horizon = timestamp - span
+            while segments[0][1] <= horizon:
+                old_start, old_end, old_value = segments.popleft()
+                self.areas[i] -= old_value * (old_end - old_start)
+        
+        self.pushes_since_resum += 1
+        if self.pushes_since_resum >= max(64, max(len(segments) for segments in self.segments)):
+            self.areas = [
+                _sum_in_order([v * (end - begin) for begin, end, v in segments])
+                for segments in self.segments
+            ]
+            self.pushes_since_resum = 0
+    
+    def mean(self, index: int = 0, digits: Optional[int] = None) -> float:
+        """Média ponderada pelo tempo na janela spans[index] (digits é ignorado)."""
+        segments = self.segments[index]
+        horizon = self.last_ts - self.spans[index]
+        
+        first_start, _, first_value = segments[0]
+        area = self.areas[index]
+        begin = first_start
+        
+        # Segmento que cruza o início da janela conta só a parte de dentro
+        if first_start < horizon:
+            area -= first_value * (horizon - first_start)
+            begin = horizon
+        
+        return area / (self.last_ts - begin)
+
+
+def _parse_timestamp(value) -> Optional[float]:
+    """
+    Converte o campo 'timestamp' do input em segundos (epoch).
+    
+    Aceita números (epoch) e strings ISO 8601, como '2025-12-04 22:23:48.287939'
+    (sem fuso, interpretadas como UTC). Retorna None se não for possível.
+    """
+    if isinstance(value, (int, float)):
+        return float(value)
+    
+    if isinstance(value, str):
+        try:
+            parsed = datetime.fromisoformat(value)
+        except ValueError:
+            try:
+                return float(value)
+            except ValueError:
+                return None
+        
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.timestamp()
+    
+    return None
+
+
+def _adopt(obj, cls):
+    """
+    Converte um objeto de estado de uma versão anterior deste módulo.
+    
+    Após o hot reload do handler, context.env ainda contém instâncias das
+    classes do módulo antigo; elas são copiadas para a classe atual.
+    """
+    if isinstance(obj, cls) or type(obj).__name__ != cls.__name__:
+        return obj
+    
+    adopted = cls.__new__(cls)
+    for name in getattr(cls, '__slots__', ()):
+        if hasattr(obj, name):
+            setattr(adopted, name, getattr(obj, name))
+    if hasattr(adopted, '__dict__'):
+        adopted.__dict__.update(getattr(obj, '__dict__', {}))
+    return adopted
+
+
+def _near_rounding_tie(value: float, digits: int) -> bool:
+    """Se value está (quase) em um empate de round(value, digits), ex: 12.345."""
+    scaled = abs(value) * 10 ** digits
+    return abs(scaled - int(scaled) - 0.5) < ROUNDING_TIE_TOLERANCE
+
+
+def _sum_in_order(values: List[float]) -> float:
+    """Soma da esquerda para a direita (mesma ordem usada por FleetWindows)."""
+    total = 0.0
+    for value in values:
+        total += value
+    return total
+
+
+def _window_sizes() -> List[int]:
+    """Tamanho (em amostras) de cada janela de AVG_WINDOWS."""
+    return [max(1, seconds // SAMPLE_PERIOD) for seconds in AVG_WINDOWS]
+
+
+def _cpu_window(cpu_histories: dict, cpu_id: str) -> Union[RollingWindow, TimeWindow]:
+    """
+    Retorna a janela da CPU, criando-a se necessário.
+    
+    No modo 'samples', históricos em formato antigo (lista de valores) ou com
+    outras janelas configuradas são convertidos, preservando as amostras
+    existentes. No modo 'time', históricos sem timestamps são descartados.
+    """
+    window = cpu_histories.get(cpu_id)
+    
+    if CPU_WINDOW_MODE == 'time':
+        window = cpu_histories[cpu_id] = _adopt(window, TimeWindow)
+        if not isinstance(window, TimeWindow) or window.spans != AVG_WINDOWS:
+            window = cpu_histories[cpu_id] = TimeWindow(AVG_WINDOWS)
+        return window
+    
+    sizes = _window_sizes()
+    window = _adopt(window, RollingWindow)
+    
+    if isinstance(window, RollingWindow) and window.sizes == sizes:
+        cpu_histories[cpu_id] = window
+        return window
+    
+    previous = window.tolist() if isinstance(window, RollingWindow) else list(window or [])
+    window = RollingWindow(sizes)
+    for value in previous[-max(sizes):]:
+        window.push(value)
+    
+    cpu_histories[cpu_id] = window
+    return window
+
+
+class FleetWindows:
+    """
+    Versão vetorizada de RollingWindow para uma frota de hosts.
+    
+    Guarda as janelas de todas as CPUs de todos os hosts em arrays NumPy
+    (hosts x cores x capacidade) e atualiza todas de uma vez por amostra.
+    As operações de ponto flutuante são as mesmas, na mesma ordem, de
+    RollingWindow, então as médias são idênticas às do handler por host
+    (inclusive a correção dos empates de arredondamento em means(digits)).
+    """
+    
+    def __init__(self, sizes: List[int]):
+        self.sizes = list(sizes)
+        self.capacity = max(self.sizes)
+        self.hosts = {}  # host -> linha
+        self.cores = {}  # cpu_id -> coluna
+        self.values = np.zeros((0, 0, self.capacity))
+        self.sums = np.zeros((len(self.sizes), 0, 0))
+        self.pos = np.zeros((0, 0), dtype=np.int64)
+        self.count = np.zeros((0, 0), dtype=np.int64)
+        self.pushes_since_resum = np.zeros((0, 0), dtype=np.int64)
+    
+    def index(self, hosts: List[str], cpu_ids: List[str]):
+        """Registra hosts/CPUs novos (crescendo os arrays) e retorna os índices."""
+        for host in hosts:
+            self.hosts.setdefault(host, len(self.hosts))
+        for cpu_id in cpu_ids:
+            self.cores.setdefault(cpu_id, len(self.cores))
+        
+        num_hosts, num_cores = len(self.hosts), len(self.cores)
+        grow_hosts = num_hosts - self.pos.shape[0]
+        grow_cores = num_cores - self.pos.shape[1]
+        
+        if grow_hosts or grow_cores:
+            pad = ((0, grow_hosts), (0, grow_cores))
+            self.values = np.pad(self.values, pad + ((0, 0),))
+            self.sums = np.pad(self.sums, ((0, 0),) + pad)
+            self.pos = np.pad(self.pos, pad)
+            self.count = np.pad(self.count, pad)
+            self.pushes_since_resum = np.pad(self.pushes_since_resum, pad)
+        
+        return [self.hosts[host] for host in hosts], [self.cores[cpu_id] for cpu_id in cpu_ids]
+    
+    def push(self, values, mask):
+        """
+        Adiciona uma amostra às células (host, cpu) marcadas em mask.
+        
+        Args:
+            values: Array (hosts x cores) com a utilização de cada CPU
+            mask: Array booleano (hosts x cores) com as células presentes
+        """
+        capacity = self.capacity
+        
+        for i, size in enumerate(self.sizes):
+            leaving_pos = (self.pos - size) % capacity
+            leaving = np.take_along_axis(self.values, leaving_pos[..., None], axis=2)[..., 0]
+            full = mask & (self.count >= size)
+            self.sums[i] = np.where(full, self.sums[i] - leaving, self.sums[i])
+            self.sums[i] = np.where(mask, self.sums[i] + values, self.sums[i])
+        
+        rows, cols = np.nonzero(mask)
+        self.values[rows, cols, self.pos[rows, cols]] = values[rows, cols]
+        self.pos = np.where(mask, (self.pos + 1) % capacity, self.pos)
+        self.count = np.where(mask, np.minimum(self.count + 1, capacity), self.count)
+        
+        self.pushes_since_resum = np.where(mask, self.pushes_since_resum + 1, self.pushes_since_resum)
+        resum = self.pushes_since_resum >= capacity
+        if resum.any():
+            self._resum(resum)
+    
+    def _resum(self, cells):
+        """Recalcula as somas das células indicadas (com o buffer cheio)."""
+        rows, cols = np.nonzero(cells)
+        pos = self.pos[rows, cols]
+        
+        for i, size in enumerate(self.sizes):
+            total = np.zeros(len(rows))
+            for k in range(size):
+                total = total + self.values[rows, cols, (pos - size + k) % self.capacity]
+            self.sums[i, rows, cols] = total
+        
+        self.pushes_since_resum[rows, cols] = 0
+    
+    def means(self, digits: Optional[int] = None):
+        """
+        Médias de cada janela: array (janelas x hosts x cores).
+        
+        Com digits, as células perto de um empate do arredondamento são
+        recalculadas com sum() sobre a janela, como em RollingWindow.mean.
+        """
+        sizes = np.array(self.sizes)[:, None, None]
+        counts = np.maximum(np.minimum(self.count[None, :, :], sizes), 1)
+        means = self.sums / counts
+        if digits is None:
+            return means
+        
+        scaled = np.abs(means) * 10 ** digits
+        ties = np.abs(scaled - np.floor(scaled) - 0.5) < ROUNDING_TIE_TOLERANCE
+        for i, row, col in zip(*np.nonzero(ties & (self.count[None, :, :] > 0))):
+            size = int(counts[i, row, col])
+            window = (self.pos[row, col] - size + np.arange(size)) % self.capacity
+            means[i, row, col] = sum(self.values[row, col, window].tolist()) / size
+        return means
+
+
+def _add_cpu_averages(results: dict, cpu_id: str, window: Union[RollingWindow, TimeWindow]):
+    """Adiciona ao resultado a média de cada janela configurada."""
+    for index, seconds in enumerate(AVG_WINDOWS):
+        results[f'avg-util-cpu{cpu_id}-{seconds}sec'] = round(window.mean(index, 2), 2)
+
+
+def _percent_network_egress(input: dict) -> float:
+    """Porcentagem de bytes enviados em relação ao total de tráfego."""
     bytes_sent = input.get('net_io_counters_eth0-bytes_sent1', 0)
     bytes_recv = input.get('net_io_counters_eth0-bytes_recv1', 0)
     
@@ -40,11 +411,11 @@ def handler(input: dict, context: object) -> Dict[str, Any]:
     else:
         percent_egress = 0.0
     
-    results['percent-network-egress'] = round(percent_egress, 2)
-    
-    # ========================================================================
-    # 2. CALCULAR PORCENTAGEM DE MEMÓRIA EM CACHE
-    # ========================================================================
+    return round(percent_egress, 2)
+
+
+def _percent_memory_cache(input: dict) -> float:
+    """Porcentagem da memória total usada para cache (cached + buffers)."""
     memory_total = input.get('virtual_memory-total', 1)  # Evitar divisão por zero
     memory_cached = input.get('virtual_memory-cached', 0)
     memory_buffers = input.get('virtual_memory-buffers', 0)
@@ -53,11 +424,11 @@ def handler(input: dict, context: object) -> Dict[str, Any]:
     memory_cache_total = memory_cached + memory_buffers
     percent_memory_cache = (memory_cache_total / memory_total) * 100.0
     
-    results['percent-memory-cache'] = round(percent_memory_cache, 2)
-    
-    # ========================================================================
-    # 3. CALCULAR MÉDIA MÓVEL DE UTILIZAÇÃO DE CPU (últimos 60 segundos)
-    # ========================================================================
+    return round(percent_memory_cache, 2)
+
+
+def _cpu_history_state(context: object) -> dict:
+    """Retorna (inicializando se necessário) o histórico de CPU em context.env."""
     
     # Inicializar estado persistente se não existir
     if not hasattr(context, 'env'):
@@ -66,12 +437,42 @@ def handler(input: dict, context: object) -> Dict[str, Any]:
     if 'cpu_history' not in context.env:
         context.env['cpu_history'] = {}
     
+    return context.env['cpu_history']
+
+
+def handler(input: dict, context: object) -> Dict[str, Any]:
+    """
+    Função handler para processar métricas de recursos do sistema.
+    
+    Args:
+        input: Dicionário contendo métricas coletadas do sistema (CPU, memória, rede)
+        context: Objeto de contexto contendo informações de ambiente e estado persistente
+        
+    Returns:
+        Dicionário JSON-encodable com as métricas calculadas
+    """
+    
+    # Inicializar dicionário de resultados
+    results = {}
+    
+    # ========================================================================
+    # 1. CALCULAR PORCENTAGEM DE TRÁFEGO DE SAÍDA DE REDE
+    # ========================================================================
+    results['percent-network-egress'] = _percent_network_egress(input)
+    
+    # ========================================================================
+    # 2. CALCULAR PORCENTAGEM DE MEMÓRIA EM CACHE
+    # ========================================================================
+    results['percent-memory-cache'] = _percent_memory_cache(input)
+    
+    # ========================================================================
+    # 3. CALCULAR MÉDIA MÓVEL DE UTILIZAÇÃO DE CPU (últimos 60 segundos)
+    # ========================================================================
+    cpu_histories = _cpu_history_state(context)
+    
     # Identificar todas as CPUs no input
     cpu_keys = [key for key in input.keys() if key.startswith('cpu_percent-')]
-    
-    # Coletor de métricas a cada 5 segundos
-    # Para média móvel de 60 segundos, precisamos dos últimos 12 valores (60/5 = 12)
-    WINDOW_SIZE = 12
+    sample_ts = _parse_timestamp(input.get('timestamp'))
     
     for cpu_key in cpu_keys:
         cpu_value = input.get(cpu_key, 0.0)
@@ -79,23 +480,12 @@ def handler(input: dict, context: object) -> Dict[str, Any]:
         # Extrair identificador da CPU (ex: 'cpu_percent-0' -> '0')
         cpu_id = cpu_key.replace('cpu_percent-', '')
         
-        # Inicializar histórico para esta CPU se não existir
-        if cpu_id not in context.env['cpu_history']:
-            context.env['cpu_history'][cpu_id] = []
-        
-        # Adicionar valor atual ao histórico
-        context.env['cpu_history'][cpu_id].append(cpu_value)
-        
-        # Manter apenas os últimos WINDOW_SIZE valores
-        if len(context.env['cpu_history'][cpu_id]) > WINDOW_SIZE:
-            context.env['cpu_history'][cpu_id] = context.env['cpu_history'][cpu_id][-WINDOW_SIZE:]
+        # Adicionar valor atual à janela (O(1) por amostra)
+        window = _cpu_window(cpu_histories, cpu_id)
+        window.push(cpu_value, sample_ts)
         
-        # Calcular média móvel
-        cpu_history = context.env['cpu_history'][cpu_id]
-        avg_cpu_util = sum(cpu_history) / len(cpu_history)
-        
-        # Adicionar ao resultado
-        results[f'avg-util-cpu{cpu_id}-60sec'] = round(avg_cpu_util, 2)
+        # Adicionar médias móveis ao resultado
+        _add_cpu_averages(results, cpu_id, window)
     
     # ========================================================================
     # INFORMAÇÕES ADICIONAIS (opcional, mas útil para debug)
@@ -106,6 +496,177 @@ def handler(input: dict, context: object) -> Dict[str, Any]:
     return results
 
 
+def handler_batch(inputs: List[dict], context: object) -> List[Dict[str, Any]]:
+    """
+    Versão em lote do handler, para recuperar amostras acumuladas.
+    
+    Produz exatamente os mesmos resultados que chamar handler() para cada
+    amostra em ordem, mas percorre as amostras agrupadas por CPU, buscando
+    a janela de cada CPU uma única vez por lote.
+    
+    Args:
+        inputs: Lista de amostras em ordem cronológica
+        context: Objeto de contexto contendo informações de ambiente e estado persistente
+        
+    Returns:
+        Lista de resultados, um por amostra, na mesma ordem de inputs
+    """
+    
+    batch_results = []
+    
+    # Valores de cada CPU ao longo do lote: cpu_id -> [(índice da amostra, valor)]
+    cpu_columns = {}
+    sample_timestamps = [_parse_timestamp(input.get('timestamp')) for input in inputs]
+    
+    for index, input in enumerate(inputs):
+        results = {
+            'percent-network-egress': _percent_network_egress(input),
+            'percent-memory-cache': _percent_memory_cache(input),
+        }
+        
+        num_cpus = 0
+        for key, value in input.items():
+            if key.startswith('cpu_percent-'):
+                cpu_columns.setdefault(key[len('cpu_percent-'):], []).append((index, value))
+                num_cpus += 1
+        
+        # Marcar a quantidade de CPUs; as médias são preenchidas abaixo
+        results['num_cpus_monitored'] = num_cpus
+        batch_results.append(results)
+    
+    # Atualizar a janela de cada CPU com todos os valores do lote de uma vez
+    cpu_histories = _cpu_history_state(context)
+    
+    for cpu_id, column in cpu_columns.items():
+        window = _cpu_window(cpu_histories, cpu_id)
+        
+        for index, value in column:
+            window.push(value, sample_timestamps[index])
+            _add_cpu_averages(batch_results[index], cpu_id, window)
+    
+    # Mesma ordem de chaves do handler (timestamp e contagem ao final)
+    for input, results in zip(inputs, batch_results):
+        num_cpus = results.pop('num_cpus_monitored')
+        results['timestamp'] = input.get('timestamp', 'unknown')
+        results['num_cpus_monitored'] = num_cpus
+    
+    return batch_results
+
+
+class _HostContext:
+    """Contexto mínimo por host usado por handler_hosts no modo 'time'."""
+    
+    def __init__(self):
+        self.env = {}
+
+
+def handler_hosts(inputs: Dict[str, dict], context: object) -> Dict[str, Dict[str, Any]]:
+    """
+    Processa as amostras de vários hosts de uma vez (caminho vetorizado).
+    
+    O resultado de cada host é idêntico ao de chamar handler() com a amostra
+    desse host e um contexto próprio. As CPUs viram uma matriz (hosts x cores)
+    e egress, cache e todas as médias móveis são calculados com NumPy.
+    
+    Pode ser usado diretamente como HANDLER_FUNCTION se a chave de entrada
+    contiver {"timestamp": ..., "<host>": {<métricas do host>}, ...}; valores
+    que não são dicionários (como o timestamp) são ignorados.
+    
+    No modo CPU_WINDOW_MODE=time cada host é processado com handler() e um
+    contexto próprio (as janelas de tempo não são vetorizadas).
+    
+    Args:
+        inputs: Dicionário host -> métricas coletadas desse host
+        context: Objeto de contexto contendo informações de ambiente e estado persistente
+        
+    Returns:
+        Dicionário host -> métricas calculadas
+    """
+    
+    hosts = [host for host, payload in inputs.items() if isinstance(payload, dict)]
+    payloads = [inputs[host] for host in hosts]
+    
+    if not hosts:
+        return {}
+    
+    if not hasattr(context, 'env'):
+        context.env = {}
+    
+    if CPU_WINDOW_MODE == 'time':
+        host_contexts = context.env.setdefault('fleet_host_contexts', {})
+        outputs = {}
+        for host, payload in zip(hosts, payloads):
+            host_context = host_contexts.setdefault(host, _HostContext())
+            outputs[host] = handler(payload, host_context)
+        return outputs
+    
+    if np is None:
+        raise ImportError("handler_hosts requer NumPy (pip install numpy)")
+    
+    # ========================================================================
+    # 1 e 2. EGRESS DE REDE E MEMÓRIA EM CACHE (vetorizado por host)
+    # ========================================================================
+    def column(key, default):
+        return np.array([payload.get(key, default) for payload in payloads], dtype=np.float64)
+    
+    bytes_sent = column('net_io_counters_eth0-bytes_sent1', 0)
+    total_bytes = bytes_sent + column('net_io_counters_eth0-bytes_recv1', 0)
+    safe_total = np.where(total_bytes > 0, total_bytes, 1.0)
+    percent_egress = np.where(total_bytes > 0, (bytes_sent / safe_total) * 100.0, 0.0)
+    
+    memory_cache_total = column('virtual_memory-cached', 0) + column('virtual_memory-buffers', 0)
+    percent_memory_cache = (memory_cache_total / column('virtual_memory-total', 1)) * 100.0
+    
+    # ========================================================================
+    # 3. MÉDIAS MÓVEIS DE CPU (matriz hosts x cores)
+    # ========================================================================
+    fleet = _adopt(context.env.get('fleet_cpu_history'), FleetWindows)
+    context.env['fleet_cpu_history'] = fleet
+    if not isinstance(fleet, FleetWindows) or fleet.sizes != _window_sizes():
+        fleet = context.env['fleet_cpu_history'] = FleetWindows(_window_sizes())
+    
+    # CPUs de cada host, na ordem do input (mesma ordem de chaves do handler)
+    host_cpus = [
+        [(key.replace('cpu_percent-', ''), payload.get(key, 0.0))
+         for key in payload.keys() if key.startswith('cpu_percent-')]
+        for payload in payloads
+    ]
+    cpu_ids = list(dict.fromkeys(cpu_id for cpus in host_cpus for cpu_id, _ in cpus))
+    rows, cols = fleet.index(hosts, cpu_ids)
+    
+    values = np.zeros(fleet.pos.shape)
+    mask = np.zeros(fleet.pos.shape, dtype=bool)
+    for row, cpus in zip(rows, host_cpus):
+        for cpu_id, cpu_value in cpus:
+            col = fleet.cores[cpu_id]
+            values[row, col] = cpu_value
+            mask[row, col] = True
+    
+    fleet.push(values, mask)
+    means = fleet.means(digits=2)
+    
+    # ========================================================================
+    # MONTAR RESULTADOS (mesma ordem de chaves e arredondamento do handler)
+    # ========================================================================
+    outputs = {}
+    for index, (host, payload, row, cpus) in enumerate(zip(hosts, payloads, rows, host_cpus)):
+        results = {
+            'percent-network-egress': round(float(percent_egress[index]), 2),
+            'percent-memory-cache': round(float(percent_memory_cache[index]), 2),
+        }
+        
+        for cpu_id, _ in cpus:
+            col = fleet.cores[cpu_id]
+            for window_index, seconds in enumerate(AVG_WINDOWS):
+                results[f'avg-util-cpu{cpu_id}-{seconds}sec'] = round(float(means[window_index, row, col]), 2)
+        
+        results['timestamp'] = payload.get('timestamp', 'unknown')
+        results['num_cpus_monitored'] = len(cpus)
+        outputs[host] = results
+    
+    return outputs
+
+
 # Função auxiliar para testar localmente (opcional)
 def _test_handler():
     """
@@ -0,0 +1,250 @@
+"""
+Testes do handler de métricas (Task 1).
+
+Uso (a partir de task1/):
+
+    pip install pytest numpy
+    python -m pytest -q test_handler_module.py
+"""
+
+import random
+import unittest
+from unittest import mock
+
+import handler_module
+
+
+class Context:
+    """Contexto mínimo, como o do runtime: estado persistente em env."""
+
+    def __init__(self):
+        self.env = {}
+
+
+def _samples(count: int, cpus: int = 4, seed: int = 1) -> list:
+    """Amostras no formato do coletor, a cada 5s, com CPU em uma casa decimal."""
+    rng = random.Random(seed)
+    samples = []
+    for index in range(count):
+        sample = {
+            'timestamp': f'2025-01-01 {index // 720:02d}:{index // 12 % 60:02d}:{index % 12 * 5:02d}',
+            'net_io_counters_eth0-bytes_sent1': rng.randint(0, 5000),
+            'net_io_counters_eth0-bytes_recv1': rng.randint(0, 5000),
+            'virtual_memory-total': 8 * 1024 ** 3,
+            'virtual_memory-cached': rng.randint(0, 1024 ** 3),
+            'virtual_memory-buffers': rng.randint(0, 1024 ** 2),
+        }
+        for cpu in range(cpus):
+            sample[f'cpu_percent-{cpu}'] = round(rng.uniform(0, 100), 1)
+        samples.append(sample)
+    return samples
+
+
+def _reference_averages(history: list, sizes: list) -> list:
+    """Média de cada janela como no handler original: sum(janela) / len(janela)."""
+    return [round(sum(history[-size:]) / len(history[-size:]), 2) for size in sizes]
+
+
+class RollingWindowTest(unittest.TestCase):
+    """Somas acumuladas do buffer circular (CPU_WINDOW_MODE=samples)."""
+
+    def test_rounded_means_match_sum_over_window(self):
+        rng = random.Random(7)
+        window = handler_module.RollingWindow([12, 60])
+        history = []
+
+        # Várias voltas do buffer, incluindo os recálculos das somas
+        for _ in range(3000):
+            value = round(rng.uniform(0, 100), 1)
+            window.push(value)
+            history.append(value)
+            means = [round(window.mean(index, 2), 2) for index in range(2)]
+            self.assertEqual(means, _reference_averages(history, [12, 60]))
+
+        self.assertEqual(window.tolist(), history[-60:])
+
+    def test_partial_window_uses_available_samples(self):
+        window = handler_module.RollingWindow([12])
+        for value in (10.0, 20.0, 60.0):
+            window.push(value)
+        self.assertEqual(window.mean(), 30.0)
+
+
+class HandlerMatchesOriginalTest(unittest.TestCase):
+    """Médias de CPU do handler idênticas às do handler original (listas)."""
+
+    def _assert_matches_reference(self, samples: list, sizes: list):
+        context = Context()
+        histories = {}
+
+        for sample in samples:
+            results = handler_module.handler(sample, context)
+            for key, value in sample.items():
+                if not key.startswith('cpu_percent-'):
+                    continue
+                cpu_id = key[len('cpu_percent-'):]
+                history = histories.setdefault(cpu_id, [])
+                history.append(value)
+                averages = [results[f'avg-util-cpu{cpu_id}-{seconds}sec']
+                            for seconds in handler_module.AVG_WINDOWS]
+                self.assertEqual(averages, _reference_averages(history, sizes))
+
+    def test_default_60s_window(self):
+        with mock.patch.object(handler_module, 'AVG_WINDOWS', [60]):
+            self._assert_matches_reference(_samples(500), [12])
+
+    def test_several_windows(self):
+        with mock.patch.object(handler_module, 'AVG_WINDOWS', [60, 300, 900]):
+            self._assert_matches_reference(_samples(400, cpus=2), [12, 60, 180])
+
+    def test_legacy_list_history_is_kept(self):
+        samples = _samples(30, cpus=1)
+        context = Context()
+        # Estado salvo pelo handler original: lista com os últimos 12 valores
+        context.env['cpu_history'] = {'0': [sample['cpu_percent-0'] for sample in samples[:20]][-12:]}
+
+        history = [sample['cpu_percent-0'] for sample in samples[:20]]
+        with mock.patch.object(handler_module, 'AVG_WINDOWS', [60]):
+            for sample in samples[20:]:
+                history.append(sample['cpu_percent-0'])
+                results = handler_module.handler(sample, context)
+                self.assertEqual(results['avg-util-cpu0-60sec'], _reference_averages(history, [12])[0])
+
+
+class TimeWindowTest(unittest.TestCase):
+    """Janelas por tempo (CPU_WINDOW_MODE=time), ponderadas pelo intervalo."""
+
+    def test_regular_samples_match_samples_mode(self):
+        # Valores inteiros: médias de 12 ou 60 amostras nunca caem em empate de x.xx5
+        rng = random.Random(3)
+        window = handler_module.TimeWindow([60, 300])
+        history = []
+
+        for index in range(500):
+            value = float(rng.randint(0, 100))
+            window.push(value, 1_000_000.0 + 5 * index)
+            history.append(value)
+            means = [round(window.mean(i), 2) for i in range(2)]
+            self.assertEqual(means, _reference_averages(history, [12, 60]))
+
+    def test_irregular_intervals_are_time_weighted(self):
+        window = handler_module.TimeWindow([60])
+        window.push(10.0, 100.0)   # vale por SAMPLE_PERIOD (5s)
+        window.push(30.0, 110.0)   # vale por 10s
+        self.assertAlmostEqual(window.mean(), (10 * 5 + 30 * 10) / 15)
+
+        # Segmento que cruza o início da janela entra só com a parte de dentro
+        window.push(70.0, 160.0)
+        self.assertAlmostEqual(window.mean(), (30 * 10 + 70 * 50) / 60)
+
+        # Lacuna maior que a janela: só a última amostra conta
+        window.push(20.0, 400.0)
+        self.assertAlmostEqual(window.mean(), 20.0)
+
+    def test_out_of_order_and_repeated_samples_are_ignored(self):
+        window = handler_module.TimeWindow([60])
+        window.push(10.0, 100.0)
+        window.push(50.0, 105.0)
+        window.push(90.0, 105.0)
+        window.push(90.0, 95.0)
+        self.assertAlmostEqual(window.mean(), 30.0)
+
+    def test_handler_in_time_mode(self):
+        samples = _samples(100, cpus=2)
+        for sample in samples:
+            for key in ('cpu_percent-0', 'cpu_percent-1'):
+                sample[key] = float(round(sample[key]))
+        time_context, samples_context = Context(), Context()
+
+        with mock.patch.object(handler_module, 'CPU_WINDOW_MODE', 'time'):
+            results = [handler_module.handler(sample, time_context) for sample in samples]
+            hosts = handler_module.handler_hosts({'a': samples[-1]}, Context())
+        expected = [handler_module.handler(sample, samples_context) for sample in samples]
+
+        self.assertEqual(results, expected)
+        self.assertIsInstance(time_context.env['cpu_history']['0'], handler_module.TimeWindow)
+        self.assertEqual(hosts['a'], handler_module.handler(samples[-1], Context()))
+
+
+@unittest.skipIf(handler_module.np is None, "requer NumPy")
+class HandlerHostsTest(unittest.TestCase):
+    """handler_hosts: cada host igual a handler() com um contexto próprio."""
+
+    def _assert_matches_handler(self, rounds: list):
+        fleet_context = Context()
+        host_contexts = {}
+
+        for payloads in rounds:
+            outputs = handler_module.handler_hosts(dict(payloads, timestamp='ignorado'), fleet_context)
+            self.assertEqual(set(outputs), set(payloads))
+            for host, payload in payloads.items():
+                expected = handler_module.handler(payload, host_contexts.setdefault(host, Context()))
+                self.assertEqual(outputs[host], expected)
+                self.assertEqual(list(outputs[host]), list(expected))
+
+    def test_matches_per_host_handler(self):
+        hosts = {host: _samples(300, seed=seed) for seed, host in enumerate(('a', 'b', 'c'))}
+        rounds = [{host: samples[index] for host, samples in hosts.items()} for index in range(300)]
+
+        with mock.patch.object(handler_module, 'AVG_WINDOWS', [60, 300]):
+            self._assert_matches_handler(rounds)
+
+    def test_hosts_and_cpus_joining_later(self):
+        first, second = _samples(50, cpus=2, seed=1), _samples(50, cpus=4, seed=2)
+        rounds = [{'a': first[index]} if index < 20 else {'a': first[index], 'b': second[index]}
+                  for index in range(50)]
+        for payloads in rounds[30:]:
+            payloads['a']['cpu_percent-7'] = 50.0
+
+        self._assert_matches_handler(rounds)
+
+    def test_zero_traffic_and_empty_input(self):
+        payload = dict(_samples(1)[0])
+        payload['net_io_counters_eth0-bytes_sent1'] = payload['net_io_counters_eth0-bytes_recv1'] = 0
+
+        outputs = handler_module.handler_hosts({'a': payload}, Context())
+        self.assertEqual(outputs['a']['percent-network-egress'], 0.0)
+        self.assertEqual(handler_module.handler_hosts({'timestamp': 'x'}, Context()), {})
+
+
+class HandlerBatchTest(unittest.TestCase):
+    """handler_batch equivale a chamar handler() amostra a amostra."""
+
+    def test_batch_matches_sequential_handler(self):
+        samples = _samples(100)
+        sequential, batched = Context(), Context()
+
+        expected = [handler_module.handler(sample, sequential) for sample in samples]
+        results = []
+        for start in range(0, len(samples), 30):
+            results.extend(handler_module.handler_batch(samples[start:start + 30], batched))
+
+        self.assertEqual(results, expected)
+        # Mesma ordem de chaves (o JSON publicado é idêntico)
+        self.assertEqual([list(r) for r in results], [list(r) for r in expected])
+
+    def test_batch_continues_the_state_left_by_handler(self):
+        samples = _samples(40)
+        sequential, mixed = Context(), Context()
+
+        expected = [handler_module.handler(sample, sequential) for sample in samples]
+        results = [handler_module.handler(sample, mixed) for sample in samples[:15]]
+        results.extend(handler_module.handler_batch(samples[15:], mixed))
+
+        self.assertEqual(results, expected)
+
+    def test_cpus_missing_from_some_samples(self):
+        samples = _samples(20)
+        for sample in samples[5:10]:
+            del sample['cpu_percent-3']
+        sequential, batched = Context(), Context()
+
+        expected = [handler_module.handler(sample, sequential) for sample in samples]
+        self.assertEqual(handler_module.handler_batch(samples, batched), expected)
+
+    def test_empty_batch(self):
+        self.assertEqual(handler_module.handler_batch([], Context()), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,11 +7,20 @@ import streamlit as st
 import redis
 import json
 import time
+import zlib
+import threading
+from collections import namedtuple
+import numpy as np
 import pandas as pd
-from datetime import datetime
+from datetime import datetime, timezone
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
 # Configuração da página
 st.set_page_config(
     page_title="TP3 - Monitor de Recursos",
@@ -25,47 +34,797 @@ import os
 REDIS_HOST = os.getenv('REDIS_HOST', '192.168.121.171')
 REDIS_PORT = int(os.getenv('REDIS_PORT', 6379))
 REDIS_OUTPUT_KEY = os.getenv('REDIS_OUTPUT_KEY', '2025720437-proj3-output')
+REDIS_INPUT_KEY = os.getenv('REDIS_INPUT_KEY', 'metrics')
 REFRESH_INTERVAL = int(os.getenv('REFRESH_INTERVAL', 5))  # segundos
 
+# Pool de conexões limitado e timeouts de leitura: um Redis lento vira
+# indicador de dados desatualizados, sem travar o dashboard
+REDIS_MAX_CONNECTIONS = int(os.getenv('REDIS_MAX_CONNECTIONS', 4))
+REDIS_SOCKET_TIMEOUT = float(os.getenv('REDIS_SOCKET_TIMEOUT', 2))  # segundos
+# Dados sem atualização há mais que isso são marcados como desatualizados
+STALE_AFTER = float(os.getenv('STALE_AFTER', 3 * REFRESH_INTERVAL))
+
+# Série temporal dos resultados gravada pelo runtime (task3, OUTPUT_HISTORY):
+# Redis Stream ou sorted set, consultado por intervalo e agregado no servidor
+REDIS_HISTORY_KEY = os.getenv('REDIS_HISTORY_KEY', f"{REDIS_OUTPUT_KEY}:history")
+HISTORY_POINTS = int(os.getenv('HISTORY_POINTS', 240))  # buckets por gráfico
+# Entradas que uma chamada do script agrega (o Redis não atende outros
+# clientes durante o script); intervalos maiores são lidos em várias chamadas
+HISTORY_SCAN_LIMIT = int(os.getenv('HISTORY_SCAN_LIMIT', 1000))
+HISTORY_RANGES = {'5 min': 300, '1 h': 3600, '6 h': 6 * 3600, '24 h': 24 * 3600}
+
+# Histórico em memória (colunar, NumPy): amostras mantidas (padrão: 24h a
+# cada 5s), largura do gráfico em pixels e downsampling ('minmax' ou 'lttb')
+HISTORY_CAPACITY = int(os.getenv('HISTORY_CAPACITY', 17280))
+HISTORY_WIDTH_PX = int(os.getenv('HISTORY_WIDTH_PX', 1200))
+HISTORY_DOWNSAMPLE = os.getenv('HISTORY_DOWNSAMPLE', 'minmax').lower()
+
 
 @st.cache_resource
 def get_redis_connection():
-    """Cria e retorna conexão com Redis."""
-    try:
-        r = redis.Redis(
-            host=REDIS_HOST,
-            port=REDIS_PORT,
-            decode_responses=True,
-            socket_connect_timeout=5
+    """
+    Cria o cliente Redis (respostas em bytes) sobre um pool limitado, com
+    timeouts de conexão e de leitura. A conexão é aberta sob demanda: se o
+    Redis estiver fora, o erro aparece nas leituras do fetcher.
+    """
+    pool = redis.BlockingConnectionPool(
+        host=REDIS_HOST,
+        port=REDIS_PORT,
+        max_connections=REDIS_MAX_CONNECTIONS,
+        timeout=REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=REDIS_SOCKET_TIMEOUT,
+        socket_timeout=REDIS_SOCKET_TIMEOUT,
+        health_check_interval=30
+    )
+    return redis.Redis(connection_pool=pool)
+
+
+# Agrega no servidor as entradas da série em um intervalo: por bucket de
+# ARGV[4] ms (a partir de ARGV[6]), soma/contagem/min/max de cada
+# avg-util-cpu<id>-60sec. Só os buckets (e não as entradas) trafegam.
+#
+# Cada chamada lê no máximo ARGV[5] entradas a partir do cursor ARGV[2] e
+# devolve o cursor seguinte ('' no fim): o custo de uma chamada não cresce
+# com o intervalo, e o dashboard soma os buckets das várias chamadas.
+# Entradas que o Lua não decodifica (zlib) são contadas em undecoded, e o
+# dashboard agrega no cliente.
+HISTORY_SCRIPT = """
+local kind = ARGV[1]
+local end_ms, bucket_ms = tonumber(ARGV[3]), tonumber(ARGV[4])
+local limit, start_ms = tonumber(ARGV[5]), tonumber(ARGV[6])
+
+local items = {}
+local cursor = ''
+if kind == 'stream' then
+    local entries = redis.call('XRANGE', KEYS[1], ARGV[2], ARGV[3], 'COUNT', limit)
+    for _, entry in ipairs(entries) do
+        local data, enc = nil, 'json'
+        local fields = entry[2]
+        for i = 1, #fields, 2 do
+            if fields[i] == 'data' then data = fields[i + 1] end
+            if fields[i] == 'enc' then enc = fields[i + 1] end
+        end
+        items[#items + 1] = {tonumber(string.match(entry[1], '^(%d+)')), data, enc}
+    end
+    if #entries == limit then
+        local ms, seq = string.match(entries[#entries][1], '^(%d+)-(%d+)$')
+        cursor = ms .. '-' .. string.format('%d', tonumber(seq) + 1)
+    end
+else
+    local members = redis.call('ZRANGEBYSCORE', KEYS[1], ARGV[2], end_ms / 1000,
+                               'WITHSCORES', 'LIMIT', 0, limit)
+    for i = 1, #members, 2 do
+        local member = members[i]
+        local sep = string.find(member, '|', 1, true)
+        local score = tonumber(string.match(member, '^([%d%.]+)'))
+        if sep and score then
+            items[#items + 1] = {math.floor(score * 1000), string.sub(member, sep + 1), 'json'}
+        end
+    end
+    if #members == 2 * limit then
+        cursor = '(' .. members[#members]
+    end
+end
+
+local order, seen, buckets, bucket_order = {}, {}, {}, {}
+local undecoded = 0
+for _, item in ipairs(items) do
+    local ts, data, enc = item[1], item[2], item[3]
+    local ok, result = false, nil
+    if data and enc == 'json' and string.sub(data, 1, 1) == '{' then
+        ok, result = pcall(cjson.decode, data)
+    elseif data and enc == 'msgpack' then
+        ok, result = pcall(function() return cmsgpack.unpack(data) end)
+    end
+    
+    if ok and type(result) == 'table' then
+        local index = math.floor((ts - start_ms) / bucket_ms)
+        local bucket = buckets[index]
+        if not bucket then
+            bucket = {}
+            buckets[index] = bucket
+            bucket_order[#bucket_order + 1] = index
+        end
+        for key, value in pairs(result) do
+            local cpu = string.match(key, '^avg%-util%-cpu(%d+)%-60sec$')
+            if cpu and type(value) == 'number' then
+                if not seen[cpu] then
+                    seen[cpu] = true
+                    order[#order + 1] = cpu
+                end
+                local stats = bucket[cpu]
+                if stats then
+                    stats[1] = stats[1] + value
+                    stats[2] = stats[2] + 1
+                    stats[3] = math.min(stats[3], value)
+                    stats[4] = math.max(stats[4], value)
+                else
+                    bucket[cpu] = {value, 1, value, value}
+                end
+            end
+        end
+    else
+        undecoded = undecoded + 1
+    end
+end
+
+local reply = {}
+for _, index in ipairs(bucket_order) do
+    local bucket = buckets[index]
+    local total, count, low, high = {}, {}, {}, {}
+    for i, cpu in ipairs(order) do
+        local stats = bucket[cpu]
+        total[i] = stats and string.format('%.17g', stats[1]) or ''
+        count[i] = stats and stats[2] or 0
+        low[i] = stats and string.format('%.17g', stats[3]) or ''
+        high[i] = stats and string.format('%.17g', stats[4]) or ''
+    end
+    reply[#reply + 1] = {index, total, count, low, high}
+end
+return {order, reply, #items, undecoded, cursor}
+"""
+
+# Histórico de CPU para o gráfico: por CPU, (x, média, mínimo, máximo). Da
+# série agregada, x é o início de cada bucket (compartilhado entre as CPUs);
+# do HistoryStore, x e y são views dos arrays (mínimo/máximo = None) e
+# bucket_seconds é None
+CpuHistory = namedtuple('CpuHistory', ['timestamps', 'cpus', 'bucket_seconds', 'entries'])
+
+
+def decode_history_payload(data, enc=b'json'):
+    """
+    Decodifica um payload do runtime (json, zlib ou msgpack): entradas da
+    série e também as chaves de saída/entrada, gravadas com OUTPUT_CODEC.
+    """
+    enc = enc.decode() if isinstance(enc, bytes) else enc
+    if enc == 'zlib' or data[:1] == b'\x78':
+        return json.loads(zlib.decompress(data))
+    if enc == 'msgpack' or data[:1] not in (b'{', b'['):
+        if msgpack is None:
+            raise ValueError("entrada msgpack requer o pacote msgpack")
+        return msgpack.unpackb(data, raw=False)
+    return json.loads(data)
+
+
+def _merge_stats(bucket, cpu_id, total, count, low, high):
+    """Soma as estatísticas (soma, contagem, min, max) de uma CPU no bucket."""
+    stats = bucket.get(cpu_id)
+    if stats:
+        stats[0] += total
+        stats[1] += count
+        stats[2] = min(stats[2], low)
+        stats[3] = max(stats[3], high)
+    else:
+        bucket[cpu_id] = [total, count, low, high]
+
+
+def build_history(buckets, start_ms, bucket_ms, entries):
+    """
+    Monta o CpuHistory a partir dos buckets agregados.
+    
+    Args:
+        buckets: {índice do bucket: {cpu_id: [soma, contagem, min, max]}}
+        start_ms: Início do intervalo (bucket 0)
+        bucket_ms: Largura de cada bucket
+        entries: Entradas da série agregadas
+    """
+    cpu_ids = sorted({cpu_id for bucket in buckets.values() for cpu_id in bucket}, key=cpu_sort_key)
+    indexes = sorted(buckets)
+    timestamps = [datetime.fromtimestamp((start_ms + index * bucket_ms) / 1000) for index in indexes]
+    cpus = {}
+    for cpu_id in cpu_ids:
+        stats = [buckets[index].get(cpu_id) for index in indexes]
+        cpus[cpu_id] = (
+            timestamps,
+            [s[0] / s[1] if s else None for s in stats],
+            [s[2] if s else None for s in stats],
+            [s[3] if s else None for s in stats],
         )
-        r.ping()
-        return r
-    except Exception as e:
-        st.error(f"❌ Erro ao conectar ao Redis: {e}")
-        return None
+    return CpuHistory(timestamps, cpus, bucket_ms / 1000, entries)
 
 
-def fetch_metrics(redis_conn):
-    """Busca métricas do Redis."""
-    try:
-        data = redis_conn.get(REDIS_OUTPUT_KEY)
-        if data:
-            return json.loads(data)
-        return None
-    except Exception as e:
-        st.error(f"❌ Erro ao buscar métricas: {e}")
-        return None
+def downsample_history(items, start_ms, bucket_ms):
+    """
+    Agregação no cliente, equivalente ao HISTORY_SCRIPT.
+    
+    Args:
+        items: Lista de (timestamp em ms, resultado decodificado), em ordem
+        start_ms: Início do intervalo
+        bucket_ms: Largura de cada bucket
+    """
+    buckets = {}
+    for ts, result in items:
+        bucket = buckets.setdefault((ts - start_ms) // bucket_ms, {})
+        for key, value in result.items():
+            if key.startswith('avg-util-cpu') and key.endswith('-60sec') and isinstance(value, (int, float)):
+                cpu_id = key[len('avg-util-cpu'):-len('-60sec')]
+                _merge_stats(bucket, cpu_id, value, 1, value, value)
+    return build_history(buckets, start_ms, bucket_ms, len(items))
 
 
-def fetch_raw_metrics(redis_conn):
-    """Busca métricas brutas (input) do Redis."""
-    try:
-        data = redis_conn.get('metrics')
-        if data:
-            return json.loads(data)
-        return None
-    except Exception as e:
-        return None
+def merge_history_reply(reply, buckets):
+    """
+    Soma uma resposta (parcial) do HISTORY_SCRIPT aos buckets.
+    
+    Returns:
+        (entradas lidas, entradas não decodificadas, próximo cursor ou None)
+    """
+    cpu_ids, replies, entries, undecoded, cursor = reply
+    cpu_ids = [cpu_id.decode() for cpu_id in cpu_ids]
+    for index, totals, counts, lows, highs in replies:
+        bucket = buckets.setdefault(int(index), {})
+        for i, cpu_id in enumerate(cpu_ids):
+            if counts[i]:
+                _merge_stats(bucket, cpu_id, float(totals[i]), int(counts[i]), float(lows[i]), float(highs[i]))
+    return entries, undecoded, cursor.decode() if cursor else None
+
+
+class HistoryReader:
+    """
+    Consulta a série temporal de resultados (stream ou sorted set) por
+    intervalo, com downsampling no servidor (HISTORY_SCRIPT): um gráfico de
+    24h recebe HISTORY_POINTS buckets, não milhares de entradas. Cada
+    chamada do script (e cada página da leitura no cliente) cobre no máximo
+    scan_limit entradas.
+    """
+    
+    def __init__(self, redis_conn, key=REDIS_HISTORY_KEY, points=HISTORY_POINTS,
+                 scan_limit=HISTORY_SCAN_LIMIT):
+        self.redis_conn = redis_conn
+        self.key = key
+        self.points = points
+        self.scan_limit = max(1, scan_limit)
+        self.script = redis_conn.register_script(HISTORY_SCRIPT)
+        self.server_side = True
+    
+    def kind(self):
+        """Tipo da série: 'stream', 'zset' ou None (inexistente)."""
+        kind = self.redis_conn.type(self.key)
+        kind = kind.decode() if isinstance(kind, bytes) else kind
+        return kind if kind in ('stream', 'zset') else None
+    
+    def read(self, range_seconds):
+        """
+        Histórico agregado dos últimos range_seconds.
+        
+        Returns:
+            CpuHistory, ou None se a série não existe
+        """
+        kind = self.kind()
+        if kind is None:
+            return None
+        
+        # Buckets alinhados ao seu tamanho: estáveis entre consultas
+        bucket_ms = max(1, range_seconds * 1000 // self.points)
+        end_ms = int(time.time() * 1000) + 1
+        start_ms = (end_ms - range_seconds * 1000) // bucket_ms * bucket_ms
+        
+        if self.server_side:
+            try:
+                history = self._read_aggregated(kind, start_ms, end_ms, bucket_ms)
+                if history is not None:
+                    return history
+            except redis.exceptions.ResponseError:
+                # Redis sem Lua/cjson: agregação no cliente daqui em diante
+                self.server_side = False
+        
+        return downsample_history(self._read_entries(kind, start_ms, end_ms), start_ms, bucket_ms)
+    
+    def _read_aggregated(self, kind, start_ms, end_ms, bucket_ms):
+        """
+        Agrega no servidor, em chamadas de até scan_limit entradas.
+        
+        Returns:
+            CpuHistory, ou None se alguma entrada não foi decodificada no Lua
+        """
+        buckets = {}
+        total = 0
+        cursor = start_ms if kind == 'stream' else start_ms / 1000
+        while cursor is not None:
+            reply = self.script(keys=[self.key],
+                                args=[kind, cursor, end_ms, bucket_ms, self.scan_limit, start_ms])
+            entries, undecoded, cursor = merge_history_reply(reply, buckets)
+            if undecoded:
+                return None
+            total += entries
+        return build_history(buckets, start_ms, bucket_ms, total)
+    
+    def read_latest(self, count):
+        """
+        Últimas count entradas da série, decodificadas (em ordem cronológica).
+        
+        Returns:
+            Lista de (timestamp em ms, resultado)
+        """
+        kind = self.kind()
+        if kind == 'stream':
+            return self._decode_stream(reversed(self.redis_conn.xrevrange(self.key, count=count)))
+        if kind == 'zset':
+            return self._decode_zset(reversed(self.redis_conn.zrevrange(self.key, 0, count - 1)))
+        return []
+    
+    def _read_entries(self, kind, start_ms, end_ms):
+        """Lê e decodifica as entradas do intervalo, em páginas de scan_limit."""
+        items = []
+        if kind == 'stream':
+            start = start_ms
+            while True:
+                page = self.redis_conn.xrange(self.key, start, end_ms, count=self.scan_limit)
+                items.extend(self._decode_stream(page))
+                if len(page) < self.scan_limit:
+                    return items
+                # Id seguinte ao último lido (o '(' exclusivo requer Redis 6.2)
+                ms, seq = page[-1][0].split(b'-')
+                start = f"{int(ms)}-{int(seq) + 1}"
+        
+        start = start_ms / 1000
+        while True:
+            page = self.redis_conn.zrangebyscore(self.key, start, end_ms / 1000, start=0,
+                                                 num=self.scan_limit, withscores=True)
+            items.extend(self._decode_zset(member for member, _ in page))
+            if len(page) < self.scan_limit:
+                return items
+            start = f"({page[-1][1]!r}"
+    
+    @staticmethod
+    def _decode_stream(entries):
+        items = []
+        for entry_id, fields in entries:
+            try:
+                result = decode_history_payload(fields[b'data'], fields.get(b'enc', b'json'))
+            except Exception:
+                continue
+            items.append((int(entry_id.split(b'-')[0]), result))
+        return items
+    
+    @staticmethod
+    def _decode_zset(members):
+        items = []
+        for member in members:
+            prefix, _, payload = member.partition(b'|')
+            try:
+                result = decode_history_payload(payload)
+            except Exception:
+                continue
+            items.append((int(float(prefix.split(b'-')[0]) * 1000), result))
+        return items
+
+
+class RedisDataSource:
+    """
+    Acesso do dashboard ao Redis: a cada ciclo, um único round-trip
+    (pipeline) traz a saída e a entrada (MGET), o tipo da série de histórico
+    e as entradas da série gravadas desde a última leitura.
+    """
+    
+    def __init__(self, redis_conn, output_key=REDIS_OUTPUT_KEY, input_key=REDIS_INPUT_KEY,
+                 history_key=REDIS_HISTORY_KEY, history_batch=HISTORY_CAPACITY):
+        self.redis_conn = redis_conn
+        self.output_key = output_key
+        self.input_key = input_key
+        self.history_key = history_key
+        self.history_batch = history_batch
+        self.history_kind = None
+        self.history_position = None
+        self.following = False
+    
+    def follow_history(self, kind, items):
+        """Passa a ler as entradas novas da série, após as já carregadas."""
+        self.following = True
+        self.history_kind = kind
+        self.history_position = (items[-1][0] if items else 0) if kind else None
+    
+    def fetch(self):
+        """
+        Lê saída, entrada e entradas novas da série em um round-trip.
+        
+        Returns:
+            (saída e entrada codificadas, lista de (timestamp em ms, resultado))
+        """
+        pipe = self.redis_conn.pipeline(transaction=False)
+        pipe.mget([self.output_key, self.input_key])
+        pipe.type(self.history_key)
+        
+        # Entradas a partir da última lida (inclusive: repetidas são
+        # descartadas pelo HistoryStore, que só aceita amostras mais novas)
+        following = self.following and self.history_position is not None
+        if following and self.history_kind == 'stream':
+            pipe.xrange(self.history_key, self.history_position, '+', count=self.history_batch)
+        elif following and self.history_kind == 'zset':
+            pipe.zrangebyscore(self.history_key, self.history_position / 1000, '+inf',
+                               start=0, num=self.history_batch)
+        replies = pipe.execute()
+        
+        (output_raw, input_raw), kind = replies[0], replies[1]
+        kind = kind.decode() if isinstance(kind, bytes) else kind
+        items = []
+        if len(replies) > 2:
+            if self.history_kind == 'stream':
+                items = HistoryReader._decode_stream(replies[2])
+            else:
+                items = HistoryReader._decode_zset(replies[2])
+        
+        if self.following and kind != (self.history_kind or 'none'):
+            # Série criada/recriada (ou removida): lida desde o início
+            self.history_kind = kind if kind in ('stream', 'zset') else None
+            self.history_position = 0 if self.history_kind else None
+        elif items:
+            self.history_position = items[-1][0]
+        return output_raw, input_raw, items
+
+
+def downsample_minmax(values, width):
+    """
+    Índices do downsampling min-max: em width/2 faixas (uma por par de
+    pixels), o ponto mínimo e o máximo de cada CPU, em ordem. Picos não
+    somem, e o custo é vetorizado.
+    
+    Args:
+        values: Array (CPUs x amostras); NaN = CPU sem valor na amostra
+        width: Pontos por CPU no gráfico
+    
+    Returns:
+        Array (CPUs x pontos) de índices em values
+    """
+    cpus, n = values.shape
+    buckets = max(1, width // 2)
+    size = -(-n // buckets)
+    pad = buckets * size - n  # NaN antes da amostra mais antiga, para faixas iguais
+    
+    if pad:
+        values = np.concatenate([np.full((cpus, pad), np.nan, dtype=values.dtype), values], axis=1)
+    block = values.reshape(cpus, buckets, size)
+    missing = np.isnan(block)
+    low = np.where(missing, np.inf, block).argmin(axis=2)
+    high = np.where(missing, -np.inf, block).argmax(axis=2)
+    indices = np.sort(np.stack([low, high], axis=2), axis=2)
+    indices += (np.arange(buckets) * size - pad)[None, :, None]
+    return np.clip(indices, 0, n - 1).reshape(cpus, -1)
+
+
+def downsample_lttb(values, width):
+    """
+    Índices do Largest-Triangle-Three-Buckets: em cada bucket, o ponto que
+    forma o maior triângulo com o ponto escolhido no bucket anterior e a
+    média do seguinte. Preserva a forma da curva com width pontos; o laço é
+    por bucket, vetorizado entre as CPUs.
+    
+    Args:
+        values: Array (CPUs x amostras); NaN = CPU sem valor na amostra
+        width: Pontos por CPU no gráfico (>= 3)
+    
+    Returns:
+        Array (CPUs x width) de índices em values
+    """
+    cpus, n = values.shape
+    y = np.nan_to_num(values, nan=0.0)
+    edges = np.linspace(1, n - 1, width - 1).astype(np.int64)
+    rows = np.arange(cpus)
+    
+    indices = np.empty((cpus, width), dtype=np.int64)
+    indices[:, 0] = 0
+    indices[:, -1] = n - 1
+    selected = np.zeros(cpus, dtype=np.int64)
+    
+    for bucket in range(width - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else n
+        
+        # Média do bucket seguinte (x = índice da amostra)
+        avg_x = (end + next_end - 1) / 2
+        avg_y = y[:, end:next_end].mean(axis=1)
+        
+        ax = selected.astype(np.float64)
+        ay = y[rows, selected]
+        bx = np.arange(start, end, dtype=np.float64)
+        area = np.abs((ax[:, None] - avg_x) * (y[:, start:end] - ay[:, None])
+                      - (ax[:, None] - bx[None, :]) * (avg_y - ay)[:, None])
+        selected = start + area.argmax(axis=1)
+        indices[:, bucket + 1] = selected
+    
+    return indices
+
+
+DOWNSAMPLERS = {'minmax': downsample_minmax, 'lttb': downsample_lttb}
+
+
+class HistoryStore:
+    """
+    Histórico em memória, colunar: um array NumPy pré-alocado de timestamps
+    (datetime64) e um de valores (uma linha float32 por CPU).
+    
+    Cada amostra é gravada duas vezes no buffer circular (posições i e
+    i + capacity), então as últimas capacity amostras sempre formam um
+    trecho contíguo: window() devolve views, sem copiar nem montar
+    DataFrames, e o gráfico recebe os arrays diretamente (ou só os índices
+    escolhidos pelo downsampling, quando há mais amostras que pixels).
+    """
+    
+    def __init__(self, capacity=HISTORY_CAPACITY):
+        self.capacity = capacity
+        self.count = 0
+        self.cpu_rows = {}
+        self.timestamps = np.zeros(2 * capacity, dtype='datetime64[ms]')
+        self.values = np.full((0, 2 * capacity), np.nan, dtype=np.float32)
+    
+    def __len__(self):
+        return min(self.count, self.capacity)
+    
+    @property
+    def oldest(self):
+        """Timestamp da amostra mais antiga mantida (ou None)."""
+        timestamps, _ = self.window()
+        return timestamps[0] if len(timestamps) else None
+    
+    @property
+    def latest(self):
+        timestamps, _ = self.window()
+        return timestamps[-1] if len(timestamps) else None
+    
+    def _row(self, cpu_id):
+        row = self.cpu_rows.get(cpu_id)
+        if row is None:
+            # CPU nova: uma linha a mais (raro; o array é realocado)
+            row = len(self.cpu_rows)
+            self.cpu_rows[cpu_id] = row
+            extra = np.full((1, 2 * self.capacity), np.nan, dtype=np.float32)
+            self.values = np.concatenate([self.values, extra])
+        return row
+    
+    def append(self, timestamp, result):
+        """
+        Acrescenta uma amostra (ignorada se não for mais nova que a última).
+        
+        Args:
+            timestamp: datetime da amostra
+            result: Resultado do handler (avg-util-cpu<id>-60sec)
+        """
+        timestamp = np.datetime64(timestamp, 'ms')
+        latest = self.latest
+        if latest is not None and timestamp <= latest:
+            return
+        
+        rows = [(self._row(cpu_id), value) for cpu_id, value in extract_cpu_metrics(result).items()]
+        for position in (self.count % self.capacity, self.count % self.capacity + self.capacity):
+            self.timestamps[position] = timestamp
+            self.values[:, position] = np.nan
+            for row, value in rows:
+                self.values[row, position] = value
+        self.count += 1
+    
+    def merge(self, other):
+        """Acrescenta as amostras de outro store mais novas que a última deste."""
+        latest = self.latest
+        since = None if latest is None else latest + np.timedelta64(1, 'ms')
+        timestamps, values = other.window(since)
+        for index, timestamp in enumerate(timestamps):
+            self.append(timestamp, {
+                f'avg-util-cpu{cpu_id}-60sec': float(values[row, index])
+                for cpu_id, row in other.cpu_rows.items()
+                if not np.isnan(values[row, index])
+            })
+    
+    def window(self, since=None):
+        """
+        Views (sem cópia) dos timestamps e valores das amostras mantidas.
+        
+        Args:
+            since: Só amostras a partir deste datetime64 (opcional)
+        
+        Returns:
+            (timestamps, valores CPUs x amostras)
+        """
+        if self.count <= self.capacity:
+            start, end = 0, self.count
+        else:
+            start = self.count % self.capacity
+            end = start + self.capacity
+        
+        if since is not None:
+            start += int(np.searchsorted(self.timestamps[start:end], since))
+        return self.timestamps[start:end], self.values[:, start:end]
+    
+    def history(self, range_seconds, width=HISTORY_WIDTH_PX, method=HISTORY_DOWNSAMPLE):
+        """
+        Histórico dos últimos range_seconds, reduzido a ~width pontos por CPU.
+        
+        Returns:
+            CpuHistory (x/y são views dos arrays se cabem em width pontos)
+        """
+        since = np.datetime64(datetime.now(), 'ms') - np.timedelta64(range_seconds, 's')
+        timestamps, values = self.window(since)
+        cpu_ids = sorted(self.cpu_rows, key=cpu_sort_key)
+        
+        cpus = {}
+        if len(timestamps) <= width:
+            for cpu_id in cpu_ids:
+                cpus[cpu_id] = (timestamps, values[self.cpu_rows[cpu_id]], None, None)
+        else:
+            indices = DOWNSAMPLERS.get(method, downsample_minmax)(values, width)
+            for cpu_id in cpu_ids:
+                row = self.cpu_rows[cpu_id]
+                cpus[cpu_id] = (timestamps[indices[row]], values[row, indices[row]], None, None)
+        return CpuHistory(timestamps, cpus, None, len(timestamps))
+
+
+# Dados compartilhados entre as sessões: version cresce a cada mudança
+MetricsSnapshot = namedtuple('MetricsSnapshot', ['version', 'metrics', 'raw_metrics', 'fetched_at', 'error'])
+
+
+class MetricsFetcher:
+    """
+    Busca as métricas no Redis em uma thread única por processo e compartilha
+    o último snapshot com todas as sessões do Streamlit.
+    
+    A thread lê as chaves a cada REFRESH_INTERVAL (RedisDataSource, um
+    round-trip) e só decodifica os payloads quando o conteúdo muda; as
+    sessões aguardam um snapshot novo em wait(), sem acessar o Redis. O custo
+    no Redis não depende do número de abas abertas.
+    
+    O histórico de CPU fica em um HistoryStore, carregado da série uma vez
+    pela thread e atualizado com as entradas novas da série (ou com cada
+    resultado novo, se não há série). Intervalos mais antigos que o store
+    são consultados na série (HistoryReader).
+    """
+    
+    def __init__(self, redis_conn, interval=REFRESH_INTERVAL):
+        self.redis_conn = redis_conn
+        self.interval = interval
+        self.source = RedisDataSource(redis_conn)
+        self.condition = threading.Condition()
+        self.snapshot = MetricsSnapshot(0, None, None, None, None)
+        self._raw = (None, None)
+        self.history_reader = HistoryReader(redis_conn)
+        self.history_lock = threading.Lock()
+        self.histories = {}
+        self.store = HistoryStore()
+        self.store_complete = False
+        
+        # Primeira leitura antes de servir a primeira sessão (o histórico é
+        # carregado pela thread)
+        self.fetch()
+        self.thread = threading.Thread(target=self._run, name='metrics-fetcher', daemon=True)
+        self.thread.start()
+    
+    def fetch(self):
+        """Lê as chaves e publica um snapshot novo se algo mudou."""
+        try:
+            output_raw, input_raw, items = self.source.fetch()
+            raw = (output_raw, input_raw)
+            if items:
+                with self.history_lock:
+                    for ts, result in items:
+                        self.store.append(sample_time(result, datetime.fromtimestamp(ts / 1000)), result)
+            
+            with self.condition:
+                if raw == self._raw and self.snapshot.error is None:
+                    self.snapshot = self.snapshot._replace(fetched_at=datetime.now())
+                    return
+            
+            # Decodificar uma vez só, para todas as sessões (formato detectado
+            # pelo primeiro byte, qualquer que seja o OUTPUT_CODEC do runtime)
+            metrics = decode_history_payload(raw[0]) if raw[0] else None
+            raw_metrics = decode_history_payload(raw[1]) if raw[1] else None
+        except Exception as e:
+            # Mantém os últimos dados válidos e sinaliza o erro às sessões
+            error = f"❌ Erro ao buscar métricas: {e}"
+            with self.condition:
+                if error != self.snapshot.error:
+                    self.snapshot = self.snapshot._replace(version=self.snapshot.version + 1, error=error)
+                    self.condition.notify_all()
+            return
+        
+        fetched_at = datetime.now()
+        if metrics and raw[0] != self._raw[0]:
+            with self.history_lock:
+                self.store.append(sample_time(metrics, fetched_at), metrics)
+        
+        with self.condition:
+            self._raw = raw
+            self.snapshot = MetricsSnapshot(self.snapshot.version + 1, metrics, raw_metrics, fetched_at, None)
+            self.condition.notify_all()
+    
+    def load_history(self):
+        """
+        Carrega as últimas entradas da série em um store novo, mantendo as
+        amostras já lidas que são mais novas que a série (a primeira leitura
+        acontece antes do histórico).
+        """
+        try:
+            kind = self.history_reader.kind()
+            items = self.history_reader.read_latest(self.store.capacity) if kind else []
+        except Exception:
+            return
+        store = HistoryStore(self.store.capacity)
+        for ts, result in items:
+            store.append(sample_time(result, datetime.fromtimestamp(ts / 1000)), result)
+        with self.history_lock:
+            store.merge(self.store)
+            self.store = store
+            self.histories.clear()
+            # Série menor que o store: todo o histórico existente está em memória
+            self.store_complete = len(items) < self.store.capacity
+        self.source.follow_history(kind, items)
+    
+    def _run(self):
+        while True:
+            if not self.source.following:
+                self.load_history()
+            time.sleep(self.interval)
+            self.fetch()
+    
+    def covers(self, range_seconds):
+        """Se o store tem todo o histórico dos últimos range_seconds."""
+        oldest = self.store.oldest
+        if oldest is None:
+            return False
+        since = np.datetime64(datetime.now(), 'ms') - np.timedelta64(range_seconds, 's')
+        return self.store_complete or oldest <= since
+    
+    def history(self, range_seconds):
+        """
+        Histórico dos últimos range_seconds, montado no máximo uma vez por
+        snapshot novo e compartilhado entre as sessões: do HistoryStore
+        (downsampling para HISTORY_WIDTH_PX) ou, se o intervalo é mais antigo
+        que o store, da série agregada no servidor.
+        
+        A consulta ao Redis roda fora do history_lock, para não segurar o
+        loop do fetcher (que precisa do lock para alimentar o store).
+        """
+        with self.history_lock:
+            version = self.snapshot.version
+            cached = self.histories.get(range_seconds)
+            if cached and cached[0] == version:
+                return cached[1]
+            if self.covers(range_seconds):
+                history = self.store.history(range_seconds)
+                self.histories[range_seconds] = (version, history)
+                return history
+        
+        try:
+            history = self.history_reader.read(range_seconds)
+        except Exception:
+            # Falha na consulta: mantém o último histórico desse intervalo
+            history = cached[1] if cached else None
+        
+        with self.history_lock:
+            # Outra sessão pode ter gravado uma versão mais nova nesse meio-tempo
+            current = self.histories.get(range_seconds)
+            if not current or current[0] < version:
+                self.histories[range_seconds] = (version, history)
+        return history
+    
+    def wait(self, version, timeout):
+        """Aguarda um snapshot mais novo que version (ou o timeout) e o retorna."""
+        with self.condition:
+            self.condition.wait_for(lambda: self.snapshot.version != version, timeout=timeout)
+            return self.snapshot
+
+
+@st.cache_resource
+def get_metrics_fetcher():
+    """Fetcher compartilhado por todas as sessões (um por processo)."""
+    return MetricsFetcher(get_redis_connection())
 
 
 def create_cpu_gauge(cpu_id, value):
@@ -114,28 +873,42 @@ def create_percentage_chart(title, value, color):
     return fig
 
 
-def create_cpu_history_chart(cpu_histories):
-    """Cria gráfico de linha com histórico de todas as CPUs."""
+def create_cpu_history_chart(history, range_label="1 h"):
+    """
+    Cria gráfico de linha com histórico de todas as CPUs.
+    
+    Args:
+        history: CpuHistory (da série: média por bucket, mínimo e máximo no
+            hover; do HistoryStore: arrays já reduzidos à largura do gráfico)
+        range_label: Intervalo exibido (ex: "1 h")
+    """
     fig = go.Figure()
     
     colors = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', 
               '#8c564b', '#e377c2', '#7f7f7f', '#bcbd22', '#17becf']
+    for i, (cpu_id, (x, y, low, high)) in enumerate(history.cpus.items()):
+        band = {}
+        if low is not None:
+            band = dict(customdata=list(zip(low, high)),
+                        hovertemplate='%{y:.1f}% (mín %{customdata[0]:.1f}, máx %{customdata[1]:.1f})')
+        fig.add_trace(go.Scatter(
+            x=x,
+            y=y,
+            mode='lines+markers' if len(x) <= 60 else 'lines',
+            name=f'CPU {cpu_id}',
+            line=dict(color=colors[i % len(colors)], width=2),
+            marker=dict(size=6),
+            **band
+        ))
     
-    for i, (cpu_id, history) in enumerate(cpu_histories.items()):
-        if history:
-            x = list(range(len(history)))
-            fig.add_trace(go.Scatter(
-                x=x,
-                y=history,
-                mode='lines+markers',
-                name=f'CPU {cpu_id}',
-                line=dict(color=colors[i % len(colors)], width=2),
-                marker=dict(size=6)
-            ))
+    if history.bucket_seconds:
+        x_title = f"Horário (média a cada {history.bucket_seconds:g}s)"
+    else:
+        x_title = f"Horário ({history.entries} amostras)"
     
     fig.update_layout(
-        title="Histórico de Utilização de CPU (últimos 60 segundos)",
-        xaxis_title="Medições (5s cada)",
+        title=f"Histórico de Utilização de CPU (últimos {range_label})",
+        xaxis_title=x_title,
         yaxis_title="Utilização (%)",
         yaxis=dict(range=[0, 100]),
         height=400,
@@ -147,6 +920,273 @@ def create_cpu_history_chart(cpu_histories):
     return fig
 
 
+def cpu_sort_key(cpu_id):
+    """Ordena CPUs numericamente (cpu2 antes de cpu10)."""
+    return (0, int(cpu_id), '') if cpu_id.isdigit() else (1, 0, cpu_id)
+
+
+def sample_time(result, default):
+    """
+    Horário da amostra (campo timestamp do resultado) ou default.
+    
+    Timestamps sem fuso são UTC, como no handler da Task 1; o retorno fica no
+    horário local sem fuso, para comparar com datetime.now() e com os
+    horários da série (datetime.fromtimestamp).
+    """
+    try:
+        parsed = datetime.fromisoformat(result['timestamp'])
+    except (KeyError, TypeError, ValueError):
+        return default
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone().replace(tzinfo=None)
+
+
+def extract_cpu_metrics(metrics):
+    """Médias de CPU da janela de 60s ({id: valor}), ordenadas pelo id da CPU."""
+    # (apenas a janela de 60s; o handler pode publicar janelas maiores)
+    cpu_metrics = {
+        key[len('avg-util-cpu'):-len('-60sec')]: value
+        for key, value in metrics.items()
+        if key.startswith('avg-util-cpu') and key.endswith('-60sec')
+    }
+    return dict(sorted(cpu_metrics.items(), key=lambda item: cpu_sort_key(item[0])))
+
+
+def metrics_version(metrics, raw_metrics):
+    """Versão dos dados exibidos: timestamps da saída e da entrada."""
+    return (
+        metrics.get('timestamp') if metrics else None,
+        raw_metrics.get('timestamp') if raw_metrics else None,
+    )
+
+
+class DashboardView:
+    """
+    Layout do dashboard montado uma vez por sessão e atualizado de forma
+    incremental.
+    
+    Cada elemento fica em um placeholder (st.empty) e só é reescrito quando
+    seu valor muda. As figuras Plotly (gauges e barras) são criadas uma vez
+    como esqueleto e, a cada atualização, apenas o valor é alterado. Se os
+    timestamps da saída e da entrada não mudaram, nada é redesenhado. O
+    layout só é refeito quando o conjunto de CPUs muda.
+    """
+    
+    COLS_PER_ROW = 4
+    
+    def __init__(self, history_label="1 h"):
+        self.root = st.empty()
+        self.history_label = history_label
+        self.version = None
+        self.cpu_ids = None
+        self.values = {}
+        self.history = None
+    
+    def _build(self, cpu_ids):
+        """Monta o layout (placeholders e esqueletos das figuras)."""
+        self.cpu_ids = cpu_ids
+        self.values = {}
+        self.history = None
+        self.slots = {}
+        self.figures = {}
+        
+        with self.root.container():
+            # Status e timestamp
+            col1, col2, col3 = st.columns([2, 1, 1])
+            self.slots['timestamp'] = col1.empty()
+            self.slots['num_cpus'] = col2.empty()
+            self.slots['memory'] = col3.empty()
+            
+            st.markdown("---")
+            
+            # Seção 1: Métricas Gerais
+            st.header("📈 Métricas Gerais")
+            col1, col2 = st.columns(2)
+            self.slots['egress'] = col1.empty()
+            self.figures['egress'] = create_percentage_chart("🌐 Tráfego de Saída de Rede", 0, 'steelblue')
+            self.slots['cache'] = col2.empty()
+            self.figures['cache'] = create_percentage_chart("💾 Memória em Cache", 0, 'mediumseagreen')
+            
+            st.markdown("---")
+            
+            # Seção 2: CPUs - Médias Móveis (um gauge por CPU)
+            st.header("💻 Utilização de CPU (Média Móvel 60s)")
+            for start in range(0, len(cpu_ids), self.COLS_PER_ROW):
+                cols = st.columns(self.COLS_PER_ROW)
+                for col, cpu_id in zip(cols, cpu_ids[start:start + self.COLS_PER_ROW]):
+                    self.slots[('cpu', cpu_id)] = col.empty()
+                    self.figures[('cpu', cpu_id)] = create_cpu_gauge(cpu_id, 0)
+            
+            st.markdown("---")
+            
+            # Seção 2b: Histórico de CPU (série temporal do runtime)
+            st.header("📉 Histórico de CPU")
+            self.slots['history'] = st.empty()
+            
+            st.markdown("---")
+            
+            # Seção 3: Dados Brutos (Raw Metrics)
+            with st.expander("🔍 Ver Métricas Brutas (Dados de Entrada)", expanded=False):
+                self.slots['raw'] = st.empty()
+            
+            # Seção 4: JSON completo
+            with st.expander("📄 Ver JSON Completo (Métricas Processadas)", expanded=False):
+                self.slots['json'] = st.empty()
+    
+    def _changed(self, name, value):
+        """Registra o valor exibido em um elemento; True se mudou."""
+        if self.values.get(name, object()) == value:
+            return False
+        self.values[name] = value
+        return True
+    
+    def _patch_percentage(self, name, value):
+        if self._changed(name, round(value, 2)):
+            fig = self.figures[name]
+            fig.data[0].x = [value]
+            fig.data[0].text = [f"{value:.2f}%"]
+            self.slots[name].plotly_chart(fig, use_container_width=True)
+    
+    def _patch_gauge(self, cpu_id, value):
+        name = ('cpu', cpu_id)
+        if self._changed(name, round(value, 2)):
+            fig = self.figures[name]
+            fig.data[0].value = value
+            self.slots[name].plotly_chart(fig, use_container_width=True)
+    
+    def _render_raw(self, raw_metrics):
+        """Dados de entrada (só quando a entrada muda)."""
+        if not raw_metrics:
+            self.slots['raw'].info("Sem métricas brutas disponíveis.")
+            return
+        
+        with self.slots['raw'].container():
+            col1, col2 = st.columns(2)
+            
+            with col1:
+                st.subheader("💻 CPU")
+                cpu_data = {
+                    key: value for key, value in raw_metrics.items()
+                    if key.startswith('cpu_percent-')
+                }
+                if cpu_data:
+                    df = pd.DataFrame({
+                        'CPU': [key.replace('cpu_percent-', '') for key in cpu_data],
+                        'Utilização (%)': list(cpu_data.values()),
+                    })
+                    st.dataframe(df, hide_index=True)
+                
+                st.subheader("🌐 Rede")
+                bytes_sent = raw_metrics.get('net_io_counters_eth0-bytes_sent1', 0)
+                bytes_recv = raw_metrics.get('net_io_counters_eth0-bytes_recv1', 0)
+                st.metric("Bytes Enviados", f"{bytes_sent / (1024**2):.2f} MB")
+                st.metric("Bytes Recebidos", f"{bytes_recv / (1024**2):.2f} MB")
+            
+            with col2:
+                st.subheader("💾 Memória")
+                mem_total = raw_metrics.get('virtual_memory-total', 0)
+                mem_used = raw_metrics.get('virtual_memory-used', 0)
+                mem_cached = raw_metrics.get('virtual_memory-cached', 0)
+                mem_buffers = raw_metrics.get('virtual_memory-buffers', 0)
+                
+                st.metric("Total", f"{mem_total / (1024**3):.2f} GB")
+                st.metric("Usada", f"{mem_used / (1024**3):.2f} GB")
+                st.metric("Cache", f"{mem_cached / (1024**3):.2f} GB")
+                st.metric("Buffers", f"{mem_buffers / (1024**3):.2f} GB")
+    
+    def _render_history(self, history):
+        """Gráfico do histórico (só quando o fetcher traz uma consulta nova)."""
+        if history is self.history and history is not None:
+            return
+        self.history = history
+        
+        if history is None or not history.cpus:
+            self.slots['history'].info(f"Sem histórico em `{REDIS_HISTORY_KEY}` "
+                                       "(OUTPUT_HISTORY=stream ou zset no runtime).")
+            return
+        self.slots['history'].plotly_chart(
+            create_cpu_history_chart(history, self.history_label), use_container_width=True)
+    
+    def update(self, metrics, raw_metrics, history=None):
+        """
+        Atualiza o dashboard com os dados lidos.
+        
+        Returns:
+            True se algo foi redesenhado, False se os dados não mudaram
+        """
+        version = metrics_version(metrics, raw_metrics)
+        if version == self.version:
+            return False
+        previous_version, self.version = self.version, version
+        
+        if not metrics:
+            self.cpu_ids = None
+            with self.root.container():
+                st.warning("⚠️ Nenhuma métrica disponível ainda. Aguardando dados...")
+                st.info("Certifique-se de que a função serverless está rodando e processando métricas.")
+            return True
+        
+        cpu_metrics = extract_cpu_metrics(metrics)
+        cpu_ids = list(cpu_metrics)
+        if cpu_ids != self.cpu_ids:
+            self._build(cpu_ids)
+            previous_version = None
+        
+        # Status e timestamp
+        if self._changed('timestamp', metrics.get('timestamp', 'N/A')):
+            self.slots['timestamp'].metric("📅 Timestamp", metrics.get('timestamp', 'N/A'))
+        if self._changed('num_cpus', metrics.get('num_cpus_monitored', 0)):
+            self.slots['num_cpus'].metric("💻 CPUs Monitoradas", metrics.get('num_cpus_monitored', 0))
+        mem_percent = raw_metrics.get('virtual_memory-percent', 0) if raw_metrics else None
+        memory = f"{mem_percent:.1f}%" if mem_percent is not None else "N/A"
+        if self._changed('memory', memory):
+            self.slots['memory'].metric("💾 Memória Usada", memory)
+        
+        # Seção 1: Métricas Gerais
+        self._patch_percentage('egress', metrics.get('percent-network-egress', 0))
+        self._patch_percentage('cache', metrics.get('percent-memory-cache', 0))
+        
+        # Seção 2: só os gauges cujo valor mudou
+        for cpu_id, value in cpu_metrics.items():
+            self._patch_gauge(cpu_id, value)
+        self._render_history(history)
+        
+        # Seções 3 e 4: só quando a entrada/saída correspondente mudou
+        if previous_version is None or version[1] != previous_version[1]:
+            self._render_raw(raw_metrics)
+        if previous_version is None or version[0] != previous_version[0]:
+            self.slots['json'].json(metrics)
+        return True
+
+
+def describe_status(snapshot, rendered):
+    """
+    Linha de status: horário da última leitura bem-sucedida e indicadores de
+    dados desatualizados (Redis sem resposta ou saída da função parada).
+    """
+    now = datetime.now()
+    if snapshot.fetched_at is None:
+        return "⚡ Última atualização: N/A | Status: 🔴 Sem conexão com o Redis"
+    
+    fetched_at = snapshot.fetched_at.strftime('%H:%M:%S')
+    read_age = (now - snapshot.fetched_at).total_seconds()
+    if snapshot.error or read_age > STALE_AFTER:
+        status = f"🟡 Desatualizado (última leitura há {read_age:.0f}s)"
+    elif snapshot.metrics:
+        status = '🟢 Conectado'
+    else:
+        status = '🔴 Sem dados'
+    
+    # Saída parada: o resultado mais recente é antigo, embora o Redis responda
+    sample_at = sample_time(snapshot.metrics, None) if snapshot.metrics else None
+    if sample_at is not None and (now - sample_at).total_seconds() > STALE_AFTER:
+        status += f" | 🟠 Saída sem atualização há {(now - sample_at).total_seconds():.0f}s"
+    
+    return (f"⚡ Última atualização: {fetched_at} | Status: {status}"
+            f"{'' if rendered else ' | Sem mudanças'}")
+
+
 def main():
     """Função principal do dashboard."""
     
@@ -162,158 +1202,55 @@ def main():
         - Host: `{REDIS_HOST}`
         - Port: `{REDIS_PORT}`
         - Key: `{REDIS_OUTPUT_KEY}`
+        - Input: `{REDIS_INPUT_KEY}`
         """)
         
         auto_refresh = st.checkbox("🔄 Auto-refresh", value=True)
         if auto_refresh:
             st.info(f"Atualizando a cada {REFRESH_INTERVAL}s")
         
+        history_range = st.selectbox("📉 Histórico de CPU", list(HISTORY_RANGES), index=1)
+        
         st.markdown("---")
         st.markdown("### 📖 Sobre")
         st.markdown("""
         Este dashboard visualiza métricas de recursos processadas pela função serverless:
-        - **CPU:** Média móvel (60s)
+        - **CPU:** Média móvel (60s) e histórico (5 min a 24 h)
         - **Memória:** % em cache
         - **Rede:** % tráfego de saída
         """)
     
-    # Conectar ao Redis
-    redis_conn = get_redis_connection()
-    if not redis_conn:
-        st.error("⚠️ Não foi possível conectar ao Redis. Verifique a configuração.")
-        return
+    # Fetcher compartilhado entre as sessões (erros de conexão aparecem como
+    # dados desatualizados, sem bloquear a sessão)
+    fetcher = get_metrics_fetcher()
     
-    # Placeholder para auto-refresh
-    placeholder = st.empty()
+    # Layout montado uma vez; cada ciclo só atualiza o que mudou
+    error = st.empty()
+    view = DashboardView(history_range)
+    status = st.empty()
+    snapshot = fetcher.snapshot
     
     # Loop principal
     while True:
-        with placeholder.container():
-            # Buscar métricas
-            metrics = fetch_metrics(redis_conn)
-            raw_metrics = fetch_raw_metrics(redis_conn)
-            
-            if not metrics:
-                st.warning("⚠️ Nenhuma métrica disponível ainda. Aguardando dados...")
-                st.info("Certifique-se de que a função serverless está rodando e processando métricas.")
-            else:
-                # Status e timestamp
-                col1, col2, col3 = st.columns([2, 1, 1])
-                with col1:
-                    st.metric("📅 Timestamp", metrics.get('timestamp', 'N/A'))
-                with col2:
-                    st.metric("💻 CPUs Monitoradas", metrics.get('num_cpus_monitored', 0))
-                with col3:
-                    if raw_metrics:
-                        mem_percent = raw_metrics.get('virtual_memory-percent', 0)
-                        st.metric("💾 Memória Usada", f"{mem_percent:.1f}%")
-                    else:
-                        st.metric("💾 Memória Usada", "N/A")
-                
-                st.markdown("---")
-                
-                # Seção 1: Métricas Gerais
-                st.header("📈 Métricas Gerais")
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    network_egress = metrics.get('percent-network-egress', 0)
-                    fig = create_percentage_chart(
-                        "🌐 Tráfego de Saída de Rede",
-                        network_egress,
-                        'steelblue'
-                    )
-                    st.plotly_chart(fig, use_container_width=True)
-                
-                with col2:
-                    memory_cache = metrics.get('percent-memory-cache', 0)
-                    fig = create_percentage_chart(
-                        "💾 Memória em Cache",
-                        memory_cache,
-                        'mediumseagreen'
-                    )
-                    st.plotly_chart(fig, use_container_width=True)
-                
-                st.markdown("---")
-                
-                # Seção 2: CPUs - Médias Móveis
-                st.header("💻 Utilização de CPU (Média Móvel 60s)")
-                
-                # Extrair métricas de CPU
-                cpu_metrics = {
-                    key.replace('avg-util-cpu', '').replace('-60sec', ''): value
-                    for key, value in metrics.items()
-                    if key.startswith('avg-util-cpu')
-                }
-                
-                if cpu_metrics:
-                    # Criar gauges para cada CPU
-                    num_cpus = len(cpu_metrics)
-                    cols_per_row = 4
-                    rows = (num_cpus + cols_per_row - 1) // cols_per_row
-                    
-                    for row in range(rows):
-                        cols = st.columns(cols_per_row)
-                        for col_idx in range(cols_per_row):
-                            cpu_idx = row * cols_per_row + col_idx
-                            if cpu_idx < num_cpus:
-                                cpu_id = sorted(cpu_metrics.keys())[cpu_idx]
-                                with cols[col_idx]:
-                                    fig = create_cpu_gauge(cpu_id, cpu_metrics[cpu_id])
-                                    st.plotly_chart(fig, use_container_width=True)
-                
-                st.markdown("---")
-                
-                # Seção 3: Dados Brutos (Raw Metrics)
-                if raw_metrics:
-                    with st.expander("🔍 Ver Métricas Brutas (Dados de Entrada)", expanded=False):
-                        col1, col2 = st.columns(2)
-                        
-                        with col1:
-                            st.subheader("💻 CPU")
-                            cpu_data = {
-                                key: value for key, value in raw_metrics.items()
-                                if key.startswith('cpu_percent-')
-                            }
-                            if cpu_data:
-                                df = pd.DataFrame([
-                                    {'CPU': key.replace('cpu_percent-', ''), 'Utilização (%)': value}
-                                    for key, value in cpu_data.items()
-                                ])
-                                st.dataframe(df, hide_index=True)
-                            
-                            st.subheader("🌐 Rede")
-                            bytes_sent = raw_metrics.get('net_io_counters_eth0-bytes_sent1', 0)
-                            bytes_recv = raw_metrics.get('net_io_counters_eth0-bytes_recv1', 0)
-                            st.metric("Bytes Enviados", f"{bytes_sent / (1024**2):.2f} MB")
-                            st.metric("Bytes Recebidos", f"{bytes_recv / (1024**2):.2f} MB")
-                        
-                        with col2:
-                            st.subheader("💾 Memória")
-                            mem_total = raw_metrics.get('virtual_memory-total', 0)
-                            mem_used = raw_metrics.get('virtual_memory-used', 0)
-                            mem_cached = raw_metrics.get('virtual_memory-cached', 0)
-                            mem_buffers = raw_metrics.get('virtual_memory-buffers', 0)
-                            
-                            st.metric("Total", f"{mem_total / (1024**3):.2f} GB")
-                            st.metric("Usada", f"{mem_used / (1024**3):.2f} GB")
-                            st.metric("Cache", f"{mem_cached / (1024**3):.2f} GB")
-                            st.metric("Buffers", f"{mem_buffers / (1024**3):.2f} GB")
-                
-                # Seção 4: JSON completo
-                with st.expander("📄 Ver JSON Completo (Métricas Processadas)", expanded=False):
-                    st.json(metrics)
-            
-            # Status da conexão
+        metrics, raw_metrics = snapshot.metrics, snapshot.raw_metrics
+        
+        if snapshot.error:
+            error.error(snapshot.error)
+        else:
+            error.empty()
+        history = fetcher.history(HISTORY_RANGES[history_range]) if metrics else None
+        rendered = view.update(metrics, raw_metrics, history)
+        
+        # Status da conexão e dos dados
+        with status.container():
             st.markdown("---")
-            st.caption(f"⚡ Última atualização: {datetime.now().strftime('%H:%M:%S')} | "
-                      f"Status: {'🟢 Conectado' if metrics else '🔴 Sem dados'}")
+            st.caption(describe_status(snapshot, rendered))
         
-        # Auto-refresh
+        # Auto-refresh: acorda quando o fetcher publica dados novos
         if not auto_refresh:
             break
         
-        time.sleep(REFRESH_INTERVAL)
+        snapshot = fetcher.wait(snapshot.version, REFRESH_INTERVAL)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,413 @@
+"""
+Testes do dashboard (Task 2).
+
+Uso (a partir de task2/; o módulo importa streamlit, plotly e pandas, e os
+testes com Redis usam o fakeredis):
+
+    pip install -r requirements.txt pytest fakeredis
+    python -m pytest -q test_dashboard.py
+"""
+
+import json
+import socket
+import time
+import unittest
+import zlib
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+import numpy as np
+import redis
+
+try:
+    import dashboard
+except ImportError:
+    dashboard = None
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+requires_dashboard = unittest.skipIf(dashboard is None, "requer as dependências do dashboard (requirements.txt)")
+requires_fakeredis = unittest.skipIf(fakeredis is None, "requer o pacote fakeredis")
+
+
+def _result(**cpus) -> dict:
+    """Resultado do handler com a média de 60s de cada CPU (cpu0=..., cpu1=...)."""
+    return {f'avg-util-{cpu_id}-60sec': value for cpu_id, value in cpus.items()}
+
+
+@requires_dashboard
+class HistoryStoreTest(unittest.TestCase):
+    """Histórico colunar em buffer circular duplicado."""
+
+    def setUp(self):
+        self.start = datetime.now() - timedelta(minutes=10)
+
+    def _at(self, index: int) -> datetime:
+        return self.start + timedelta(seconds=5 * index)
+
+    def test_window_keeps_the_last_capacity_samples_in_order(self):
+        store = dashboard.HistoryStore(capacity=5)
+        for index in range(12):
+            store.append(self._at(index), _result(cpu0=float(index)))
+
+        timestamps, values = store.window()
+        self.assertEqual(len(store), 5)
+        self.assertEqual(list(values[store.cpu_rows['0']]), [7.0, 8.0, 9.0, 10.0, 11.0])
+        self.assertEqual(list(timestamps), [np.datetime64(self._at(index), 'ms') for index in range(7, 12)])
+        # Views do buffer, sem cópia
+        self.assertTrue(np.shares_memory(values, store.values))
+        self.assertTrue(np.shares_memory(timestamps, store.timestamps))
+
+    def test_older_or_repeated_samples_are_ignored(self):
+        store = dashboard.HistoryStore(capacity=10)
+        store.append(self._at(1), _result(cpu0=1.0))
+        store.append(self._at(1), _result(cpu0=2.0))
+        store.append(self._at(0), _result(cpu0=3.0))
+
+        self.assertEqual(store.count, 1)
+        self.assertEqual(list(store.window()[1][0]), [1.0])
+
+    def test_cpus_appearing_later_have_nan_before(self):
+        store = dashboard.HistoryStore(capacity=4)
+        store.append(self._at(0), _result(cpu0=1.0))
+        store.append(self._at(1), _result(cpu0=2.0, cpu1=20.0))
+
+        _, values = store.window()
+        self.assertTrue(np.isnan(values[store.cpu_rows['1'], 0]))
+        self.assertEqual(values[store.cpu_rows['1'], 1], 20.0)
+
+    def test_window_since(self):
+        store = dashboard.HistoryStore(capacity=8)
+        for index in range(6):
+            store.append(self._at(index), _result(cpu0=float(index)))
+
+        timestamps, values = store.window(np.datetime64(self._at(3), 'ms'))
+        self.assertEqual(list(values[0]), [3.0, 4.0, 5.0])
+        self.assertEqual(timestamps[0], np.datetime64(self._at(3), 'ms'))
+
+    def test_merge_adds_only_newer_samples(self):
+        loaded, live = dashboard.HistoryStore(capacity=10), dashboard.HistoryStore(capacity=10)
+        for index in range(4):
+            loaded.append(self._at(index), _result(cpu0=float(index)))
+        for index in range(2, 6):
+            live.append(self._at(index), _result(cpu0=100.0 + index, cpu1=1.0))
+
+        loaded.merge(live)
+
+        _, values = loaded.window()
+        self.assertEqual(list(values[loaded.cpu_rows['0']]), [0.0, 1.0, 2.0, 3.0, 104.0, 105.0])
+        self.assertEqual(list(values[loaded.cpu_rows['1']][-2:]), [1.0, 1.0])
+
+    def test_history_downsamples_only_above_width(self):
+        # 100 amostras, a última há 5s
+        self.start = datetime.now() - timedelta(seconds=500)
+        store = dashboard.HistoryStore(capacity=200)
+        for index in range(100):
+            store.append(self._at(index), _result(cpu0=float(index), cpu10=1.0, cpu2=2.0))
+
+        history = store.history(3600, width=200)
+        self.assertEqual(list(history.cpus), ['0', '2', '10'])
+        self.assertEqual(history.entries, 100)
+        self.assertTrue(np.shares_memory(history.cpus['0'][1], store.values))
+
+        history = store.history(3600, width=20, method='minmax')
+        x, y, _, _ = history.cpus['0']
+        self.assertEqual((len(x), len(y)), (20, 20))
+        self.assertEqual((y[0], y[-1]), (0.0, 99.0))
+
+        # Intervalo menor que o histórico: só as amostras recentes
+        self.assertEqual(store.history(62, width=200).entries, 12)
+
+
+@requires_dashboard
+class DownsamplingTest(unittest.TestCase):
+    """Downsampling min-max e LTTB do histórico em memória."""
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.values = (rng.random((4, 10_001)) * 100).astype(np.float32)
+        self.values[1, 6_543] = 1000.0   # pico
+        self.values[2, 7_777] = -50.0    # vale
+        self.values[3, :500] = np.nan    # CPU que apareceu depois
+
+    def _assert_valid(self, indices, width):
+        self.assertEqual(indices.shape, (4, width))
+        self.assertTrue((np.diff(indices, axis=1) >= 0).all())
+        self.assertGreaterEqual(indices.min(), 0)
+        self.assertLess(indices.max(), self.values.shape[1])
+
+    def test_minmax_keeps_peaks_and_valleys(self):
+        indices = dashboard.downsample_minmax(self.values, 400)
+
+        self._assert_valid(indices, 400)
+        self.assertIn(6_543, indices[1])
+        self.assertIn(7_777, indices[2])
+        self.assertFalse(np.isnan(self.values[3, indices[3][-10:]]).any())
+
+    def test_minmax_picks_min_and_max_of_each_band_in_time_order(self):
+        values = np.array([[5.0, 1.0, 9.0, 3.0, 4.0, 8.0, 2.0, 7.0]], dtype=np.float32)
+        self.assertEqual(dashboard.downsample_minmax(values, 4).tolist(), [[1, 2, 5, 6]])
+
+        # Amostras que não dividem as faixas: a primeira fica menor ([5, 1, 9])
+        values = np.array([[5.0, 1.0, 9.0, 3.0, 4.0, 8.0, 2.0]], dtype=np.float32)
+        self.assertEqual(dashboard.downsample_minmax(values, 4).tolist(), [[1, 2, 5, 6]])
+
+    def test_lttb_keeps_endpoints_and_peaks(self):
+        indices = dashboard.downsample_lttb(self.values, 300)
+
+        self._assert_valid(indices, 300)
+        self.assertTrue((indices[:, 0] == 0).all())
+        self.assertTrue((indices[:, -1] == self.values.shape[1] - 1).all())
+        self.assertIn(6_543, indices[1])
+        self.assertIn(7_777, indices[2])
+
+    def test_lttb_on_a_straight_line_is_evenly_spread(self):
+        values = np.arange(1000, dtype=np.float32)[None, :]
+        indices = dashboard.downsample_lttb(values, 10)[0]
+        self.assertEqual(len(set(indices.tolist())), 10)
+        self.assertLess(np.diff(indices).max(), 2 * 1000 / 9)
+
+
+@requires_dashboard
+@requires_fakeredis
+class HistoryReaderTest(unittest.TestCase):
+    """Histórico agregado no servidor (HISTORY_SCRIPT), em chamadas limitadas."""
+
+    ENTRIES = 700
+
+    def setUp(self):
+        self.redis_conn = fakeredis.FakeRedis()
+        self.now_ms = int(time.time() * 1000)
+        # Horário fixo: as consultas comparadas usam os mesmos buckets
+        patcher = mock.patch.object(dashboard.time, 'time', return_value=self.now_ms / 1000)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _write(self, kind: str, encoding: str = 'json'):
+        """Série no formato do OutputSink do runtime: uma entrada a cada 5s na última hora."""
+        for index in range(self.ENTRIES):
+            ms = self.now_ms - (self.ENTRIES - index) * 5000
+            result = _result(cpu0=float(index % 97), cpu1=index * 0.5)
+            payload = json.dumps(result).encode()
+            if encoding == 'zlib':
+                payload = zlib.compress(payload)
+            if kind == 'stream':
+                fields = {'data': payload} if encoding == 'json' else {'data': payload, 'enc': encoding}
+                self.redis_conn.xadd('out:history', fields, id=f'{ms}-0')
+            else:
+                self.redis_conn.zadd('out:history', {f'{ms / 1000:.6f}-0|'.encode() + payload: ms / 1000})
+
+    def _reader(self, scan_limit: int, server_side: bool = True):
+        reader = dashboard.HistoryReader(self.redis_conn, key='out:history', points=60, scan_limit=scan_limit)
+        reader.server_side = server_side
+        return reader
+
+    def _assert_same_history(self, history, expected):
+        self.assertEqual(history.entries, expected.entries)
+        self.assertEqual(history.timestamps, expected.timestamps)
+        self.assertEqual(history.cpus, expected.cpus)
+
+    def test_server_side_matches_client_side_aggregation(self):
+        for kind in ('stream', 'zset'):
+            with self.subTest(kind=kind):
+                self.redis_conn.delete('out:history')
+                self._write(kind)
+                reader = self._reader(scan_limit=100)
+                script = mock.patch.object(reader, 'script', wraps=reader.script)
+
+                with script as calls:
+                    history = reader.read(3600)
+
+                self.assertTrue(reader.server_side)
+                self.assertEqual(history.bucket_seconds, 60)
+                self.assertGreaterEqual(calls.call_count, self.ENTRIES // 100)
+                self._assert_same_history(history, self._reader(10_000, server_side=False).read(3600))
+
+    def test_bucket_statistics(self):
+        self._write('stream')
+        history = self._reader(scan_limit=1000).read(3600)
+
+        _, means, lows, highs = history.cpus['1']
+        # Último bucket completo: 12 entradas de 5s, cpu1 = índice * 0.5
+        self.assertAlmostEqual(highs[-2] - lows[-2], 11 * 0.5)
+        self.assertAlmostEqual(means[-2], (lows[-2] + highs[-2]) / 2)
+        self.assertEqual(history.entries, self.ENTRIES)
+
+    def test_compressed_entries_are_aggregated_on_the_client(self):
+        self._write('stream', encoding='zlib')
+        history = self._reader(scan_limit=100).read(3600)
+
+        self.assertEqual(history.entries, self.ENTRIES)
+        # Referência: os mesmos valores em JSON
+        self.redis_conn.delete('out:history')
+        self._write('stream')
+        self._assert_same_history(history, self._reader(10_000, server_side=False).read(3600))
+
+    def test_range_shorter_than_the_series(self):
+        self._write('zset')
+        history = self._reader(scan_limit=50).read(300)
+        self.assertEqual(history.entries, 60)
+
+    def test_missing_series(self):
+        self.assertIsNone(self._reader(scan_limit=100).read(3600))
+
+
+def _utc_timestamp(seconds_ago: float = 0) -> str:
+    """Timestamp sem fuso (UTC), no formato do coletor."""
+    moment = datetime.now(timezone.utc) - timedelta(seconds=seconds_ago)
+    return moment.replace(tzinfo=None).isoformat(' ')
+
+
+@requires_dashboard
+@requires_fakeredis
+class RedisDataSourceTest(unittest.TestCase):
+    """Saída, entrada e entradas novas da série em um round-trip."""
+
+    def setUp(self):
+        self.redis_conn = fakeredis.FakeRedis()
+        self.source = dashboard.RedisDataSource(self.redis_conn, output_key='out', input_key='in',
+                                                history_key='out:history')
+        self.redis_conn.set('out', json.dumps(_result(cpu0=1.0)))
+        self.redis_conn.set('in', json.dumps({'virtual_memory-percent': 40.0}))
+
+    def _add(self, value: float, ms: int):
+        self.redis_conn.xadd('out:history', {'data': json.dumps(_result(cpu0=value))}, id=f'{ms}-0')
+
+    def _fetch(self):
+        with mock.patch.object(self.redis_conn, 'pipeline', wraps=self.redis_conn.pipeline) as pipeline:
+            reply = self.source.fetch()
+        self.assertEqual(pipeline.call_count, 1)
+        return reply
+
+    def test_reads_output_and_input_in_one_round_trip(self):
+        output_raw, input_raw, items = self._fetch()
+
+        self.assertEqual(json.loads(output_raw), _result(cpu0=1.0))
+        self.assertEqual(json.loads(input_raw), {'virtual_memory-percent': 40.0})
+        self.assertEqual(items, [])
+
+    def test_follows_new_history_entries(self):
+        self._add(1.0, 1000)
+        self.source.follow_history('stream', [(1000, _result(cpu0=1.0))])
+        self._add(2.0, 2000)
+        self._add(3.0, 3000)
+
+        _, _, items = self._fetch()
+        # A partir da última lida (inclusive; o HistoryStore descarta a repetida)
+        self.assertEqual([ms for ms, _ in items], [1000, 2000, 3000])
+        self.assertEqual(items[-1][1], _result(cpu0=3.0))
+
+        _, _, items = self._fetch()
+        self.assertEqual([ms for ms, _ in items], [3000])
+
+    def test_recreated_series_is_read_from_the_start(self):
+        self.source.follow_history(None, [])
+        self._add(1.0, 1000)
+
+        self._fetch()
+        self.assertEqual((self.source.history_kind, self.source.history_position), ('stream', 0))
+
+        _, _, items = self._fetch()
+        self.assertEqual([ms for ms, _ in items], [1000])
+
+        self.redis_conn.delete('out:history')
+        self._fetch()
+        self.assertEqual((self.source.history_kind, self.source.history_position), (None, None))
+
+
+@requires_dashboard
+class RedisTimeoutTest(unittest.TestCase):
+    """Redis que aceita a conexão e não responde: leituras limitadas pelo timeout."""
+
+    def setUp(self):
+        # Socket que completa o handshake TCP (backlog) mas nunca responde
+        self.server = socket.socket()
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(8)
+        self.addCleanup(self.server.close)
+
+        settings = {'REDIS_HOST': '127.0.0.1', 'REDIS_PORT': self.server.getsockname()[1],
+                    'REDIS_SOCKET_TIMEOUT': 0.2}
+        for name, value in settings.items():
+            patcher = mock.patch.object(dashboard, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        dashboard.get_redis_connection.clear()
+        self.addCleanup(dashboard.get_redis_connection.clear)
+        self.redis_conn = dashboard.get_redis_connection()
+
+    def test_fetch_times_out(self):
+        source = dashboard.RedisDataSource(self.redis_conn)
+        start = time.monotonic()
+        with self.assertRaises(redis.exceptions.TimeoutError):
+            source.fetch()
+        self.assertLess(time.monotonic() - start, 2)
+
+    def test_fetcher_reports_no_connection_without_blocking(self):
+        start = time.monotonic()
+        fetcher = dashboard.MetricsFetcher(self.redis_conn, interval=3600)
+        self.assertLess(time.monotonic() - start, 2)
+
+        snapshot = fetcher.snapshot
+        self.assertIn('Erro ao buscar métricas', snapshot.error)
+        self.assertIn('🔴 Sem conexão com o Redis', dashboard.describe_status(snapshot, True))
+
+
+@requires_dashboard
+@requires_fakeredis
+class StaleIndicatorsTest(unittest.TestCase):
+    """Indicadores de dados desatualizados na linha de status."""
+
+    def setUp(self):
+        self.redis_conn = fakeredis.FakeRedis()
+        self.metrics = dict(_result(cpu0=10.0), timestamp=_utc_timestamp())
+        self.redis_conn.set(dashboard.REDIS_OUTPUT_KEY, json.dumps(self.metrics))
+        self.fetcher = dashboard.MetricsFetcher(self.redis_conn, interval=3600)
+
+    def test_fresh_data_is_connected(self):
+        status = dashboard.describe_status(self.fetcher.snapshot, True)
+        self.assertIn('🟢 Conectado', status)
+        self.assertNotIn('🟠', status)
+        self.assertTrue(dashboard.describe_status(self.fetcher.snapshot, False).endswith('Sem mudanças'))
+
+    def test_read_error_keeps_last_data_and_marks_it_stale(self):
+        before = self.fetcher.snapshot
+        with mock.patch.object(self.fetcher.source, 'fetch', side_effect=redis.exceptions.TimeoutError("Timeout")):
+            self.fetcher.fetch()
+
+        snapshot = self.fetcher.snapshot
+        self.assertEqual(snapshot.version, before.version + 1)
+        self.assertEqual((snapshot.metrics, snapshot.fetched_at), (before.metrics, before.fetched_at))
+        self.assertIn('🟡 Desatualizado', dashboard.describe_status(snapshot, True))
+
+        # Redis de volta: o erro some
+        self.fetcher.fetch()
+        self.assertIsNone(self.fetcher.snapshot.error)
+        self.assertIn('🟢 Conectado', dashboard.describe_status(self.fetcher.snapshot, True))
+
+    def test_old_successful_read_is_stale(self):
+        old = datetime.now() - timedelta(seconds=dashboard.STALE_AFTER + 5)
+        snapshot = self.fetcher.snapshot._replace(fetched_at=old)
+        self.assertIn('🟡 Desatualizado', dashboard.describe_status(snapshot, True))
+
+    def test_output_not_updated_by_the_function(self):
+        self.metrics['timestamp'] = _utc_timestamp(seconds_ago=dashboard.STALE_AFTER + 60)
+        self.redis_conn.set(dashboard.REDIS_OUTPUT_KEY, json.dumps(self.metrics))
+        self.fetcher.fetch()
+
+        status = dashboard.describe_status(self.fetcher.snapshot, True)
+        self.assertIn('🟢 Conectado', status)
+        self.assertIn('🟠 Saída sem atualização', status)
+
+    def test_missing_output(self):
+        self.redis_conn.delete(dashboard.REDIS_OUTPUT_KEY)
+        self.fetcher.fetch()
+        self.assertIn('🔴 Sem dados', dashboard.describe_status(self.fetcher.snapshot, True))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -13,18 +13,52 @@ ID: [SEU ID]
 """
 
 import redis
+import asyncio
 import json
+import logging
+import logging.handlers
 import time
 import os
 import sys
 import importlib.util
+import importlib.machinery
+import hashlib
+import posixpath
 import zipfile
 import tempfile
 import shutil
-from datetime import datetime
+import socket
+import http.server
+import io
+import marshal
+import cProfile
+import pstats
+import tracemalloc
+import signal
+import atexit
+import pickle
+import zlib
+import queue
+import random
+import threading
+import traceback
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from datetime import datetime, timezone
 from pathlib import Path
 import requests
 
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 
 # ============================================================================
 # CONFIGURAÇÕES DO RUNTIME (via variáveis de ambiente)
@@ -36,9 +70,274 @@ REDIS_INPUT_KEY = os.getenv('REDIS_INPUT_KEY', 'metrics')
 REDIS_OUTPUT_KEY = os.getenv('REDIS_OUTPUT_KEY', 'output')
 MONITORING_PERIOD = int(os.getenv('MONITORING_PERIOD', 5))
 HANDLER_FUNCTION = os.getenv('HANDLER_FUNCTION', 'handler_module.handler')
+
+# Função de lote opcional, procurada no mesmo módulo de HANDLER_FUNCTION.
+# Recebe (inputs: list[dict], context) e retorna uma lista de resultados.
+HANDLER_BATCH_FUNCTION = os.getenv('HANDLER_BATCH_FUNCTION', 'handler_batch')
+HANDLER_BATCH_SIZE = int(os.getenv('HANDLER_BATCH_SIZE', 50))
 ZIP_URL = os.getenv('ZIP_URL', None)
 PYFILE_PATH = os.getenv('PYFILE_PATH', '/app/pyfile/pyfile')
 
+# Cache local de pacotes ZIP (conteúdo endereçado por SHA-256)
+ZIP_CACHE_DIR = os.getenv('ZIP_CACHE_DIR', '/app/cache/zip')
+ZIP_CACHE_MAX_BYTES = int(os.getenv('ZIP_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+# Segundos em que um pacote em cache é usado sem revalidar com o servidor
+ZIP_CACHE_MAX_AGE = int(os.getenv('ZIP_CACHE_MAX_AGE', 0))
+
+# Importação de pacotes ZIP: 'extract' (extrai e importa do disco), 'zip'
+# (importa direto do arquivo via zipimport) ou 'auto' (zipimport, exceto
+# pacotes com extensões C, que precisam de arquivos reais)
+ZIP_IMPORT_MODE = os.getenv('ZIP_IMPORT_MODE', 'extract').lower()
+NATIVE_EXTENSIONS = ('.so', '.pyd', '.dylib')
+
+# Intervalo (s) para verificar mudanças no pyfile/ZIP e recarregar o handler
+# sem reiniciar o processo (0 = desabilitado). O ZIP é verificado via HEAD.
+RELOAD_CHECK_INTERVAL = int(os.getenv('RELOAD_CHECK_INTERVAL', 10))
+RELOAD_ZIP_CHECK_INTERVAL = int(os.getenv('RELOAD_ZIP_CHECK_INTERVAL', 60))
+
+# Modo de ingestão: 'poll' (GET periódico), 'notify' (keyspace notifications),
+# 'list' (BLPOP em uma lista Redis) ou 'stream' (Redis Stream + consumer group)
+INGEST_MODE = os.getenv('INGEST_MODE', 'poll').lower()
+
+# Detecção de mudança antes de transferir e parsear a entrada (poll/notify):
+# 'digest' (script Lua compara o SHA1 do valor no servidor), 'version' (chave
+# <input_key>:version incrementada pelo produtor), 'raw' (compara os bytes
+# antes do parse) ou 'none' (parse e comparação por timestamp, original)
+CHANGE_DETECTION = os.getenv('CHANGE_DETECTION', 'raw').lower()
+CHANGE_VERSION_SUFFIX = os.getenv('CHANGE_VERSION_SUFFIX', ':version')
+
+# Configurações do modo 'stream'
+STREAM_GROUP = os.getenv('STREAM_GROUP', 'serverless-runtime')
+STREAM_CONSUMER = os.getenv('STREAM_CONSUMER', socket.gethostname())
+STREAM_FIELD = os.getenv('STREAM_FIELD', 'data')
+STREAM_BATCH_SIZE = int(os.getenv('STREAM_BATCH_SIZE', 10))
+STREAM_CLAIM_IDLE_MS = int(os.getenv('STREAM_CLAIM_IDLE_MS', 60000))
+STREAM_MAX_DELIVERIES = int(os.getenv('STREAM_MAX_DELIVERIES', 5))
+
+# Persistência de context.env: 'none', 'redis' (hash) ou 'file' (snapshot local)
+STATE_BACKEND = os.getenv('STATE_BACKEND', 'none').lower()
+STATE_KEY = os.getenv('STATE_KEY', f"{REDIS_OUTPUT_KEY}:state")
+STATE_FILE = os.getenv('STATE_FILE', '/app/state/context.pkl')
+CHECKPOINT_EVERY = int(os.getenv('CHECKPOINT_EVERY', 12))
+CHECKPOINT_ASYNC = os.getenv('CHECKPOINT_ASYNC', 'true').lower() in ('1', 'true', 'yes')
+
+# Saída: além do último resultado em REDIS_OUTPUT_KEY, uma série temporal
+# limitada ('stream' = XADD com MAXLEN, 'zset' = sorted set por timestamp,
+# 'none' = só o último), gravados juntos em um único MULTI/EXEC
+OUTPUT_HISTORY = os.getenv('OUTPUT_HISTORY', 'none').lower()
+OUTPUT_HISTORY_KEY = os.getenv('OUTPUT_HISTORY_KEY', '')  # padrão: <output_key>:history
+OUTPUT_HISTORY_MAXLEN = int(os.getenv('OUTPUT_HISTORY_MAXLEN', 720))
+# TTL (s) da chave de saída e da série (0 = sem expiração)
+OUTPUT_TTL = int(os.getenv('OUTPUT_TTL', 0))
+# Codificação das entradas da série: 'json', 'zlib' (JSON comprimido) ou
+# 'msgpack'. O último resultado em REDIS_OUTPUT_KEY é sempre JSON.
+OUTPUT_HISTORY_ENCODING = os.getenv('OUTPUT_HISTORY_ENCODING', 'json').lower()
+
+# Codecs de entrada e saída: 'json' (biblioteca padrão), 'orjson' ou
+# 'msgpack'. A entrada em 'auto' detecta o formato pelo primeiro byte.
+INPUT_CODEC = os.getenv('INPUT_CODEC', 'auto').lower()
+OUTPUT_CODEC = os.getenv('OUTPUT_CODEC', 'json').lower()
+
+# Período adaptativo (modo 'poll'): estima o intervalo do produtor pelo campo
+# 'timestamp' da entrada e lê logo após a próxima atualização esperada, com
+# jitter e backoff exponencial enquanto não há dados novos
+ADAPTIVE_PERIOD = os.getenv('ADAPTIVE_PERIOD', 'false').lower() in ('1', 'true', 'yes')
+ADAPTIVE_MARGIN = float(os.getenv('ADAPTIVE_MARGIN', 0.2))  # s após a atualização esperada
+ADAPTIVE_JITTER = float(os.getenv('ADAPTIVE_JITTER', 0.1))  # fração aleatória somada ao atraso
+ADAPTIVE_MAX_PERIOD = float(os.getenv('ADAPTIVE_MAX_PERIOD', 60))  # teto do backoff
+
+# Loop do runtime: 'sync' (original) ou 'async' (asyncio + redis.asyncio,
+# sobrepondo leitura, handler, escrita e checkpoint)
+RUNTIME_MODE = os.getenv('RUNTIME_MODE', 'sync').lower()
+# Leituras antecipadas por função no modo async (exceto 'stream')
+ASYNC_PREFETCH = int(os.getenv('ASYNC_PREFETCH', 1))
+
+# Manifesto JSON com várias funções no mesmo runtime (vazio = uma função,
+# configurada pelas variáveis acima)
+FUNCTIONS_MANIFEST = os.getenv('FUNCTIONS_MANIFEST', '')
+
+# Profiling do handler: 'none', 'cprofile', 'tracemalloc' ou 'both', em uma
+# a cada PROFILE_EVERY invocações. Pode ser ligado sem reiniciar escrevendo
+# "<modo>[:N]" na chave de controle (ex: SET output:profile:control cprofile:10)
+PROFILE_MODE = os.getenv('PROFILE_MODE', 'none').lower()
+PROFILE_EVERY = int(os.getenv('PROFILE_EVERY', 100))
+PROFILE_CONTROL_KEY = os.getenv('PROFILE_CONTROL_KEY', '')  # padrão: <output_key>:profile:control
+PROFILE_CONTROL_INTERVAL = int(os.getenv('PROFILE_CONTROL_INTERVAL', 10))  # 0 = sem chave de controle
+# Estatísticas agregadas: 'redis' (hash <output_key>:profile) ou um diretório
+PROFILE_OUTPUT = os.getenv('PROFILE_OUTPUT', 'redis')
+PROFILE_TOP = int(os.getenv('PROFILE_TOP', 30))
+
+# Endpoint Prometheus (/metrics) servido por uma thread em background
+# (0 = desabilitado)
+METRICS_PORT = int(os.getenv('METRICS_PORT', 8000))
+
+# Execução do handler: 'inline' (na thread do loop), 'thread' ou 'process'
+# (workers pré-criados com o handler já importado)
+EXECUTOR_MODE = os.getenv('EXECUTOR_MODE', 'inline').lower()
+EXECUTOR_WORKERS = int(os.getenv('EXECUTOR_WORKERS', 1))
+# Tempo máximo (s) de execução do handler por amostra (0 = sem limite)
+HANDLER_TIMEOUT = float(os.getenv('HANDLER_TIMEOUT', 0))
+# Reciclar o worker após N invocações ou acima de X MB de RSS (0 = nunca)
+WORKER_MAX_CALLS = int(os.getenv('WORKER_MAX_CALLS', 0))
+WORKER_MAX_MEMORY_MB = int(os.getenv('WORKER_MAX_MEMORY_MB', 0))
+
+# Logs: 'text' (linhas legíveis, como antes) ou 'json' (uma linha JSON por
+# evento, para o pipeline de logs). Linhas por execução e por leitura vazia
+# ficam em DEBUG; em INFO, um resumo por função a cada LOG_SUMMARY_INTERVAL
+# segundos (0 = sem resumo)
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_SUMMARY_INTERVAL = float(os.getenv('LOG_SUMMARY_INTERVAL', 60))
+
+
+# ============================================================================
+# LOGGING
+# ============================================================================
+
+log = logging.getLogger('runtime')
+
+
+def log_fields(**fields) -> dict:
+    """Campos estruturados de um evento (extra= das chamadas de log)."""
+    return {'fields': fields}
+
+
+class JsonFormatter(logging.Formatter):
+    """Uma linha JSON por evento: ts, level, logger, msg e os campos extras."""
+    
+    def format(self, record) -> str:
+        event = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'msg': record.getMessage().strip(),
+        }
+        event.update(getattr(record, 'fields', None) or {})
+        if record.exc_text:
+            event['exc'] = record.exc_text
+        return json.dumps(event, ensure_ascii=False, default=str)
+
+
+class QueueLogHandler(logging.handlers.QueueHandler):
+    """
+    Enfileira os eventos sem formatar: a escrita no stdout (e a serialização
+    JSON) acontece na thread do QueueListener, fora do loop do runtime. Só o
+    traceback é renderizado aqui, enquanto a exceção ainda existe.
+    """
+    
+    def prepare(self, record):
+        if record.exc_info:
+            record.exc_text = ''.join(traceback.format_exception(*record.exc_info)).rstrip()
+            record.exc_info = None
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def setup_logging(log_format: str = LOG_FORMAT, level: str = LOG_LEVEL):
+    """
+    Configura o logger do runtime: QueueHandler não bloqueante + thread
+    escrevendo no stdout no formato LOG_FORMAT.
+    
+    Returns:
+        QueueListener (parado no encerramento do processo)
+    """
+    stream_handler = logging.StreamHandler(sys.stdout)
+    if log_format == 'json':
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter('%(message)s'))
+    
+    log_queue = queue.Queue(-1)
+    listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    listener.start()
+    atexit.register(listener.stop)
+    
+    for handler in list(log.handlers):
+        log.removeHandler(handler)
+    log.addHandler(QueueLogHandler(log_queue))
+    log.setLevel(getattr(logging, level, logging.INFO))
+    log.propagate = False
+    
+    if log_format not in ('text', 'json'):
+        log.warning(f"⚠️  LOG_FORMAT desconhecido '{log_format}'. Usando text.")
+    return listener
+
+
+class LogSummary:
+    """
+    Agrega eventos repetitivos por função (execuções, entradas sem mudança,
+    leituras sem dados, erros do handler) e registra um resumo em INFO a cada
+    LOG_SUMMARY_INTERVAL segundos, no lugar de uma linha por leitura.
+    """
+    
+    def __init__(self, interval: float = LOG_SUMMARY_INTERVAL):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.started = time.monotonic()
+    
+    def _counter(self, function: str) -> dict:
+        return self.counters.setdefault(function, {
+            'executions': 0, 'invocations': 0, 'handler_seconds': 0.0, 'handler_max_seconds': 0.0,
+            'unchanged': 0, 'idle': 0, 'errors': 0,
+        })
+    
+    def idle(self, function: str):
+        """Leitura sem dados."""
+        self.add(function, 'idle')
+    
+    def unchanged(self, function: str):
+        """Entrada descartada por não ter mudado."""
+        self.add(function, 'unchanged')
+    
+    def add(self, function: str, field: str, value=1):
+        with self.lock:
+            self._counter(function)[field] += value
+        self.maybe_flush()
+    
+    def executed(self, function: str, samples: int, elapsed_time: float, error: bool = False):
+        """Uma invocação do handler com `samples` amostras."""
+        with self.lock:
+            counter = self._counter(function)
+            counter['invocations'] += 1
+            counter['handler_seconds'] += elapsed_time
+            counter['handler_max_seconds'] = max(counter['handler_max_seconds'], elapsed_time)
+            if error:
+                counter['errors'] += 1
+            else:
+                counter['executions'] += samples
+        self.maybe_flush()
+    
+    def maybe_flush(self):
+        if self.interval > 0 and time.monotonic() - self.started >= self.interval:
+            self.flush()
+    
+    def flush(self):
+        """Registra o resumo de cada função e zera os contadores."""
+        with self.lock:
+            counters, self.counters = self.counters, {}
+            window = time.monotonic() - self.started
+            self.started = time.monotonic()
+        
+        if self.interval <= 0:
+            return
+        timestamp = datetime.now().strftime('%H:%M:%S')
+        for function, counter in counters.items():
+            invocations = counter['invocations']
+            average = counter['handler_seconds'] / invocations if invocations else 0.0
+            log.info(f"📋 [{timestamp}] [{function}] Últimos {window:.0f}s: {counter['executions']} execuções | "
+                     f"handler médio {average * 1000:.1f}ms, máx {counter['handler_max_seconds'] * 1000:.1f}ms | "
+                     f"{counter['unchanged']} sem mudança | {counter['idle']} sem dados | "
+                     f"{counter['errors']} erros",
+                     extra=log_fields(event='summary', function=function, window_seconds=round(window, 1),
+                                      handler_avg_seconds=round(average, 6),
+                                      **{field: round(value, 6) if isinstance(value, float) else value
+                                         for field, value in counter.items() if field != 'handler_seconds'}))
+
+
+LOG_SUMMARY = LogSummary()
+
 
 # ============================================================================
 # CLASSE DE CONTEXTO
@@ -50,11 +349,13 @@ class Context:
     Contém metadados sobre o runtime e estado persistente.
     """
     
-    def __init__(self):
+    def __init__(self, function_name: str = HANDLER_FUNCTION,
+                 input_key: str = REDIS_INPUT_KEY, output_key: str = REDIS_OUTPUT_KEY):
         self.host = REDIS_HOST
         self.port = REDIS_PORT
-        self.input_key = REDIS_INPUT_KEY
-        self.output_key = REDIS_OUTPUT_KEY
+        self.function_name = function_name
+        self.input_key = input_key
+        self.output_key = output_key
         self.function_getmtime = None
         self.last_execution = None
         self.env = {}  # Estado persistente entre execuções
@@ -67,44 +368,239 @@ class Context:
 # CARREGAMENTO DE MÓDULOS
 # ============================================================================
 
-def download_and_extract_zip(url: str, extract_to: str) -> str:
+class ZipPackageCache:
     """
-    Baixa e extrai um arquivo ZIP de uma URL.
+    Cache em disco de pacotes ZIP, endereçado pelo SHA-256 do conteúdo.
     
-    Args:
-        url: URL do arquivo ZIP
-        extract_to: Diretório onde extrair
+    Estrutura em ZIP_CACHE_DIR:
+    - index.json: URL -> ETag/Last-Modified/SHA-256, e uso de cada pacote
+    - blobs/<sha256>.zip: arquivo baixado
+    - trees/<sha256>/: árvore extraída (reutilizada entre inicializações)
     
-    Returns:
-        Caminho do diretório extraído
+    O download é condicional (If-None-Match / If-Modified-Since): se o
+    servidor responde 304, o pacote em cache é usado sem baixar nem
+    descompactar nada. Para cada pacote também é guardado um índice de
+    módulos (nome -> caminho no ZIP), que dispensa percorrer a árvore.
+    Downloads são gravados em streaming direto no disco. Se o servidor
+    estiver inacessível, a última versão em cache é usada. Pacotes menos
+    usados recentemente são removidos quando o cache passa de
+    ZIP_CACHE_MAX_BYTES.
     """
-    print(f"📦 Baixando ZIP de: {url}")
     
-    try:
-        response = requests.get(url, timeout=30)
-        response.raise_for_status()
+    def __init__(self, root: str = ZIP_CACHE_DIR, max_bytes: int = ZIP_CACHE_MAX_BYTES,
+                 max_age: int = ZIP_CACHE_MAX_AGE):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.blobs_dir = os.path.join(root, 'blobs')
+        self.trees_dir = os.path.join(root, 'trees')
+        self.index_path = os.path.join(root, 'index.json')
+        
+        os.makedirs(self.blobs_dir, exist_ok=True)
+        os.makedirs(self.trees_dir, exist_ok=True)
+        self.index = self._load_index()
+    
+    def _load_index(self) -> dict:
+        try:
+            with open(self.index_path) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+        index.setdefault('urls', {})
+        index.setdefault('packages', {})
+        return index
+    
+    def _save_index(self):
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.index, f)
+        os.replace(tmp_path, self.index_path)
+    
+    def blob_path(self, sha256: str) -> str:
+        return os.path.join(self.blobs_dir, f"{sha256}.zip")
+    
+    def tree_path(self, sha256: str) -> str:
+        return os.path.join(self.trees_dir, sha256)
+    
+    def _cached(self, url: str):
+        """Entrada do índice para a URL, se o pacote ainda estiver em disco."""
+        entry = self.index['urls'].get(url)
+        if entry and os.path.exists(self.blob_path(entry['sha256'])):
+            return entry
+        return None
+    
+    def _download(self, response) -> str:
+        """Grava a resposta em blobs/ em streaming, calculando o SHA-256."""
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.blobs_dir, suffix='.part')
         
-        # Salvar ZIP temporariamente
-        zip_path = os.path.join(extract_to, 'function.zip')
-        with open(zip_path, 'wb') as f:
-            f.write(response.content)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    digest.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+            
+            sha256 = digest.hexdigest()
+            os.replace(tmp_path, self.blob_path(sha256))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
         
-        print(f"✅ ZIP baixado: {len(response.content)} bytes")
+        log.info(f"✅ ZIP baixado: {size} bytes (sha256 {sha256[:12]})")
+        return sha256
+    
+    def extract(self, sha256: str) -> str:
+        """Extrai o blob (se ainda não extraído) e retorna o diretório da árvore."""
+        tree = self.tree_path(sha256)
+        if os.path.isdir(tree):
+            log.info(f"♻️  Reutilizando árvore extraída: {tree}")
+            return tree
         
-        # Extrair
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(extract_to)
+        # Extrair em diretório temporário e renomear (atômico)
+        tmp_tree = tempfile.mkdtemp(dir=self.trees_dir, prefix=f"{sha256}.")
+        try:
+            with zipfile.ZipFile(self.blob_path(sha256), 'r') as zip_ref:
+                zip_ref.extractall(tmp_tree)
+            os.replace(tmp_tree, tree)
+        except BaseException:
+            shutil.rmtree(tmp_tree, ignore_errors=True)
+            raise
         
-        print(f"✅ ZIP extraído em: {extract_to}")
+        log.info(f"✅ ZIP extraído em: {tree}")
+        return tree
+    
+    def package_info(self, sha256: str) -> dict:
+        """
+        Índice de módulos do pacote, calculado uma vez a partir do ZIP.
         
-        # Remover ZIP
-        os.remove(zip_path)
+        Returns:
+            {'modules': {nome: caminho no ZIP}, 'native': True se há extensões C}
+        """
+        package = self.index['packages'].setdefault(sha256, {})
         
-        return extract_to
+        if 'modules' not in package:
+            modules = {}
+            native = False
+            with zipfile.ZipFile(self.blob_path(sha256), 'r') as zip_ref:
+                for name in zip_ref.namelist():
+                    if name.endswith(NATIVE_EXTENSIONS):
+                        native = True
+                    if name.endswith('.py'):
+                        module_name = posixpath.basename(name)[:-3]
+                        # Preferir o arquivo mais próximo da raiz
+                        current = modules.get(module_name)
+                        if current is None or name.count('/') < current.count('/'):
+                            modules[module_name] = name
+            
+            package['modules'] = modules
+            package['native'] = native
+            self._save_index()
         
-    except Exception as e:
-        print(f"❌ Erro ao baixar/extrair ZIP: {e}")
-        raise
+        return package
+    
+    def _touch(self, sha256: str):
+        package = self.index['packages'].setdefault(sha256, {})
+        package['last_used'] = time.time()
+        # Recalcular o tamanho quando a árvore é extraída depois do download
+        extracted = os.path.isdir(self.tree_path(sha256))
+        if 'bytes' not in package or package.get('extracted') != extracted:
+            package['bytes'] = _disk_usage(self.blob_path(sha256)) + _disk_usage(self.tree_path(sha256))
+            package['extracted'] = extracted
+    
+    def _evict(self, keep: str):
+        """Remove pacotes menos usados até o cache caber em max_bytes."""
+        packages = self.index['packages']
+        total = sum(package.get('bytes', 0) for package in packages.values())
+        
+        for sha256 in sorted(packages, key=lambda sha: packages[sha].get('last_used', 0)):
+            if total <= self.max_bytes:
+                break
+            if sha256 == keep:
+                continue
+            
+            total -= packages.pop(sha256).get('bytes', 0)
+            shutil.rmtree(self.tree_path(sha256), ignore_errors=True)
+            if os.path.exists(self.blob_path(sha256)):
+                os.remove(self.blob_path(sha256))
+            self.index['urls'] = {
+                url: entry for url, entry in self.index['urls'].items() if entry['sha256'] != sha256
+            }
+            log.info(f"🧹 Pacote removido do cache: {sha256[:12]}")
+    
+    def fetch(self, url: str) -> str:
+        """
+        Garante que o pacote da URL esteja em cache (sem extraí-lo).
+        
+        Args:
+            url: URL do arquivo ZIP
+        
+        Returns:
+            SHA-256 do pacote (ver blob_path, extract e package_info)
+        """
+        entry = self._cached(url)
+        
+        if entry and self.max_age and time.time() - entry.get('checked_at', 0) < self.max_age:
+            log.info("♻️  Pacote em cache válido por ZIP_CACHE_MAX_AGE, sem acessar a rede")
+            return self._use(url, entry)
+        
+        headers = {}
+        if entry and entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry and entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        
+        try:
+            response = requests.get(url, headers=headers, timeout=30, stream=True)
+        except requests.RequestException as e:
+            if entry:
+                log.warning(f"⚠️  Erro ao acessar {url} ({e}), usando pacote em cache")
+                return self._use(url, entry)
+            raise
+        
+        with response:
+            if response.status_code == 304 and entry:
+                log.info("♻️  ZIP não modificado (304), usando cache")
+                entry['checked_at'] = time.time()
+                return self._use(url, entry)
+            
+            response.raise_for_status()
+            sha256 = self._download(response)
+            entry = {
+                'sha256': sha256,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'checked_at': time.time(),
+            }
+        
+        return self._use(url, entry)
+    
+    def _use(self, url: str, entry: dict) -> str:
+        self.index['urls'][url] = entry
+        self._touch(entry['sha256'])
+        self._evict(keep=entry['sha256'])
+        self._save_index()
+        return entry['sha256']
+    
+    def mark_used(self, sha256: str):
+        """Atualiza tamanho/uso do pacote (ex: após extraí-lo) e aplica o limite."""
+        self._touch(sha256)
+        self._evict(keep=sha256)
+        self._save_index()
+
+
+def _disk_usage(path: str) -> int:
+    """Tamanho em bytes de um arquivo ou diretório (recursivo)."""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for file in files:
+            total += os.path.getsize(os.path.join(root, file))
+    return total
 
 
 def load_module_from_path(module_path: str, module_name: str = 'user_module'):
@@ -118,249 +614,3332 @@ def load_module_from_path(module_path: str, module_name: str = 'user_module'):
     Returns:
         Módulo carregado
     """
-    print(f"📥 Carregando módulo de: {module_path}")
+    log.info(f"📥 Carregando módulo de: {module_path}")
     
-    spec = importlib.util.spec_from_file_location(module_name, module_path)
+    # Loader explícito: o pyfile do ConfigMap não tem extensão .py
+    loader = importlib.machinery.SourceFileLoader(module_name, module_path)
+    spec = importlib.util.spec_from_file_location(module_name, module_path, loader=loader)
     if spec is None or spec.loader is None:
         raise ImportError(f"Não foi possível carregar módulo de {module_path}")
     
     module = importlib.util.module_from_spec(spec)
+    
+    # Em caso de erro, manter o módulo anterior (recarga atômica)
+    previous = sys.modules.get(module_name)
     sys.modules[module_name] = module
-    spec.loader.exec_module(module)
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        if previous is not None:
+            sys.modules[module_name] = previous
+        else:
+            sys.modules.pop(module_name, None)
+        raise
     
-    print(f"✅ Módulo carregado: {module_name}")
+    log.info(f"✅ Módulo carregado: {module_name}")
     
     return module
 
 
-def load_user_function():
+def load_module_from_zip(module_name: str):
     """
-    Carrega a função handler do usuário.
+    Importa um módulo de um caminho ZIP já presente no sys.path (zipimport).
     
-    Estratégia:
-    1. Se ZIP_URL está definido, baixar e extrair ZIP
-    2. Caso contrário, usar pyfile montado via ConfigMap
-    3. Importar módulo e extrair função handler
+    Args:
+        module_name: Nome do módulo
     
     Returns:
-        Função handler do usuário
+        Módulo carregado
     """
+    log.info(f"📥 Importando módulo do ZIP (zipimport): {module_name}")
     
-    # Diretório temporário para extração
-    temp_dir = tempfile.mkdtemp(prefix='serverless_')
-    
+    # Em caso de erro, manter o módulo anterior (recarga atômica)
+    previous = sys.modules.pop(module_name, None)
     try:
-        # Caso 1: ZIP fornecido
-        if ZIP_URL:
-            print(f"🔧 Modo ZIP: {ZIP_URL}")
-            extract_dir = download_and_extract_zip(ZIP_URL, temp_dir)
-            
-            # Adicionar ao sys.path para permitir imports
-            sys.path.insert(0, extract_dir)
-            
-            # Parsear HANDLER_FUNCTION (formato: module.function)
-            module_name, function_name = HANDLER_FUNCTION.rsplit('.', 1)
-            
-            # Encontrar arquivo .py principal
-            module_file = None
-            for root, dirs, files in os.walk(extract_dir):
-                for file in files:
-                    if file == f"{module_name}.py":
-                        module_file = os.path.join(root, file)
-                        break
-                if module_file:
-                    break
-            
-            if not module_file:
-                raise FileNotFoundError(f"Módulo {module_name}.py não encontrado no ZIP")
-            
-            # Carregar módulo
-            module = load_module_from_path(module_file, module_name)
-            
-        # Caso 2: pyfile montado
-        else:
-            print(f"🔧 Modo PYFILE: {PYFILE_PATH}")
-            
-            if not os.path.exists(PYFILE_PATH):
-                raise FileNotFoundError(f"pyfile não encontrado em {PYFILE_PATH}")
-            
-            # Parsear HANDLER_FUNCTION
-            module_name, function_name = HANDLER_FUNCTION.rsplit('.', 1)
-            
-            # Carregar módulo
-            module = load_module_from_path(PYFILE_PATH, module_name)
+        module = importlib.import_module(module_name)
+    except BaseException:
+        if previous is not None:
+            sys.modules[module_name] = previous
+        raise
+    
+    log.info(f"✅ Módulo carregado: {module_name}")
+    
+    return module
+
+
+# Entradas do sys.path adicionadas para o pacote ZIP atual
+PACKAGE_PATHS = []
+
+
+def load_user_module(module_name: str, pyfile: str = PYFILE_PATH):
+    """
+    Carrega o módulo do usuário.
+    
+    Estratégia:
+    1. Se ZIP_URL está definido, obter o ZIP (cache local) e importar o módulo
+       direto do arquivo ou da árvore extraída
+    2. Caso contrário, usar o pyfile montado via ConfigMap
+    
+    Args:
+        module_name: Nome do módulo (parte de HANDLER_FUNCTION antes do '.')
+        pyfile: Caminho do pyfile (ignorado no modo ZIP)
+    
+    Returns:
+        Módulo carregado
+    """
+    
+    # Caso 1: ZIP fornecido
+    if ZIP_URL:
+        log.info(f"🔧 Modo ZIP: {ZIP_URL}")
+        log.info(f"📦 Obtendo ZIP de: {ZIP_URL}")
+        cache = ZipPackageCache()
+        sha256 = cache.fetch(ZIP_URL)
+        
+        # Encontrar arquivo .py principal pelo índice do pacote
+        package = cache.package_info(sha256)
+        module_file = package['modules'].get(module_name)
         
-        # Extrair função handler
-        if not hasattr(module, function_name):
-            raise AttributeError(f"Função '{function_name}' não encontrada no módulo")
+        if not module_file:
+            raise FileNotFoundError(f"Módulo {module_name}.py não encontrado no ZIP")
         
-        handler_func = getattr(module, function_name)
+        use_zipimport = ZIP_IMPORT_MODE == 'zip' or (ZIP_IMPORT_MODE == 'auto' and not package['native'])
         
-        print(f"✅ Função handler carregada: {HANDLER_FUNCTION}")
+        if use_zipimport:
+            # Importar direto do arquivo: raiz do ZIP e diretório do módulo
+            # no sys.path (ex: /app/cache/zip/blobs/<sha>.zip/src)
+            root = cache.blob_path(sha256)
+            module_dir = posixpath.dirname(module_file)
+            paths = [root] + ([f"{root}/{module_dir}"] if module_dir else [])
+        else:
+            if ZIP_IMPORT_MODE == 'auto':
+                log.info("📦 Pacote com extensões C, extraindo para o disco")
+            root = cache.extract(sha256)
+            paths = [root]
         
-        return handler_func
+        cache.mark_used(sha256)
         
-    except Exception as e:
-        print(f"❌ Erro ao carregar função: {e}")
-        raise
+        # Adicionar ao sys.path para permitir imports
+        for path in paths:
+            sys.path.insert(0, path)
+            PACKAGE_PATHS.append(path)
+        
+        # Carregar módulo
+        if use_zipimport:
+            return load_module_from_zip(module_name)
+        return load_module_from_path(os.path.join(root, module_file), module_name)
     
-    # Note: Não removemos temp_dir aqui pois o módulo precisa estar acessível
-
+    # Caso 2: pyfile montado
+    log.info(f"🔧 Modo PYFILE: {pyfile}")
+    
+    if not os.path.exists(pyfile):
+        raise FileNotFoundError(f"pyfile não encontrado em {pyfile}")
+    
+    return load_module_from_path(pyfile, module_name)
 
-# ============================================================================
-# RUNTIME PRINCIPAL
-# ============================================================================
 
-def check_data_changed(redis_client, last_data: dict, current_data: dict) -> bool:
+def resolve_user_functions(module, handler: str = HANDLER_FUNCTION):
     """
-    Verifica se os dados mudaram desde a última execução.
+    Extrai do módulo a função handler e a função de lote opcional
+    (HANDLER_BATCH_FUNCTION).
     
     Args:
-        redis_client: Cliente Redis
-        last_data: Dados da última execução
-        current_data: Dados atuais
+        module: Módulo do usuário
+        handler: Especificação module.function
     
     Returns:
-        True se dados mudaram, False caso contrário
+        Tupla (função handler, função de lote ou None)
     """
+    module_name, function_name = handler.rsplit('.', 1)
     
-    if last_data is None:
-        return True
+    if not hasattr(module, function_name):
+        raise AttributeError(f"Função '{function_name}' não encontrada no módulo")
     
-    # Comparar timestamps
-    last_ts = last_data.get('timestamp', '')
-    current_ts = current_data.get('timestamp', '')
+    handler_func = getattr(module, function_name)
     
-    return last_ts != current_ts
+    log.info(f"✅ Função handler carregada: {handler}")
+    
+    # Função de lote (opcional)
+    batch_func = getattr(module, HANDLER_BATCH_FUNCTION, None) if HANDLER_BATCH_FUNCTION else None
+    if batch_func is not None:
+        log.info(f"✅ Função de lote carregada: {module_name}.{HANDLER_BATCH_FUNCTION}")
+    
+    return handler_func, batch_func
 
 
-def main():
+def load_user_function(handler: str = HANDLER_FUNCTION, pyfile: str = PYFILE_PATH):
     """
-    Loop principal do runtime serverless.
+    Carrega a função handler do usuário.
     
-    Fluxo:
-    1. Conectar ao Redis
-    2. Carregar função do usuário
-    3. Loop infinito:
-       a. Ler dados do Redis
-       b. Verificar se mudaram
-       c. Chamar handler
-       d. Persistir context.env
-       e. Salvar resultado no Redis
-       f. Sleep(MONITORING_PERIOD)
-    """
-    
-    print("=" * 80)
-    print("🚀 Runtime Serverless Customizado - TP3")
-    print("=" * 80)
-    print(f"📍 Redis: {REDIS_HOST}:{REDIS_PORT}")
-    print(f"📥 Input Key: {REDIS_INPUT_KEY}")
-    print(f"📤 Output Key: {REDIS_OUTPUT_KEY}")
-    print(f"⏱️  Monitoring Period: {MONITORING_PERIOD}s")
-    print(f"🔧 Handler Function: {HANDLER_FUNCTION}")
-    if ZIP_URL:
-        print(f"📦 ZIP URL: {ZIP_URL}")
-    print("=" * 80)
+    Args:
+        handler: Especificação module.function (padrão: HANDLER_FUNCTION)
+        pyfile: Caminho do pyfile (ignorado no modo ZIP)
     
-    # Conectar ao Redis
-    print("\n🔌 Conectando ao Redis...")
-    try:
-        redis_client = redis.Redis(
-            host=REDIS_HOST,
-            port=REDIS_PORT,
-            decode_responses=True,
-            socket_connect_timeout=10
-        )
-        redis_client.ping()
-        print("✅ Conectado ao Redis com sucesso!")
-    except Exception as e:
-        print(f"❌ Erro ao conectar ao Redis: {e}")
-        sys.exit(1)
+    Returns:
+        Tupla (função handler, função de lote ou None)
+    """
     
-    # Carregar função do usuário
-    print("\n📚 Carregando função do usuário...")
     try:
-        handler_function = load_user_function()
+        module = load_user_module(handler.rsplit('.', 1)[0], pyfile)
+        return resolve_user_functions(module, handler)
     except Exception as e:
-        print(f"❌ Erro ao carregar função: {e}")
-        sys.exit(1)
+        log.error(f"❌ Erro ao carregar função: {e}")
+        raise
+
+
+class HandlerWatcher:
+    """
+    Detecta mudanças no código do handler e o recarrega entre invocações.
+    
+    - pyfile: compara mtime/tamanho a cada RELOAD_CHECK_INTERVAL e, se
+      mudaram, o hash SHA-256 do conteúdo (ConfigMaps atualizam o arquivo
+      trocando um symlink, o que altera o mtime)
+    - ZIP: faz HEAD em ZIP_URL a cada RELOAD_ZIP_CHECK_INTERVAL e compara
+      ETag/Last-Modified/Content-Length
+    
+    A recarga é atômica: se o novo código falhar ao importar, o handler
+    anterior continua em uso. context.env não é tocado.
     
-    # Criar contexto
-    context = Context()
+    Args:
+        pyfile: Caminho do pyfile observado (ignorado no modo ZIP)
+        module_names: Módulos carregados desta origem (recarregados juntos)
+    """
     
-    # Estado
-    last_data = None
-    execution_count = 0
+    def __init__(self, pyfile: str = PYFILE_PATH, module_names=None):
+        self.pyfile = pyfile
+        self.module_names = list(module_names or [HANDLER_FUNCTION.rsplit('.', 1)[0]])
+        self.interval = RELOAD_ZIP_CHECK_INTERVAL if ZIP_URL else RELOAD_CHECK_INTERVAL
+        self.next_check = time.monotonic() + self.interval
+        self.stat = None
+        self.fingerprint = None
+        self.refresh()
     
-    print("\n✨ Runtime iniciado! Aguardando dados...\n")
+    def _pyfile_fingerprint(self):
+        st = os.stat(self.pyfile)
+        stat = (st.st_mtime, st.st_size)
+        if stat == self.stat and self.fingerprint is not None:
+            return self.fingerprint
+        
+        self.stat = stat
+        with open(self.pyfile, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
     
-    # Loop principal
-    while True:
+    def _zip_fingerprint(self):
+        response = requests.head(ZIP_URL, timeout=10, allow_redirects=True)
+        response.raise_for_status()
+        headers = response.headers
+        fingerprint = headers.get('ETag') or headers.get('Last-Modified') or headers.get('Content-Length')
+        return fingerprint or self.fingerprint
+    
+    def current_fingerprint(self):
+        """Identificador da versão atual do código (hash, ETag ou Last-Modified)."""
+        return self._zip_fingerprint() if ZIP_URL else self._pyfile_fingerprint()
+    
+    def refresh(self):
+        """Registra a versão atual como a carregada."""
         try:
-            # Ler dados do Redis
-            raw_data = redis_client.get(REDIS_INPUT_KEY)
-            
-            if not raw_data:
-                print(f"⏳ [{datetime.now().strftime('%H:%M:%S')}] Aguardando dados em '{REDIS_INPUT_KEY}'...")
-                time.sleep(MONITORING_PERIOD)
-                continue
-            
-            # Parse JSON
-            try:
-                current_data = json.loads(raw_data)
-            except json.JSONDecodeError as e:
-                print(f"❌ Erro ao parsear JSON: {e}")
-                time.sleep(MONITORING_PERIOD)
-                continue
-            
-            # Verificar se dados mudaram
-            if not check_data_changed(redis_client, last_data, current_data):
-                # Dados não mudaram, skip
-                time.sleep(MONITORING_PERIOD)
-                continue
-            
-            # Dados mudaram, executar handler
-            execution_count += 1
-            timestamp = datetime.now().strftime('%H:%M:%S')
-            
-            print(f"▶️  [{timestamp}] Execução #{execution_count}: Chamando handler...")
-            
-            # Atualizar metadados do contexto
-            context.last_execution = datetime.now().isoformat()
-            
-            # Chamar handler do usuário
-            start_time = time.time()
-            result = handler_function(current_data, context)
-            elapsed_time = time.time() - start_time
-            
-            # Validar resultado
-            if not isinstance(result, dict):
-                print(f"⚠️  Aviso: Handler retornou {type(result)}, esperado dict")
-                result = {'error': 'Handler deve retornar dict', 'result': str(result)}
-            
-            # Salvar resultado no Redis
-            result_json = json.dumps(result)
-            redis_client.set(REDIS_OUTPUT_KEY, result_json)
-            
-            print(f"✅ [{timestamp}] Execução concluída em {elapsed_time:.3f}s")
-            print(f"   📊 Resultado: {len(result)} chaves | {len(result_json)} bytes")
-            
-            # Atualizar last_data
-            last_data = current_data
-            
-        except KeyboardInterrupt:
-            print("\n\n⚠️  Runtime interrompido pelo usuário")
-            break
-            
+            self.fingerprint = self.current_fingerprint()
+        except Exception as e:
+            log.warning(f"⚠️  Não foi possível obter a versão do handler para hot reload: {e}")
+    
+    def mtime(self):
+        """mtime do pyfile carregado (None no modo ZIP)."""
+        return self.stat[0] if self.stat else None
+    
+    def check(self):
+        """
+        Verifica (se já passou o intervalo) e recarrega os módulos se mudaram.
+        
+        Returns:
+            Dicionário nome -> módulo recarregado, ou None se nada mudou
+        """
+        if time.monotonic() < self.next_check:
+            return None
+        self.next_check = time.monotonic() + self.interval
+        
+        try:
+            fingerprint = self.current_fingerprint()
+        except Exception as e:
+            log.warning(f"⚠️  Erro ao verificar mudanças no handler: {e}")
+            return None
+        
+        if fingerprint is None or fingerprint == self.fingerprint:
+            return None
+        
+        log.info("🔄 Mudança detectada no código do handler, recarregando...")
+        
+        # No modo ZIP, módulos auxiliares do pacote anterior também precisam
+        # ser reimportados do novo diretório
+        old_dirs = list(PACKAGE_PATHS)
+        old_modules = {
+            name: module for name, module in list(sys.modules.items())
+            if any((getattr(module, '__file__', None) or '').startswith(path) for path in old_dirs)
+        }
+        for name in old_modules:
+            if name not in self.module_names:
+                sys.modules.pop(name, None)
+        
+        previous = {name: sys.modules.get(name) for name in self.module_names}
+        try:
+            modules = {name: load_user_module(name, self.pyfile) for name in self.module_names}
         except Exception as e:
-            print(f"❌ Erro durante execução: {e}")
-            import traceback
-            traceback.print_exc()
+            log.error(f"❌ Recarga falhou, mantendo handler anterior: {e}")
+            for name, module in old_modules.items():
+                sys.modules.setdefault(name, module)
+            for name, module in previous.items():
+                if module is not None:
+                    sys.modules[name] = module
+            while len(PACKAGE_PATHS) > len(old_dirs):
+                path = PACKAGE_PATHS.pop()
+                if path in sys.path:
+                    sys.path.remove(path)
+            for path in old_dirs:
+                if path not in sys.path:
+                    sys.path.insert(0, path)
+            # Não tentar de novo a mesma versão com erro
+            self.fingerprint = fingerprint
+            return None
+        
+        # Manter no sys.path apenas os caminhos do pacote novo
+        current = PACKAGE_PATHS[len(old_dirs):]
+        for path in old_dirs:
+            while path not in current and path in sys.path:
+                sys.path.remove(path)
+        PACKAGE_PATHS[:] = current
         
-        # Aguardar próxima execução
-        time.sleep(MONITORING_PERIOD)
+        self.fingerprint = fingerprint
+        log.info("✅ Handler recarregado sem reiniciar o runtime")
+        return modules
+
+
+# ============================================================================
+# PERSISTÊNCIA DE ESTADO (context.env)
+# ============================================================================
+
+STATE_META_FIELD = '__meta__'
+
+
+def encode_env(env: dict) -> dict:
+    """
+    Serializa context.env em formato binário compacto.
+    
+    Cada chave de primeiro nível vira um blob pickle comprimido com zlib, o
+    que permite restaurar as demais chaves se uma delas não puder ser lida
+    (ex: classe removida do módulo do usuário).
+    
+    Returns:
+        Dicionário campo -> bytes
+    """
+    fields = {}
+    for key, value in env.items():
+        if not isinstance(key, str):
+            log.warning(f"⚠️  Chave não-string em context.env ignorada no checkpoint: {key!r}")
+            continue
+        try:
+            fields[key] = zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), 1)
+        except Exception as e:
+            # Ex: objetos de uma versão anterior do módulo após hot reload
+            log.warning(f"⚠️  context.env['{key}'] não serializável, ignorado no checkpoint: {e}")
+    return fields
+
+
+def decode_env(fields: dict) -> dict:
+    """Reconstrói context.env a partir dos blobs de encode_env."""
+    env = {}
+    for key, blob in fields.items():
+        if isinstance(key, bytes):
+            key = key.decode()
+        if key == STATE_META_FIELD:
+            continue
+        try:
+            env[key] = pickle.loads(zlib.decompress(blob))
+        except Exception as e:
+            log.warning(f"⚠️  Não foi possível restaurar context.env['{key}']: {e}")
+    return env
+
+
+class RedisStateBackend:
+    """
+    Guarda context.env em um hash Redis (um campo por chave de primeiro nível).
+    
+    Usa uma conexão sem decode_responses, pois os valores são binários
+    (compartilhada entre as funções de um manifesto).
+    """
+    
+    name = 'redis'
     
-    print("\n👋 Runtime encerrado")
+    def __init__(self, key: str = STATE_KEY, redis_client=None):
+        self.key = key
+        self.redis_client = redis_client or create_state_redis_client()
+    
+    def save(self, fields: dict):
+        # Substituir o hash inteiro atomicamente (remove chaves apagadas do env)
+        pipe = self.redis_client.pipeline(transaction=True)
+        pipe.delete(self.key)
+        pipe.hset(self.key, mapping=fields)
+        pipe.execute()
+    
+    def load(self) -> dict:
+        return self.redis_client.hgetall(self.key)
+
+
+class FileStateBackend:
+    """Guarda context.env em um arquivo local (ex: volume persistente)."""
+    
+    name = 'file'
+    
+    def __init__(self, path: str = STATE_FILE):
+        self.path = path
+    
+    def save(self, fields: dict):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        
+        # Escrita atômica: arquivo temporário + rename
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(fields, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
+    
+    def load(self) -> dict:
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, 'rb') as f:
+            return pickle.load(f)
+
+
+def create_state_redis_client():
+    """Conexão Redis binária (sem decode_responses) para o estado."""
+    return redis.Redis(
+        host=REDIS_HOST,
+        port=REDIS_PORT,
+        socket_connect_timeout=10
+    )
+
+
+def create_state_backend(mode: str = STATE_BACKEND, key: str = STATE_KEY,
+                         path: str = STATE_FILE, redis_client=None):
+    """Cria o backend de estado conforme STATE_BACKEND (ou None se desabilitado)."""
+    if mode == 'redis':
+        return RedisStateBackend(key, redis_client)
+    if mode == 'file':
+        return FileStateBackend(path)
+    if mode != 'none':
+        log.warning(f"⚠️  STATE_BACKEND desconhecido '{mode}'. Estado não será persistido.")
+    return None
+
+
+class Checkpointer:
+    """
+    Salva context.env periodicamente e o restaura na inicialização.
+    
+    A serialização acontece no loop principal (snapshot consistente entre
+    invocações); com CHECKPOINT_ASYNC a escrita vai para uma thread dedicada.
+    Se a escrita anterior ainda não terminou, o checkpoint é adiado para a
+    próxima execução. O custo de cada checkpoint é medido e reportado.
+    """
+    
+    def __init__(self, backend, every: int = CHECKPOINT_EVERY, async_write: bool = CHECKPOINT_ASYNC):
+        self.backend = backend
+        self.every = max(1, every)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='checkpoint') if async_write else None
+        self.pending = None
+        self.last_execution_count = 0
+        self.checkpoints = 0
+        self.total_encode_time = 0.0
+        self.total_write_time = 0.0
+    
+    def restore(self, context):
+        """Carrega o último checkpoint em context.env (warm start)."""
+        start_time = time.time()
+        try:
+            fields = self.backend.load()
+        except Exception as e:
+            log.warning(f"⚠️  Erro ao carregar estado ({self.backend.name}): {e}")
+            return
+        
+        if not fields:
+            log.info(f"💾 Nenhum estado salvo ({self.backend.name}), iniciando com context.env vazio")
+            return
+        
+        context.env = decode_env(fields)
+        elapsed_time = time.time() - start_time
+        
+        meta = fields.get(STATE_META_FIELD) or fields.get(STATE_META_FIELD.encode())
+        saved_at = json.loads(meta).get('saved_at', '?') if meta else '?'
+        log.info(f"💾 Estado restaurado ({self.backend.name}): {len(context.env)} chaves, "
+                 f"salvo em {saved_at}, em {elapsed_time * 1000:.1f}ms")
+    
+    def _write(self, fields: dict, encode_time: float, size: int):
+        start_time = time.time()
+        try:
+            self.backend.save(fields)
+        except Exception as e:
+            log.error(f"❌ Erro ao salvar checkpoint ({self.backend.name}): {e}")
+            return
+        write_time = time.time() - start_time
+        
+        self.checkpoints += 1
+        self.total_encode_time += encode_time
+        self.total_write_time += write_time
+        log.debug(f"💾 Checkpoint #{self.checkpoints}: {size} bytes | "
+                  f"serialização {encode_time * 1000:.1f}ms | escrita {write_time * 1000:.1f}ms | "
+                  f"média {(self.total_encode_time + self.total_write_time) / self.checkpoints * 1000:.1f}ms")
+    
+    def checkpoint(self, context, execution_count: int):
+        """Serializa context.env e grava (síncrono ou em background)."""
+        if self.pending is not None and not self.pending.done():
+            return
+        
+        start_time = time.time()
+        fields = encode_env(context.env)
+        fields[STATE_META_FIELD] = json.dumps({
+            'saved_at': datetime.now().isoformat(),
+            'execution_count': execution_count,
+            'handler': context.function_name,
+        }).encode()
+        encode_time = time.time() - start_time
+        size = sum(len(blob) for blob in fields.values())
+        
+        self.last_execution_count = execution_count
+        if self.executor is not None:
+            self.pending = self.executor.submit(self._write, fields, encode_time, size)
+        else:
+            self._write(fields, encode_time, size)
+    
+    def maybe_checkpoint(self, context, execution_count: int):
+        """Faz checkpoint a cada CHECKPOINT_EVERY execuções."""
+        if execution_count - self.last_execution_count >= self.every:
+            self.checkpoint(context, execution_count)
+    
+    def close(self, context, execution_count: int):
+        """Checkpoint final (síncrono) no encerramento do runtime."""
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+        self.pending = None
+        if execution_count > self.last_execution_count:
+            self.checkpoint(context, execution_count)
+
+
+# ============================================================================
+# FONTES DE ENTRADA (INGESTÃO)
+# ============================================================================
+
+# Retorna, para cada chave de entrada, {} (sem valor), {token} (sem mudança:
+# o token é igual ao ARGV) ou {token, valor}. O token é a versão (KEYS[n+i],
+# se houver chaves de versão e ela existir) ou o SHA1 do valor. Uma leitura
+# sem mudança custa um round-trip com ~40 bytes de resposta.
+CHANGE_SCRIPT = """
+local n = #ARGV
+local result = {}
+for i = 1, n do
+    local token = false
+    local value = false
+    if KEYS[n + i] then
+        token = redis.call('GET', KEYS[n + i])
+    end
+    if not token then
+        value = redis.call('GET', KEYS[i])
+        if value then
+            token = redis.sha1hex(value)
+        end
+    end
+    if token and token == ARGV[i] then
+        result[i] = {token}
+    else
+        if token and not value then
+            value = redis.call('GET', KEYS[i])
+        end
+        if value then
+            result[i] = {token, value}
+        else
+            result[i] = {}
+        end
+    end
+end
+return result
+"""
+
+# Payload de uma entrada que não mudou desde a última confirmada (sem parse)
+UNCHANGED = object()
+
+
+def change_keys(keys: list, detection: str = CHANGE_DETECTION) -> list:
+    """KEYS do CHANGE_SCRIPT: chaves de entrada (+ chaves de versão)."""
+    if detection == 'version':
+        return list(keys) + [f"{key}{CHANGE_VERSION_SUFFIX}" for key in keys]
+    return list(keys)
+
+
+def change_entries(reply) -> list:
+    """Converte a resposta do CHANGE_SCRIPT para uma chave em entradas (token, payload)."""
+    if not reply:
+        return []
+    if len(reply) == 1:
+        return [(reply[0], UNCHANGED)]
+    return [(reply[0], reply[1])]
+
+
+def create_change_script(redis_client, detection: str = CHANGE_DETECTION):
+    """Registra o CHANGE_SCRIPT (EVALSHA) se a detecção usa o servidor."""
+    if detection in ('digest', 'version'):
+        return redis_client.register_script(CHANGE_SCRIPT)
+    return None
+
+
+def change_script_failed(error) -> str:
+    """Registra a falha do script (scripting desabilitado) e retorna o fallback."""
+    log.warning(f"⚠️  Detecção de mudança no servidor indisponível ({str(error).splitlines()[0]}). "
+                "Comparando os bytes da entrada.")
+    return 'raw'
+
+
+class PollingSource:
+    """
+    Fonte de entrada por polling: GET na chave a cada MONITORING_PERIOD.
+    
+    É o comportamento original do runtime e o fallback dos modos orientados
+    a eventos quando o servidor Redis não os suporta.
+    
+    Todas as fontes expõem a mesma interface:
+    - read(): lista de pares (entry_id, payload bruto); vazia se não há dados
+    - poll(): como read(), mas sem aguardar (usado pelo scheduler multi-função)
+    - ack(entry_ids): confirma entradas processadas (no-op em 'list')
+    - close(): libera recursos
+    
+    Com CHANGE_DETECTION 'digest'/'version', a leitura usa o CHANGE_SCRIPT:
+    se o valor não mudou desde a última entrada confirmada, só o token volta
+    do servidor e a entrada é (token, UNCHANGED), descartada sem parse.
+    """
+    
+    name = 'poll'
+    
+    def __init__(self, redis_client, key: str, period: float,
+                 detection: str = CHANGE_DETECTION):
+        self.redis_client = redis_client
+        self.key = key
+        self.period = period
+        self.schedule = None  # ArrivalEstimator (ADAPTIVE_PERIOD)
+        self.detection = detection
+        self.token = b''  # versão/digest da última entrada confirmada
+        self.script = create_change_script(redis_client, detection)
+        self.last_read_seconds = None
+        self._first_read = True
+    
+    def wait(self):
+        """Aguarda até o momento da próxima leitura."""
+        time.sleep(self.schedule.next_delay() if self.schedule else self.period)
+    
+    def read(self):
+        """
+        Retorna o payload bruto atual da chave de entrada.
+        
+        A primeira leitura é imediata; as seguintes aguardam wait().
+        """
+        if self._first_read:
+            self._first_read = False
+        else:
+            self.wait()
+        
+        return self.poll()
+    
+    def poll(self):
+        """Lê a chave imediatamente (a latência fica em last_read_seconds)."""
+        start = time.perf_counter()
+        try:
+            if self.script is not None:
+                try:
+                    reply = self.script(keys=change_keys([self.key], self.detection), args=[self.token])
+                    return change_entries(reply[0])
+                except redis.exceptions.ResponseError as e:
+                    self.detection = change_script_failed(e)
+                    self.script = None
+            
+            raw_data = self.redis_client.get(self.key)
+            return [(None, raw_data)] if raw_data else []
+        finally:
+            self.last_read_seconds = time.perf_counter() - start
+    
+    def ack(self, entry_ids):
+        """Guarda o token da entrada processada (a próxima leitura só traz o valor se mudar)."""
+        for entry_id in entry_ids:
+            if entry_id is not None:
+                self.token = entry_id
+    
+    def close(self):
+        pass
+
+
+class KeyspaceNotificationSource(PollingSource):
+    """
+    Fonte de entrada orientada a eventos via keyspace notifications.
+    
+    Assina o canal __keyspace@<db>__:<key> e lê a chave assim que o coletor
+    a escreve. Se nenhum evento chegar em MONITORING_PERIOD, a chave é lida
+    mesmo assim, o que cobre notificações perdidas (ex: reconexão).
+    """
+    
+    name = 'notify'
+    
+    def __init__(self, redis_client, key: str, period: float):
+        super().__init__(redis_client, key, period)
+        
+        db = redis_client.connection_pool.connection_kwargs.get('db', 0)
+        self.channel = f"__keyspace@{db}__:{key}"
+        self.pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+        self.pubsub.subscribe(self.channel)
+    
+    def wait(self):
+        """Bloqueia até uma notificação na chave ou até o timeout."""
+        deadline = time.monotonic() + self.period
+        
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            
+            message = self.pubsub.get_message(timeout=remaining)
+            if message and message.get('type') == 'message':
+                # Descartar eventos acumulados: uma leitura basta
+                while self.pubsub.get_message(timeout=0):
+                    pass
+                return
+    
+    def close(self):
+        try:
+            self.pubsub.close()
+        except Exception:
+            pass
+
+
+class ListSource:
+    """
+    Fonte de entrada baseada em lista: BLPOP na chave de entrada.
+    
+    O coletor deve fazer RPUSH de cada amostra; o runtime recebe cada uma
+    assim que ela chega, sem intervalo fixo de polling. Se houver amostras
+    acumuladas, até batch_size delas são retiradas de uma vez.
+    """
+    
+    name = 'list'
+    
+    def __init__(self, redis_client, key: str, period: float,
+                 batch_size: int = HANDLER_BATCH_SIZE):
+        self.redis_client = redis_client
+        self.key = key
+        self.period = period
+        self.batch_size = batch_size
+        self._lpop_count_supported = True
+    
+    def read(self):
+        """Bloqueia até MONITORING_PERIOD por um item da lista."""
+        item = self.redis_client.blpop([self.key], timeout=self.period)
+        if item is None:
+            return []
+        
+        _, raw_data = item
+        return [(None, raw_data)] + self._pop(self.batch_size - 1)
+    
+    def poll(self):
+        """Retira até batch_size itens sem bloquear."""
+        return self._pop(self.batch_size)
+    
+    def _pop(self, count: int):
+        """LPOP de até count itens (LPOP com count requer Redis >= 6.2)."""
+        if count < 1:
+            return []
+        
+        if count > 1 and self._lpop_count_supported:
+            try:
+                items = self.redis_client.lpop(self.key, count)
+                return [(None, raw) for raw in items or []]
+            except redis.exceptions.ResponseError:
+                self._lpop_count_supported = False
+        
+        raw_data = self.redis_client.lpop(self.key)
+        return [(None, raw_data)] if raw_data is not None else []
+    
+    def ack(self, entry_ids):
+        pass
+    
+    def close(self):
+        pass
+
+
+class StreamSource:
+    """
+    Fonte de entrada baseada em Redis Stream com consumer group.
+    
+    Cada amostra é uma entrada do stream (XADD com o JSON no campo
+    STREAM_FIELD) e é confirmada com XACK somente após o handler executar,
+    então nenhuma amostra é perdida entre leituras. Vários runtimes com o
+    mesmo STREAM_GROUP e STREAM_CONSUMER distintos dividem o stream entre si.
+    
+    Recuperação de pendentes:
+    - Entradas entregues a este consumidor e não confirmadas (ex: crash ou
+      erro no handler) são relidas antes de novas entradas
+    - Entradas paradas em outros consumidores por mais de STREAM_CLAIM_IDLE_MS
+      são reivindicadas com XAUTOCLAIM (Redis >= 6.2)
+    - Entradas entregues mais de STREAM_MAX_DELIVERIES vezes são descartadas
+    """
+    
+    name = 'stream'
+    
+    def __init__(self, redis_client, key: str, period: float,
+                 group: str = STREAM_GROUP, consumer: str = STREAM_CONSUMER,
+                 batch_size: int = STREAM_BATCH_SIZE):
+        self.redis_client = redis_client
+        self.key = key
+        self.period = period
+        self.group = group
+        self.consumer = consumer
+        self.batch_size = batch_size
+        self.claim_idle_ms = STREAM_CLAIM_IDLE_MS
+        self.max_deliveries = STREAM_MAX_DELIVERIES
+        
+        self._check_pending = True
+        self._inflight = []
+        self._autoclaim_supported = True
+        
+        try:
+            redis_client.xgroup_create(key, group, id='0', mkstream=True)
+            log.info(f"✅ Consumer group '{group}' criado em '{key}'")
+        except redis.exceptions.ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+    
+    def _to_entries(self, messages):
+        """Converte entradas do stream em pares (entry_id, payload bruto)."""
+        entries = []
+        for entry_id, fields in messages:
+            if fields is None:
+                # Entrada removida do stream (XTRIM) enquanto pendente
+                self.redis_client.xack(self.key, self.group, entry_id)
+                continue
+            
+            raw_data = fields.get(STREAM_FIELD.encode(), fields.get(STREAM_FIELD))
+            if raw_data is None:
+                log.warning(f"⚠️  Entrada {_text(entry_id)} sem campo '{STREAM_FIELD}', descartando")
+                self.redis_client.xack(self.key, self.group, entry_id)
+                continue
+            
+            entries.append((entry_id, raw_data))
+        return entries
+    
+    def _drop_poison_entries(self):
+        """Confirma (descarta) pendentes entregues vezes demais a este consumidor."""
+        pending = self.redis_client.xpending_range(
+            self.key, self.group, min='-', max='+',
+            count=self.batch_size, consumername=self.consumer
+        )
+        for entry in pending:
+            if entry['times_delivered'] > self.max_deliveries:
+                log.warning(f"⚠️  Entrada {_text(entry['message_id'])} entregue "
+                            f"{entry['times_delivered']}x, descartando")
+                self.redis_client.xack(self.key, self.group, entry['message_id'])
+    
+    def _read_pending(self):
+        """Relê entradas já entregues a este consumidor e não confirmadas."""
+        self._drop_poison_entries()
+        
+        response = self.redis_client.xreadgroup(
+            self.group, self.consumer, {self.key: '0'}, count=self.batch_size
+        )
+        messages = response[0][1] if response else []
+        return self._to_entries(messages)
+    
+    def _claim_stale(self):
+        """Reivindica entradas paradas em consumidores inativos."""
+        if not self._autoclaim_supported:
+            return []
+        
+        try:
+            response = self.redis_client.xautoclaim(
+                self.key, self.group, self.consumer,
+                min_idle_time=self.claim_idle_ms, start_id='0-0',
+                count=self.batch_size
+            )
+        except redis.exceptions.ResponseError:
+            log.warning("⚠️  XAUTOCLAIM não suportado (Redis < 6.2), sem recuperação entre consumidores")
+            self._autoclaim_supported = False
+            return []
+        
+        return self._to_entries(response[1])
+    
+    def poll(self):
+        """Como read(), sem bloquear aguardando novas entradas."""
+        return self.read(block=False)
+    
+    def read(self, block: bool = True):
+        """
+        Lê até STREAM_BATCH_SIZE entradas: pendentes primeiro, depois novas.
+        
+        Bloqueia até MONITORING_PERIOD aguardando novas entradas.
+        """
+        # Lote anterior não confirmado (erro no handler): reprocessar
+        if self._inflight:
+            self._check_pending = True
+        
+        entries = []
+        if self._check_pending:
+            entries = self._read_pending() or self._claim_stale()
+            if not entries:
+                self._check_pending = False
+        
+        if not entries:
+            response = self.redis_client.xreadgroup(
+                self.group, self.consumer, {self.key: '>'},
+                count=self.batch_size, block=int(self.period * 1000) if block else None
+            )
+            messages = response[0][1] if response else []
+            entries = self._to_entries(messages)
+            
+            if not entries:
+                # Ocioso: aproveitar para recuperar entradas de consumidores mortos
+                self._check_pending = True
+        
+        self._inflight = [entry_id for entry_id, _ in entries]
+        return entries
+    
+    def ack(self, entry_ids):
+        """Confirma as entradas processadas (XACK)."""
+        entry_ids = [entry_id for entry_id in entry_ids if entry_id is not None]
+        if entry_ids:
+            self.redis_client.xack(self.key, self.group, *entry_ids)
+        self._inflight = [entry_id for entry_id in self._inflight if entry_id not in entry_ids]
+    
+    def close(self):
+        pass
+
+
+def keyspace_notifications_enabled(redis_client) -> bool:
+    """
+    Verifica se o servidor publica keyspace notifications para comandos de string.
+    
+    Returns:
+        True se 'notify-keyspace-events' contém K e ($ ou A), ou se não for
+        possível consultar a configuração (CONFIG desabilitado em Redis gerenciados)
+    """
+    try:
+        config = redis_client.config_get('notify-keyspace-events')
+    except redis.exceptions.ResponseError:
+        return True
+    
+    flags = _text(config.get('notify-keyspace-events', config.get(b'notify-keyspace-events', '')))
+    return 'K' in flags and ('$' in flags or 'A' in flags)
+
+
+def create_input_source(redis_client, mode: str = INGEST_MODE,
+                        key: str = REDIS_INPUT_KEY, period: float = MONITORING_PERIOD):
+    """
+    Cria a fonte de entrada conforme INGEST_MODE.
+    
+    Args:
+        redis_client: Cliente Redis
+        mode: 'poll', 'notify', 'list' ou 'stream'
+        key: Chave de entrada
+        period: Período de polling / timeout de bloqueio (segundos)
+    
+    Returns:
+        Fonte de entrada com os métodos read(), poll(), ack() e close()
+    """
+    
+    if mode == 'notify':
+        if keyspace_notifications_enabled(redis_client):
+            return KeyspaceNotificationSource(redis_client, key, period)
+        
+        log.warning("⚠️  Keyspace notifications desabilitadas no Redis "
+                    "(notify-keyspace-events sem 'K$'). Usando polling.")
+        return PollingSource(redis_client, key, period)
+    
+    if mode == 'list':
+        return ListSource(redis_client, key, period)
+    
+    if mode == 'stream':
+        return StreamSource(redis_client, key, period)
+    
+    if mode != 'poll':
+        log.warning(f"⚠️  INGEST_MODE desconhecido '{mode}'. Usando polling.")
+    
+    return PollingSource(redis_client, key, period)
+
+
+# ============================================================================
+# PERÍODO ADAPTATIVO (modo 'poll')
+# ============================================================================
+
+def parse_sample_time(value):
+    """
+    Converte o campo 'timestamp' de uma amostra em epoch (s).
+    
+    Aceita números (epoch) e strings ISO 8601 / "YYYY-MM-DD HH:MM:SS.ffffff"
+    (formato do coletor; sem fuso, interpretadas como UTC, como no handler da
+    Task 1). Retorna None se o formato não for reconhecido.
+    """
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, bytes):
+        value = value.decode()
+    if not isinstance(value, str) or not value:
+        return None
+    
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+class ArrivalEstimator:
+    """
+    Estima quando o produtor publica a próxima amostra e agenda a leitura
+    logo depois dela.
+    
+    - intervalo: menor intervalo entre timestamps consecutivos de uma janela
+      recente (amostras puladas aparecem como múltiplos dele)
+    - offset: menor diferença entre o horário local da leitura e o timestamp
+      da amostra (atraso mínimo + diferença de relógio entre as máquinas)
+    - próxima leitura: timestamp + intervalo + offset + margem, com jitter
+    - sem dado novo: backoff exponencial a partir da margem, até max_period
+    - enquanto aprende (menos de 3 intervalos) lê a cada period / 4, e a cada
+      PROBE_EVERY leituras seguidas com dado novo antecipa uma leitura para a
+      metade do intervalo, detectando um produtor que passou a publicar mais
+      rápido
+    
+    Métricas (stats()): intervalo estimado, drift (quanto depois da
+    disponibilidade a amostra foi lida), amostras puladas pelo produtor entre
+    leituras, leituras duplicadas (sem dado novo) e leituras ociosas.
+    """
+    
+    WINDOW = 8
+    LEARN_SAMPLES = 3
+    PROBE_EVERY = 50
+    
+    def __init__(self, period: float, margin: float = ADAPTIVE_MARGIN,
+                 jitter: float = ADAPTIVE_JITTER, max_period: float = ADAPTIVE_MAX_PERIOD):
+        self.period = period
+        self.margin = margin
+        self.jitter = jitter
+        self.max_period = max(max_period, period)
+        self.gaps = deque(maxlen=self.WINDOW)
+        self.offsets = deque(maxlen=self.WINDOW * 4)
+        self.last_time = None
+        self.interval = None
+        self.drift = 0.0
+        self.skipped = 0
+        self.duplicates = 0
+        self.idle_reads = 0
+        self.misses = 0
+        self.fresh_streak = 0
+        self.last_delay = period
+        self._fresh = False
+    
+    def observe(self, sample: dict, received: float = None):
+        """Registra uma amostra nova lida da fonte."""
+        sample_time = parse_sample_time(sample.get('timestamp'))
+        if sample_time is None:
+            return
+        received = time.time() if received is None else received
+        
+        self.offsets.append(received - sample_time)
+        offset = min(self.offsets)
+        self.drift = 0.8 * self.drift + 0.2 * (received - sample_time - offset)
+        
+        if self.last_time is not None and sample_time > self.last_time:
+            gap = sample_time - self.last_time
+            if self.interval and gap > 1.5 * self.interval:
+                self.skipped += round(gap / self.interval) - 1
+            self.gaps.append(gap)
+            if len(self.gaps) >= self.LEARN_SAMPLES:
+                self.interval = min(self.gaps)
+        
+        self.last_time = sample_time
+        self.misses = 0
+        self.fresh_streak += 1
+        self._fresh = True
+    
+    def duplicate(self):
+        """Registra uma leitura que trouxe a mesma amostra (sem dado novo)."""
+        self.duplicates += 1
+        self.fresh_streak = 0
+    
+    def next_delay(self) -> float:
+        """Segundos até a próxima leitura."""
+        if not self._fresh:
+            self.misses += 1
+            self.idle_reads += 1
+        self._fresh = False
+        
+        if self.interval is None:
+            delay = max(self.margin, self.period / 4) if self.last_time is not None else self.period
+        elif self.misses:
+            delay = self.margin * 2 ** (self.misses - 1)
+            delay *= 1 + random.uniform(0, self.jitter)
+        else:
+            interval = self.interval
+            if self.fresh_streak >= self.PROBE_EVERY:
+                interval /= 2
+                self.fresh_streak = 0
+            expected = self.last_time + interval + min(self.offsets) + self.margin
+            delay = expected - time.time()
+            delay += random.uniform(0, self.jitter * interval)
+        
+        self.last_delay = min(max(delay, self.margin / 4), self.max_period)
+        return self.last_delay
+    
+    def stats(self) -> dict:
+        return {
+            'interval': self.interval,
+            'drift': self.drift,
+            'skipped': self.skipped,
+            'duplicates': self.duplicates,
+            'idle_reads': self.idle_reads,
+            'next_delay': self.last_delay,
+        }
+    
+    def describe(self) -> str:
+        if self.interval is None:
+            return f"Período adaptativo: estimando | última espera {self.last_delay:.2f}s"
+        return (f"Período adaptativo: {self.interval:.2f}s | drift {self.drift:.2f}s | "
+                f"puladas {self.skipped} | duplicadas {self.duplicates} | "
+                f"última espera {self.last_delay:.2f}s")
+
+
+# ============================================================================
+# CODECS (serialização de entrada e saída)
+# ============================================================================
+
+class JsonCodec:
+    """
+    JSON da biblioteca padrão (formato original do runtime).
+    
+    Os codecs decodificam direto de bytes (o cliente Redis não decodifica as
+    respostas), sem a conversão intermediária para str.
+    """
+    
+    name = 'json'
+    
+    def encode(self, obj):
+        return json.dumps(obj)
+    
+    def decode(self, raw):
+        return json.loads(raw)
+
+
+class OrjsonCodec(JsonCodec):
+    """
+    JSON via orjson: mesmo formato, parse e serialização mais rápidos.
+    
+    Payloads que o orjson recusa (NaN/Infinity do json padrão, chaves não
+    string) usam o JSON da biblioteca padrão.
+    """
+    
+    name = 'orjson'
+    
+    def encode(self, obj):
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+        except TypeError:
+            return super().encode(obj)
+    
+    def decode(self, raw):
+        try:
+            return orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            return super().decode(raw)
+
+
+class MsgpackCodec:
+    """MessagePack: binário compacto (requer o pacote msgpack)."""
+    
+    name = 'msgpack'
+    
+    def encode(self, obj):
+        return msgpack.packb(obj, use_bin_type=True)
+    
+    def decode(self, raw):
+        return msgpack.unpackb(raw, raw=False)
+
+
+class ZlibCodec:
+    """JSON comprimido com zlib (usado na série temporal da saída)."""
+    
+    name = 'zlib'
+    
+    def __init__(self, json_codec):
+        self.json_codec = json_codec
+    
+    def encode(self, obj):
+        payload = self.json_codec.encode(obj)
+        return zlib.compress(payload.encode() if isinstance(payload, str) else payload, 6)
+    
+    def decode(self, raw):
+        return self.json_codec.decode(zlib.decompress(raw))
+
+
+JSON_CODEC = JsonCodec()
+# JSON mais rápido disponível (para leitura, o formato é o mesmo)
+FAST_JSON_CODEC = OrjsonCodec() if orjson is not None else JSON_CODEC
+MSGPACK_CODEC = MsgpackCodec() if msgpack is not None else None
+ZLIB_CODEC = ZlibCodec(FAST_JSON_CODEC)
+
+# Primeiro byte de um payload msgpack com map/array na raiz
+MSGPACK_FIRST_BYTES = frozenset(range(0x80, 0xa0)) | {0xdc, 0xdd, 0xde, 0xdf}
+
+
+def detect_codec(raw):
+    """
+    Identifica o formato de um payload pelo primeiro byte: JSON começa com
+    um caractere ASCII ('{', '[', espaço...), zlib com 0x78 e msgpack com
+    um map/array (0x80-0x9f, 0xdc-0xdf).
+    """
+    if isinstance(raw, str) or not raw:
+        return FAST_JSON_CODEC
+    
+    first = raw[0]
+    if first in MSGPACK_FIRST_BYTES and MSGPACK_CODEC is not None:
+        return MSGPACK_CODEC
+    if first == 0x78:
+        return ZLIB_CODEC
+    return FAST_JSON_CODEC
+
+
+class AutoCodec:
+    """Decodifica detectando o formato; codifica como JSON."""
+    
+    name = 'auto'
+    
+    def encode(self, obj):
+        return FAST_JSON_CODEC.encode(obj)
+    
+    def decode(self, raw):
+        return detect_codec(raw).decode(raw)
+
+
+AUTO_CODEC = AutoCodec()
+
+
+def get_codec(name: str):
+    """
+    Retorna o codec pelo nome ('auto', 'json', 'orjson', 'msgpack', 'zlib').
+    
+    Sem a biblioteca instalada, 'orjson' e 'msgpack' usam o JSON padrão.
+    """
+    if name == 'auto':
+        return AUTO_CODEC
+    if name == 'orjson':
+        if orjson is None:
+            log.warning("⚠️  orjson não instalado. Usando json.")
+        return FAST_JSON_CODEC
+    if name == 'msgpack':
+        if MSGPACK_CODEC is None:
+            log.warning("⚠️  msgpack não instalado. Usando json.")
+            return JSON_CODEC
+        return MSGPACK_CODEC
+    if name == 'zlib':
+        return ZLIB_CODEC
+    if name != 'json':
+        log.warning(f"⚠️  Codec desconhecido '{name}'. Usando json.")
+    return JSON_CODEC
+
+
+def _text(value) -> str:
+    """Converte respostas do Redis (bytes) em texto para logs e comparações."""
+    return value.decode() if isinstance(value, bytes) else value
+
+
+# ============================================================================
+# SAÍDA DE RESULTADOS
+# ============================================================================
+
+class OutputSink:
+    """
+    Grava os resultados de uma função em um único round-trip (MULTI/EXEC):
+    - SET do último resultado na chave de saída (codec OUTPUT_CODEC, JSON
+      por padrão), com TTL opcional
+    - append de cada resultado em uma série temporal limitada:
+      'stream' (XADD MAXLEN ~, id = horário em ms, campo 'data' e, se não
+      for JSON, 'enc') ou 'zset' (score = epoch do timestamp da amostra,
+      membro "<epoch>-<i>|<payload>")
+    - EXPIRE da série
+    
+    Conta comandos e bytes gravados para o log de cada execução e mede a
+    codificação e a escrita (last_encode_seconds/last_write_seconds).
+    """
+    
+    def __init__(self, output_key: str, history: str = OUTPUT_HISTORY,
+                 history_key: str = OUTPUT_HISTORY_KEY, maxlen: int = OUTPUT_HISTORY_MAXLEN,
+                 ttl: int = OUTPUT_TTL, encoding: str = OUTPUT_HISTORY_ENCODING,
+                 codec: str = OUTPUT_CODEC):
+        if history not in ('none', 'stream', 'zset'):
+            log.warning(f"⚠️  OUTPUT_HISTORY desconhecido '{history}'. Gravando só o último resultado.")
+            history = 'none'
+        
+        self.codec = get_codec(codec)
+        self.history_codec = self.codec if encoding == 'json' else get_codec(encoding)
+        encoding = 'json' if self.history_codec.name in ('json', 'orjson', 'auto') else self.history_codec.name
+        
+        self.output_key = output_key
+        self.history = history
+        self.history_key = history_key or f"{output_key}:history"
+        self.maxlen = maxlen
+        self.ttl = ttl
+        self.encoding = encoding
+        self.last_commands = 0
+        self.last_history_bytes = 0
+        self.last_encode_seconds = 0.0
+        self.last_write_seconds = 0.0
+    
+    def encode(self, result: dict, payload):
+        """Payload de uma entrada da série (reaproveita o do último valor)."""
+        if self.history_codec is self.codec:
+            return payload
+        return self.history_codec.encode(result)
+    
+    def _queue(self, pipe, results: list, payloads: list):
+        """Enfileira no pipeline os comandos de uma execução."""
+        pipe.set(self.output_key, payloads[-1], ex=self.ttl or None)
+        
+        commands = 1
+        history_bytes = 0
+        if self.history == 'stream':
+            for result, payload in zip(results, payloads):
+                fields = {'data': self.encode(result, payload)}
+                if self.encoding != 'json':
+                    fields['enc'] = self.encoding
+                history_bytes += len(fields['data'])
+                pipe.xadd(self.history_key, fields, maxlen=self.maxlen, approximate=True)
+                commands += 1
+        elif self.history == 'zset':
+            # Score pelo timestamp de cada amostra: um lote acumulado mantém a
+            # ordem temporal (sem timestamp, o horário da escrita)
+            now = time.time()
+            members = {}
+            for index, (result, payload) in enumerate(zip(results, payloads)):
+                payload = self.encode(result, payload)
+                score = (parse_sample_time(result.get('timestamp')) if isinstance(result, dict) else None) or now
+                prefix = f"{score:.6f}-{index}|"
+                member = prefix.encode() + payload if isinstance(payload, bytes) else prefix + payload
+                members[member] = score
+                history_bytes += len(payload)
+            pipe.zadd(self.history_key, members)
+            pipe.zremrangebyrank(self.history_key, 0, -self.maxlen - 1)
+            commands += 2
+        
+        if self.history != 'none' and self.ttl:
+            pipe.expire(self.history_key, self.ttl)
+            commands += 1
+        
+        self.last_commands = commands
+        self.last_history_bytes = history_bytes
+    
+    def _single_command(self) -> bool:
+        return self.history == 'none'
+    
+    def write(self, redis_client, results: list) -> list:
+        """
+        Grava os resultados (em ordem cronológica; o último fica na chave).
+        
+        Returns:
+            Lista com os payloads gravados (str ou bytes, conforme o codec)
+        """
+        start = time.perf_counter()
+        payloads = [self.codec.encode(result) for result in results]
+        
+        if self._single_command():
+            encoded = time.perf_counter()
+            redis_client.set(self.output_key, payloads[-1], ex=self.ttl or None)
+            self.last_commands = 1
+            self.last_history_bytes = 0
+        else:
+            pipe = redis_client.pipeline(transaction=True)
+            self._queue(pipe, results, payloads)
+            encoded = time.perf_counter()
+            pipe.execute()
+        
+        self.last_encode_seconds = encoded - start
+        self.last_write_seconds = time.perf_counter() - encoded
+        return payloads
+    
+    async def write_async(self, redis_client, results: list) -> list:
+        """Versão asyncio de write()."""
+        start = time.perf_counter()
+        payloads = [self.codec.encode(result) for result in results]
+        
+        if self._single_command():
+            encoded = time.perf_counter()
+            await redis_client.set(self.output_key, payloads[-1], ex=self.ttl or None)
+            self.last_commands = 1
+            self.last_history_bytes = 0
+        else:
+            pipe = redis_client.pipeline(transaction=True)
+            self._queue(pipe, results, payloads)
+            encoded = time.perf_counter()
+            await pipe.execute()
+        
+        self.last_encode_seconds = encoded - start
+        self.last_write_seconds = time.perf_counter() - encoded
+        return payloads
+    
+    def describe(self) -> str:
+        """Resumo da última escrita para o log."""
+        summary = f"{self.last_commands} comandos em 1 round-trip"
+        if self.history != 'none':
+            summary += f" | histórico {self.history} +{self.last_history_bytes} bytes ({self.encoding})"
+        return summary
+
+
+# ============================================================================
+# MOTOR DE EXECUÇÃO (inline, threads ou processos)
+# ============================================================================
+
+class HandlerTimeout(TimeoutError):
+    """O handler excedeu HANDLER_TIMEOUT."""
+
+
+class HandlerError(RuntimeError):
+    """Erro levantado pelo handler dentro de um worker (processo)."""
+
+
+def _invocation_timeout(samples: list):
+    """Limite de tempo para processar as amostras (None = sem limite)."""
+    return HANDLER_TIMEOUT * len(samples) if HANDLER_TIMEOUT > 0 else None
+
+
+def _affinity_slot(key: str, slots: int) -> int:
+    """Índice do worker de uma função (estável entre reinícios do runtime)."""
+    return zlib.crc32(key.encode()) % slots
+
+
+def _rss_mb() -> float:
+    """Memória residente do processo atual em MB."""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class InlineEngine:
+    """
+    Executa o handler na thread do loop principal (comportamento original).
+    
+    Os motores recebem um dicionário nome da função -> (handler, função de
+    lote) e escolhem o handler pelo context.function_name de cada invocação.
+    
+    Com HANDLER_TIMEOUT a execução é interrompida via SIGALRM, o que só
+    funciona na thread principal e em código Python: uma chamada C bloqueante
+    só é interrompida quando retorna.
+    
+    Com profile ('cprofile', 'tracemalloc' ou 'both'), a invocação é
+    perfilada onde o handler roda (thread ou worker) e a captura fica em
+    captures[nome da função] até o chamador retirá-la.
+    """
+    
+    name = 'inline'
+    
+    def __init__(self, handlers: dict):
+        self.handlers = dict(handlers)
+        self.captures = {}
+    
+    def _captured(self, context, capture):
+        if capture is not None:
+            self.captures[context.function_name] = capture
+    
+    def reload(self, handlers: dict):
+        """Troca os handlers das funções informadas (hot reload)."""
+        self.handlers.update(handlers)
+    
+    def invoke(self, context, samples: list, profile: str = None) -> list:
+        """Executa o handler da função sobre as amostras e retorna os resultados."""
+        handler_function, batch_function = self.handlers[context.function_name]
+        timeout = _invocation_timeout(samples)
+        if timeout is None or threading.current_thread() is not threading.main_thread():
+            results, capture = profiled_invoke(handler_function, batch_function, context, samples, profile)
+            self._captured(context, capture)
+            return results
+        
+        def handle_alarm(signum, frame):
+            raise HandlerTimeout(f"Handler excedeu {timeout:.1f}s")
+        
+        previous = signal.signal(signal.SIGALRM, handle_alarm)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+        try:
+            results, capture = profiled_invoke(handler_function, batch_function, context, samples, profile)
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+        self._captured(context, capture)
+        return results
+    
+    def close(self):
+        pass
+
+
+class _ThreadWorker:
+    """Thread dedicada que executa as invocações de um worker em ordem."""
+    
+    def __init__(self, index: int):
+        self.calls = 0
+        self.jobs = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name=f'handler-{index}', daemon=True)
+        self.thread.start()
+    
+    def _run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            future, function, args = job
+            try:
+                future.set_result(function(*args))
+            except BaseException as e:
+                future.set_exception(e)
+    
+    def submit(self, function, *args) -> Future:
+        future = Future()
+        self.jobs.put((future, function, args))
+        return future
+    
+    def stop(self):
+        self.jobs.put(None)
+
+
+class ThreadEngine(InlineEngine):
+    """
+    Executa o handler em threads, uma fila por worker, com afinidade por
+    função (a mesma função sempre vai para o mesmo worker).
+    
+    Uma thread presa não pode ser interrompida: no timeout ela é abandonada
+    (daemon) e o worker recebe uma thread nova. Como threads compartilham o
+    processo, não há reciclagem por memória.
+    
+    invoke() pode ser chamado de várias threads (runtime asyncio): cada
+    worker atende uma invocação por vez.
+    """
+    
+    name = 'thread'
+    
+    def __init__(self, handlers: dict, workers: int = EXECUTOR_WORKERS,
+                 max_calls: int = WORKER_MAX_CALLS):
+        super().__init__(handlers)
+        self.max_calls = max_calls
+        self.workers = [_ThreadWorker(index) for index in range(max(1, workers))]
+        self.locks = [threading.Lock() for _ in self.workers]
+    
+    def _replace(self, index: int):
+        self.workers[index].stop()
+        self.workers[index] = _ThreadWorker(index)
+    
+    def invoke(self, context, samples: list, profile: str = None) -> list:
+        index = _affinity_slot(context.function_name, len(self.workers))
+        with self.locks[index]:
+            return self._invoke(index, context, samples, profile)
+    
+    def _invoke(self, index: int, context, samples: list, profile: str = None) -> list:
+        worker = self.workers[index]
+        timeout = _invocation_timeout(samples)
+        
+        handler_function, batch_function = self.handlers[context.function_name]
+        future = worker.submit(profiled_invoke, handler_function, batch_function, context, samples, profile)
+        try:
+            results, capture = future.result(timeout=timeout)
+        except FutureTimeoutError:
+            log.error(f"⏰ Handler excedeu {timeout:.1f}s, abandonando a thread handler-{index}")
+            self._replace(index)
+            raise HandlerTimeout(f"Handler excedeu {timeout:.1f}s")
+        
+        worker.calls += 1
+        if self.max_calls and worker.calls >= self.max_calls:
+            self._replace(index)
+        self._captured(context, capture)
+        return results
+    
+    def close(self):
+        for worker in self.workers:
+            worker.stop()
+
+
+def _process_worker_main(conn, handlers: dict):
+    """
+    Loop de um worker (processo filho criado por fork, com os handlers já
+    importados). Recebe (função, metadados, env ou None, amostras, profile) e
+    responde (status, resultados ou erro, env, RSS em MB, captura do profiling).
+    
+    O worker mantém o contexto de cada função entre invocações; o env só é
+    enviado pelo processo principal quando o worker ainda não o tem.
+    """
+    # Ctrl+C/SIGTERM são tratados pelo processo principal, que encerra os workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    
+    contexts = {}
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+        if message is None:
+            return
+        
+        key, meta, env, samples, profile = message
+        context = contexts.setdefault(key, Context())
+        context.__dict__.update(meta)
+        if env is not None:
+            context.env = env
+        
+        capture = None
+        try:
+            handler_function, batch_function = handlers[key]
+            results, capture = profiled_invoke(handler_function, batch_function, context, samples, profile)
+            reply = ('ok', results)
+        except Exception as e:
+            reply = ('error', (f"{type(e).__name__}: {e}", traceback.format_exc()))
+        
+        try:
+            conn.send(reply + (context.env, _rss_mb(), capture))
+        except Exception as e:
+            # Resultado ou env não serializáveis: o processo principal mantém o env anterior
+            contexts.pop(key, None)
+            conn.send(('error', (f"Resposta não serializável: {e}", ''), None, _rss_mb(), None))
+
+
+class _ProcessWorker:
+    """Processo pré-criado (fork) com o handler já importado."""
+    
+    def __init__(self, index: int, handlers: dict):
+        mp_context = multiprocessing.get_context('fork')
+        self.conn, child_conn = mp_context.Pipe()
+        self.process = mp_context.Process(
+            target=_process_worker_main,
+            args=(child_conn, handlers),
+            name=f'handler-{index}'
+        )
+        self.process.start()
+        child_conn.close()
+        self.calls = 0
+        self.synced = set()  # funções cujo env o worker já tem
+    
+    def stop(self, graceful: bool = True):
+        if graceful and self.process.is_alive():
+            try:
+                self.conn.send(None)
+            except OSError:
+                pass
+            self.process.join(1)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(1)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class ProcessEngine(InlineEngine):
+    """
+    Executa o handler em processos pré-criados (fork após carregar o handler),
+    com afinidade por função: cada função é sempre atendida pelo mesmo
+    worker, que mantém context.env em memória entre invocações e devolve o
+    env atualizado ao processo principal (para checkpoints e para semear um
+    worker novo).
+    
+    No timeout o worker é terminado e substituído; workers também são
+    reciclados após WORKER_MAX_CALLS invocações ou acima de
+    WORKER_MAX_MEMORY_MB de RSS. Requer fork (Linux). invoke() pode ser
+    chamado de várias threads (runtime asyncio): cada worker atende uma
+    invocação por vez.
+    """
+    
+    name = 'process'
+    
+    def __init__(self, handlers: dict, workers: int = EXECUTOR_WORKERS,
+                 max_calls: int = WORKER_MAX_CALLS, max_memory_mb: int = WORKER_MAX_MEMORY_MB):
+        super().__init__(handlers)
+        self.max_calls = max_calls
+        self.max_memory_mb = max_memory_mb
+        self.workers = [self._spawn(index) for index in range(max(1, workers))]
+        self.locks = [threading.Lock() for _ in self.workers]
+    
+    def _spawn(self, index: int):
+        return _ProcessWorker(index, self.handlers)
+    
+    def _replace(self, index: int, graceful: bool = True):
+        self.workers[index].stop(graceful)
+        self.workers[index] = self._spawn(index)
+    
+    def reload(self, handlers: dict):
+        """Troca os handlers recriando os workers (o env volta do processo principal)."""
+        super().reload(handlers)
+        for index in range(len(self.workers)):
+            with self.locks[index]:
+                self._replace(index)
+    
+    def invoke(self, context, samples: list, profile: str = None) -> list:
+        index = _affinity_slot(context.function_name, len(self.workers))
+        with self.locks[index]:
+            return self._invoke(index, context, samples, profile)
+    
+    def _invoke(self, index: int, context, samples: list, profile: str = None) -> list:
+        key = context.function_name
+        worker = self.workers[index]
+        timeout = _invocation_timeout(samples)
+        
+        context.last_execution = datetime.now().isoformat()
+        meta = {name: value for name, value in vars(context).items() if name != 'env'}
+        env = None if key in worker.synced else context.env
+        
+        # HandlerTimeout é um OSError: o timeout fica fora do try para não
+        # ser confundido com a morte do worker
+        try:
+            worker.conn.send((key, meta, env, samples, profile))
+            ready = worker.conn.poll(timeout)
+            if ready:
+                status, payload, env, rss, capture = worker.conn.recv()
+        except (EOFError, OSError) as e:
+            log.error(f"💥 Worker handler-{index} morreu (exit code {worker.process.exitcode}), recriando")
+            self._replace(index, graceful=False)
+            raise HandlerError(f"Worker handler-{index} morreu: {e}")
+        
+        if not ready:
+            log.error(f"⏰ Handler excedeu {timeout:.1f}s, terminando o worker handler-{index}")
+            self._replace(index, graceful=False)
+            raise HandlerTimeout(f"Handler excedeu {timeout:.1f}s")
+        
+        # Mudanças no env valem mesmo se o handler falhou (como no modo inline)
+        if env is not None:
+            context.env = env
+            worker.synced.add(key)
+        else:
+            worker.synced.discard(key)
+        
+        worker.calls += 1
+        if self.max_calls and worker.calls >= self.max_calls:
+            log.info(f"♻️  Reciclando worker handler-{index} após {worker.calls} invocações")
+            self._replace(index)
+        elif self.max_memory_mb and rss > self.max_memory_mb:
+            log.info(f"♻️  Reciclando worker handler-{index}: RSS {rss:.0f}MB > {self.max_memory_mb}MB")
+            self._replace(index)
+        
+        if status == 'error':
+            message, worker_traceback = payload
+            if worker_traceback:
+                log.error(worker_traceback.rstrip())
+            raise HandlerError(message)
+        self._captured(context, capture)
+        return payload
+    
+    def close(self):
+        for worker in self.workers:
+            worker.stop()
+
+
+def create_execution_engine(handlers: dict, mode: str = EXECUTOR_MODE):
+    """
+    Cria o motor de execução do handler conforme EXECUTOR_MODE.
+    
+    Args:
+        handlers: Nome da função -> (handler, função de lote ou None)
+        mode: 'inline', 'thread' ou 'process'
+    
+    Returns:
+        Motor com os métodos invoke(), reload() e close()
+    """
+    
+    if mode == 'thread':
+        return ThreadEngine(handlers)
+    
+    if mode == 'process':
+        if 'fork' in multiprocessing.get_all_start_methods():
+            return ProcessEngine(handlers)
+        log.warning("⚠️  EXECUTOR_MODE=process requer fork. Usando threads.")
+        return ThreadEngine(handlers)
+    
+    if mode != 'inline':
+        log.warning(f"⚠️  EXECUTOR_MODE desconhecido '{mode}'. Executando inline.")
+    
+    return InlineEngine(handlers)
+
+
+# ============================================================================
+# PROFILING DO HANDLER (cProfile / tracemalloc)
+# ============================================================================
+
+PROFILE_MODES = ('cprofile', 'tracemalloc', 'both')
+
+
+def profiled_invoke(handler_function, batch_function, context, samples: list, profile: str = None):
+    """
+    invoke_handlers com captura opcional, executado onde o handler roda.
+    
+    Returns:
+        Tupla (resultados, captura ou None). A captura é serializável (volta
+        dos workers de processo): estatísticas do cProfile e/ou as linhas que
+        mais alocaram memória durante a invocação (tracemalloc).
+    """
+    if not profile:
+        return invoke_handlers(handler_function, batch_function, context, samples), None
+    
+    profiler = cProfile.Profile() if profile in ('cprofile', 'both') else None
+    tracing = profile in ('tracemalloc', 'both')
+    started_tracing = tracing and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    before = tracemalloc.take_snapshot() if tracing else None
+    
+    if profiler:
+        profiler.enable()
+    try:
+        results = invoke_handlers(handler_function, batch_function, context, samples)
+    finally:
+        if profiler:
+            profiler.disable()
+        after = tracemalloc.take_snapshot() if tracing else None
+        if started_tracing:
+            tracemalloc.stop()
+    
+    capture = {'samples': len(samples)}
+    if profiler:
+        capture['cprofile'] = pstats.Stats(profiler).stats
+    if tracing:
+        ignore = (tracemalloc.Filter(False, tracemalloc.__file__),)
+        diff = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), 'lineno')
+        capture['tracemalloc'] = [(str(stat.traceback), stat.size_diff, stat.count_diff)
+                                  for stat in diff[:PROFILE_TOP * 2] if stat.size_diff > 0]
+    return results, capture
+
+
+class _StatsSnapshot:
+    """Estatísticas do cProfile já coletadas (em outro processo) para o pstats."""
+    
+    def __init__(self, stats: dict):
+        self.stats = stats
+    
+    def create_stats(self):
+        pass
+
+
+class HandlerProfiler:
+    """
+    Profiling amostrado das invocações de uma função.
+    
+    Perfila uma a cada `every` invocações (a primeira sempre) e agrega as
+    capturas: cProfile via pstats.Stats.add e tracemalloc somando bytes e
+    blocos alocados por linha. As estatísticas agregadas são gravadas por
+    check_profilers() no hash <output_key>:profile (ou em PROFILE_OUTPUT,
+    se for um diretório):
+    - cprofile: top PROFILE_TOP funções por tempo acumulado (texto)
+    - cprofile_raw: estatísticas no formato do pstats (marshal)
+    - tracemalloc: top PROFILE_TOP linhas por memória alocada (texto)
+    
+    Desligado (modo 'none'), o custo por invocação é uma comparação.
+    """
+    
+    def __init__(self, name: str, output_key: str, mode: str = PROFILE_MODE,
+                 every: int = PROFILE_EVERY, control_key: str = PROFILE_CONTROL_KEY,
+                 output: str = PROFILE_OUTPUT):
+        if mode not in PROFILE_MODES + ('none',):
+            log.warning(f"⚠️  PROFILE_MODE desconhecido '{mode}'. Profiling desabilitado.")
+            mode = 'none'
+        
+        self.name = name
+        self.mode = mode
+        self.every = max(1, every)
+        self.control_key = control_key or f"{output_key}:profile:control"
+        self.control_value = None
+        self.next_control_check = 0.0
+        self.stats_key = f"{output_key}:profile"
+        self.output = output
+        self.invocations = 0
+        self.captured = 0
+        self.profiled_samples = 0
+        self.cprofile = None
+        self.allocations = {}
+        self.dirty = False
+    
+    def next_mode(self):
+        """Modo de profiling da próxima invocação (None = sem profiling)."""
+        if self.mode == 'none':
+            return None
+        self.invocations += 1
+        return self.mode if (self.invocations - 1) % self.every == 0 else None
+    
+    def apply_control(self, value: str):
+        """Aplica o valor da chave de controle: "<modo>[:N]" ou "off"."""
+        if value == self.control_value:
+            return
+        self.control_value = value
+        
+        mode, _, every = value.strip().lower().partition(':')
+        if mode in ('off', 'none', ''):
+            mode = 'none'
+        elif mode not in PROFILE_MODES:
+            log.warning(f"⚠️  [{self.name}] Valor inválido em {self.control_key}: '{value}'")
+            return
+        
+        self.mode = mode
+        if every.isdigit() and int(every) > 0:
+            self.every = int(every)
+        self.invocations = 0
+        if mode == 'none':
+            log.info(f"🔬 [{self.name}] Profiling desligado ({self.control_key})")
+        else:
+            log.info(f"🔬 [{self.name}] Profiling: {mode} a cada {self.every} invocações ({self.control_key})")
+    
+    def add(self, capture: dict):
+        """Agrega a captura de uma invocação."""
+        self.captured += 1
+        self.profiled_samples += capture.get('samples', 0)
+        
+        if 'cprofile' in capture:
+            snapshot = _StatsSnapshot(capture['cprofile'])
+            if self.cprofile is None:
+                self.cprofile = pstats.Stats(snapshot)
+            else:
+                self.cprofile.add(snapshot)
+        
+        for line, size, count in capture.get('tracemalloc', []):
+            totals = self.allocations.setdefault(line, [0, 0])
+            totals[0] += size
+            totals[1] += count
+        
+        self.dirty = True
+    
+    def cprofile_report(self) -> str:
+        stream = io.StringIO()
+        self.cprofile.stream = stream
+        self.cprofile.sort_stats('cumulative').print_stats(PROFILE_TOP)
+        return stream.getvalue()
+    
+    def tracemalloc_report(self) -> str:
+        top = sorted(self.allocations.items(), key=lambda item: item[1][0], reverse=True)[:PROFILE_TOP]
+        lines = [f"Alocações em {self.captured} invocações perfiladas ({self.profiled_samples} amostras)"]
+        for line, (size, count) in top:
+            lines.append(f"{size / 1024:10.1f} KiB | {count:8d} blocos | {line}")
+        return '\n'.join(lines) + '\n'
+    
+    def flush(self, redis_client):
+        """Grava as estatísticas agregadas, se houve captura desde a última gravação."""
+        if not self.dirty:
+            return
+        self.dirty = False
+        
+        fields = {
+            'mode': self.mode,
+            'every': self.every,
+            'captured': self.captured,
+            'samples': self.profiled_samples,
+            'updated': datetime.now().isoformat(),
+        }
+        if self.cprofile is not None:
+            fields['cprofile'] = self.cprofile_report()
+            fields['cprofile_raw'] = marshal.dumps(self.cprofile.stats)
+        if self.allocations:
+            fields['tracemalloc'] = self.tracemalloc_report()
+        
+        if self.output == 'redis':
+            redis_client.hset(self.stats_key, mapping=fields)
+            return
+        
+        os.makedirs(self.output, exist_ok=True)
+        safe_name = ''.join(c if c.isalnum() or c in '-_.' else '_' for c in self.name)
+        base = os.path.join(self.output, safe_name)
+        if self.cprofile is not None:
+            self.cprofile.dump_stats(f"{base}.prof")
+            with open(f"{base}.cprofile.txt", 'w') as f:
+                f.write(fields['cprofile'])
+        if self.allocations:
+            with open(f"{base}.tracemalloc.txt", 'w') as f:
+                f.write(fields['tracemalloc'])
+
+
+def check_profilers(functions: list, redis_client):
+    """
+    Lê as chaves de controle (a cada PROFILE_CONTROL_INTERVAL, em um MGET)
+    e grava as estatísticas de profiling pendentes.
+    """
+    now = time.monotonic()
+    if PROFILE_CONTROL_INTERVAL > 0:
+        due = [function.profiler for function in functions if now >= function.profiler.next_control_check]
+        if due:
+            values = redis_client.mget([profiler.control_key for profiler in due])
+            for profiler, value in zip(due, values):
+                profiler.next_control_check = now + PROFILE_CONTROL_INTERVAL
+                if value is not None:
+                    profiler.apply_control(_text(value))
+    
+    for function in functions:
+        function.profiler.flush(redis_client)
+
+
+# ============================================================================
+# MÉTRICAS (endpoint Prometheus)
+# ============================================================================
+
+class MetricsRegistry:
+    """
+    Contadores e histogramas no formato texto do Prometheus, sem dependências.
+    
+    Os valores são acumulados sob um lock (o loop, as threads de escrita do
+    modo async e a thread do servidor HTTP acessam o registro). Métricas
+    derivadas do estado das funções (idade da última amostra, contadores já
+    mantidos por HostedFunction) são lidas por coletores no momento do scrape.
+    
+    Com enabled=False (METRICS_PORT=0), inc() e observe() retornam sem fazer nada.
+    """
+    
+    LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+    SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576)
+    
+    def __init__(self, prefix: str = 'serverless_runtime', enabled: bool = True):
+        self.prefix = prefix
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.metadata = {}
+        self.counters = {}
+        self.histograms = {}
+        self.collectors = []
+    
+    def describe(self, name: str, kind: str, text: str, buckets: tuple = None):
+        """Registra tipo ('counter', 'gauge', 'histogram') e descrição da métrica."""
+        self.metadata[name] = (kind, text, buckets)
+    
+    def inc(self, name: str, value: float = 1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+    
+    def observe(self, name: str, value: float, **labels):
+        if not self.enabled:
+            return
+        buckets = self.metadata[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * len(buckets), 0.0, 0]
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram[0][index] += 1
+                    break
+            histogram[1] += value
+            histogram[2] += 1
+    
+    def add_collector(self, collector):
+        """collector() retorna tuplas (nome, labels, valor) lidas no scrape."""
+        self.collectors.append(collector)
+    
+    @staticmethod
+    def _labels(labels, extra: tuple = ()) -> str:
+        parts = []
+        for key, value in tuple(labels) + tuple(extra):
+            value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+            parts.append(f'{key}="{value}"')
+        return '{' + ','.join(parts) + '}' if parts else ''
+    
+    @staticmethod
+    def _value(value) -> str:
+        """Valor com precisão total (:g perderia dígitos em contadores e somas grandes)."""
+        if isinstance(value, int):
+            return str(value)
+        value = float(value)
+        if value != value:
+            return 'NaN'
+        if value in (float('inf'), float('-inf')):
+            return '+Inf' if value > 0 else '-Inf'
+        return repr(value)
+    
+    def render(self) -> str:
+        """Todas as métricas no formato de exposição texto (versão 0.0.4)."""
+        samples = {}
+        with self.lock:
+            for (name, labels), value in self.counters.items():
+                samples.setdefault(name, []).append((labels, value))
+            histograms = {key: (list(counts), total, count) for key, (counts, total, count) in self.histograms.items()}
+        
+        for collector in self.collectors:
+            for name, labels, value in collector():
+                samples.setdefault(name, []).append((tuple(sorted(labels.items())), value))
+        
+        for (name, labels), histogram in histograms.items():
+            samples.setdefault(name, []).append((labels, histogram))
+        
+        lines = []
+        for name in sorted(samples):
+            kind, text, buckets = self.metadata.get(name, ('untyped', '', None))
+            full_name = f"{self.prefix}_{name}"
+            lines.append(f"# HELP {full_name} {text}")
+            lines.append(f"# TYPE {full_name} {kind}")
+            for labels, value in samples[name]:
+                if kind != 'histogram':
+                    lines.append(f"{full_name}{self._labels(labels)} {self._value(value)}")
+                    continue
+                counts, total, count = value
+                cumulative = 0
+                for bound, bucket_count in zip(buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f"{full_name}_bucket{self._labels(labels, [('le', self._value(bound))])} {cumulative}")
+                lines.append(f"{full_name}_bucket{self._labels(labels, [('le', '+Inf')])} {count}")
+                lines.append(f"{full_name}_sum{self._labels(labels)} {self._value(total)}")
+                lines.append(f"{full_name}_count{self._labels(labels)} {count}")
+        return '\n'.join(lines) + '\n'
+
+
+METRICS = MetricsRegistry(enabled=METRICS_PORT > 0)
+METRICS.describe('handler_duration_seconds', 'histogram', 'Tempo do handler por invocação (amostra ou lote)',
+                 MetricsRegistry.LATENCY_BUCKETS)
+METRICS.describe('redis_duration_seconds', 'histogram', 'Latência das leituras (GET/script) e escritas (SET/MULTI) no Redis',
+                 MetricsRegistry.LATENCY_BUCKETS)
+METRICS.describe('codec_duration_seconds', 'histogram', 'Tempo de decodificação da entrada e codificação da saída',
+                 MetricsRegistry.LATENCY_BUCKETS)
+METRICS.describe('payload_bytes', 'histogram', 'Tamanho dos payloads de entrada e saída',
+                 MetricsRegistry.SIZE_BUCKETS)
+METRICS.describe('errors_total', 'counter', 'Erros por etapa (read, decode, handler, write, loop)')
+METRICS.describe('executions_total', 'counter', 'Amostras processadas pelo handler')
+METRICS.describe('skipped_unchanged_total', 'counter', 'Leituras descartadas por não trazerem amostra nova')
+METRICS.describe('last_sample_age_seconds', 'gauge', 'Idade (pelo timestamp da amostra) da última amostra processada')
+METRICS.describe('producer_interval_seconds', 'gauge', 'Intervalo estimado do produtor (ADAPTIVE_PERIOD)')
+METRICS.describe('producer_drift_seconds', 'gauge', 'Atraso médio da leitura após a amostra ficar disponível')
+METRICS.describe('producer_skipped_total', 'counter', 'Amostras do produtor que nenhuma leitura viu')
+
+
+def collect_function_metrics(functions: list):
+    """Coletor de METRICS: métricas mantidas pelas próprias funções."""
+    now = time.time()
+    for function in functions:
+        labels = {'function': function.name}
+        yield 'executions_total', labels, function.execution_count
+        yield 'skipped_unchanged_total', labels, function.unchanged_reads
+        if function.last_sample_time is not None:
+            yield 'last_sample_age_seconds', labels, max(0.0, now - function.last_sample_time)
+        if function.arrivals and function.arrivals.interval is not None:
+            stats = function.arrivals.stats()
+            yield 'producer_interval_seconds', labels, stats['interval']
+            yield 'producer_drift_seconds', labels, stats['drift']
+            yield 'producer_skipped_total', labels, stats['skipped']
+
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    """GET /metrics (Prometheus) e GET /healthz."""
+    
+    def do_GET(self):
+        if self.path.split('?')[0] == '/metrics':
+            body = METRICS.render().encode()
+            content_type = 'text/plain; version=0.0.4; charset=utf-8'
+        elif self.path == '/healthz':
+            body = b'ok\n'
+            content_type = 'text/plain'
+        else:
+            self.send_error(404)
+            return
+        
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        # Scrapes periódicos não poluem o log do runtime
+        pass
+
+
+def start_metrics_server(port: int = METRICS_PORT):
+    """Serve /metrics em uma thread daemon; retorna o servidor (ou None)."""
+    if port <= 0:
+        return None
+    
+    try:
+        server = http.server.ThreadingHTTPServer(('', port), MetricsHandler)
+    except OSError as e:
+        log.warning(f"⚠️  Não foi possível abrir a porta {port} para /metrics: {e}")
+        return None
+    
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    log.info(f"📈 Métricas Prometheus em http://0.0.0.0:{port}/metrics")
+    return server
+
+
+# ============================================================================
+# FUNÇÕES HOSPEDADAS (manifesto multi-função)
+# ============================================================================
+
+class HostedFunction:
+    """
+    Uma função servida pelo runtime: handler, chaves de entrada/saída,
+    período e modo de ingestão, com Context, fonte de entrada e checkpointer
+    próprios. Sem manifesto, o runtime hospeda uma única função configurada
+    pelas variáveis de ambiente.
+    """
+    
+    def __init__(self, name: str, handler: str = HANDLER_FUNCTION,
+                 input_key: str = REDIS_INPUT_KEY, output_key: str = REDIS_OUTPUT_KEY,
+                 period: float = MONITORING_PERIOD, ingest: str = INGEST_MODE,
+                 pyfile: str = PYFILE_PATH, input_codec: str = INPUT_CODEC,
+                 output_codec: str = OUTPUT_CODEC, adaptive: bool = ADAPTIVE_PERIOD):
+        self.name = name
+        self.handler = handler
+        self.module_name = handler.rsplit('.', 1)[0]
+        self.input_key = input_key
+        self.output_key = output_key
+        self.period = period
+        self.ingest = ingest
+        self.pyfile = pyfile
+        self.context = Context(name, input_key, output_key)
+        self.input_codec = get_codec(input_codec)
+        self.sink = OutputSink(output_key, codec=output_codec)
+        # Período adaptativo só no modo 'poll' (os demais já seguem o produtor)
+        self.arrivals = ArrivalEstimator(period) if adaptive and ingest == 'poll' else None
+        self.profiler = HandlerProfiler(name, output_key)
+        self.label = ''
+        self.source = None
+        self.checkpointer = None
+        self.last_data = None
+        self.last_raw = None
+        self.pending_raw = None
+        self.unchanged_reads = 0
+        self.last_sample_time = None
+        self.execution_count = 0
+        self.next_run = 0.0
+    
+    @property
+    def source_id(self) -> str:
+        """Origem do código (todas as funções compartilham o ZIP_URL, se houver)."""
+        return ZIP_URL or self.pyfile
+    
+    def select_samples(self, entries: list, redis_client=None):
+        """
+        Parse e deduplicação (por timestamp) das entradas lidas da fonte.
+        
+        Entradas sem mudança (UNCHANGED ou bytes iguais aos da última amostra
+        processada) são descartadas antes do parse.
+        
+        Returns:
+            Tupla (amostras, ids das amostras, ids descartados)
+        """
+        skipped_ids = []
+        samples = []
+        sample_ids = []
+        previous = self.last_data
+        
+        # Latência da leitura que trouxe as entradas (fontes não bloqueantes)
+        read_seconds = getattr(self.source, 'last_read_seconds', None)
+        if read_seconds is not None:
+            METRICS.observe('redis_duration_seconds', read_seconds, function=self.name, operation='read')
+            self.source.last_read_seconds = None
+        
+        for entry_id, raw_data in entries:
+            # Sem mudança (token igual no servidor ou mesmos bytes): sem parse
+            if raw_data is UNCHANGED or (CHANGE_DETECTION != 'none' and raw_data == self.last_raw):
+                self.unchanged_reads += 1
+                LOG_SUMMARY.unchanged(self.name)
+                if self.arrivals:
+                    self.arrivals.duplicate()
+                skipped_ids.append(entry_id)
+                continue
+            
+            # Decodificar payload (bytes, direto pelo codec)
+            start = time.perf_counter()
+            try:
+                current_data = self.input_codec.decode(raw_data)
+            except Exception as e:
+                log.error(f"❌{self.label} Erro ao decodificar entrada ({self.input_codec.name}): {e}")
+                METRICS.inc('errors_total', function=self.name, stage='decode')
+                skipped_ids.append(entry_id)
+                continue
+            METRICS.observe('codec_duration_seconds', time.perf_counter() - start,
+                            function=self.name, operation='decode')
+            METRICS.observe('payload_bytes', len(raw_data), function=self.name, direction='input')
+            
+            # Verificar se dados mudaram
+            if not check_data_changed(redis_client, previous, current_data):
+                # Dados não mudaram, skip
+                LOG_SUMMARY.unchanged(self.name)
+                if self.arrivals:
+                    self.arrivals.duplicate()
+                self.last_raw = raw_data
+                skipped_ids.append(entry_id)
+                continue
+            
+            if self.arrivals:
+                self.arrivals.observe(current_data)
+            self.pending_raw = raw_data
+            samples.append(current_data)
+            sample_ids.append(entry_id)
+            previous = current_data
+        
+        return samples, sample_ids, skipped_ids
+    
+    def announce(self, samples: list) -> str:
+        """
+        Registra o início no log e retorna o horário. As execuções só são
+        contadas em complete(): falhas e reentregas não entram em
+        executions_total (falhas vão para errors_total).
+        """
+        timestamp = datetime.now().strftime('%H:%M:%S')
+        
+        # Linhas por execução só em DEBUG (em INFO, o resumo do LOG_SUMMARY)
+        if not log.isEnabledFor(logging.DEBUG):
+            return timestamp
+        first = self.execution_count + 1
+        last = self.execution_count + len(samples)
+        if len(samples) == 1:
+            log.debug(f"▶️  [{timestamp}]{self.label} Execução #{first}: Chamando handler...")
+        else:
+            log.debug(f"▶️  [{timestamp}]{self.label} Execuções #{first}-{last}: "
+                      f"Processando backlog de {len(samples)} amostras...")
+        return timestamp
+    
+    def complete(self, samples: list):
+        """Após o handler: conta as execuções, atualiza last_data e faz o checkpoint periódico."""
+        self.execution_count += len(samples)
+        self.last_data = samples[-1]
+        self.last_raw = self.pending_raw
+        self.last_sample_time = parse_sample_time(self.last_data.get('timestamp')) or time.time()
+        
+        # Checkpoint periódico de context.env
+        if self.checkpointer:
+            self.checkpointer.maybe_checkpoint(self.context, self.execution_count)
+    
+    def collect_profile(self, engine):
+        """Agrega a captura de profiling deixada pelo motor, se houver."""
+        capture = engine.captures.pop(self.name, None)
+        if capture is not None:
+            self.profiler.add(capture)
+    
+    def record_handler(self, elapsed_time: float, samples: int, error: bool = False):
+        """Métricas (e resumo no log) de uma invocação do handler."""
+        METRICS.observe('handler_duration_seconds', elapsed_time, function=self.name)
+        LOG_SUMMARY.executed(self.name, samples, elapsed_time, error)
+        if error:
+            METRICS.inc('errors_total', function=self.name, stage='handler')
+    
+    def record_write(self, payloads: list):
+        """Métricas da última escrita do sink."""
+        METRICS.observe('codec_duration_seconds', self.sink.last_encode_seconds,
+                        function=self.name, operation='encode')
+        METRICS.observe('redis_duration_seconds', self.sink.last_write_seconds,
+                        function=self.name, operation='write')
+        for payload in payloads:
+            METRICS.observe('payload_bytes', len(payload), function=self.name, direction='output')
+    
+    def report(self, timestamp: str, elapsed_time: float, results: list, payloads: list):
+        if not log.isEnabledFor(logging.DEBUG):
+            return
+        log.debug(f"✅ [{timestamp}]{self.label} Execução concluída em {elapsed_time:.3f}s",
+                  extra=log_fields(event='execution', function=self.name, execution=self.execution_count,
+                                   samples=len(results), elapsed_seconds=round(elapsed_time, 6),
+                                   keys=len(results[-1]), bytes=len(payloads[-1])))
+        log.debug(f"   📊 Resultado: {len(results[-1])} chaves | {len(payloads[-1])} bytes | "
+                  f"{self.sink.describe()}")
+        if self.arrivals:
+            log.debug(f"   ⏱️  {self.arrivals.describe()}")
+    
+    def process(self, entries: list, engine, redis_client) -> int:
+        """
+        Processa as entradas lidas da fonte: parse, deduplicação por
+        timestamp, execução do handler, escrita dos resultados e checkpoint.
+        
+        Entradas já tratadas são confirmadas mesmo se o handler falhar (modo
+        stream); as demais ficam pendentes e serão reprocessadas.
+        
+        Returns:
+            Número de amostras executadas
+        """
+        processed_ids = []
+        try:
+            samples, sample_ids, processed_ids = self.select_samples(entries, redis_client)
+            if not samples:
+                return 0
+            
+            # Dados mudaram, executar handler
+            timestamp = self.announce(samples)
+            
+            # Chamar handler do usuário (perfilado a cada PROFILE_EVERY invocações)
+            start_time = time.time()
+            try:
+                results = engine.invoke(self.context, samples, self.profiler.next_mode())
+            except Exception:
+                self.record_handler(time.time() - start_time, len(samples), error=True)
+                raise
+            finally:
+                self.collect_profile(engine)
+            elapsed_time = time.time() - start_time
+            self.record_handler(elapsed_time, len(samples))
+            
+            # Salvar resultado(s) no Redis
+            try:
+                payloads = self.sink.write(redis_client, results)
+            except Exception:
+                METRICS.inc('errors_total', function=self.name, stage='write')
+                raise
+            self.record_write(payloads)
+            
+            processed_ids.extend(sample_ids)
+            self.complete(samples)
+            self.report(timestamp, elapsed_time, results, payloads)
+            return len(samples)
+        finally:
+            self.source.ack(processed_ids)
+
+
+def load_manifest(path: str = FUNCTIONS_MANIFEST) -> list:
+    """
+    Lê o manifesto de funções (JSON).
+    
+    Formato:
+        {"functions": [
+            {"name": "cpu", "handler": "handler_module.handler",
+             "input_key": "metrics", "output_key": "cpu-output",
+             "period": 5, "ingest": "poll", "pyfile": "/app/pyfile/pyfile"}
+        ]}
+    
+    Campos opcionais: input_codec e output_codec (codec por chave) e
+    adaptive (período adaptativo no modo 'poll').
+    
+    Apenas handler e output_key são obrigatórios; os demais campos usam as
+    variáveis de ambiente correspondentes. name (padrão: handler) e
+    output_key devem ser únicos.
+    
+    Returns:
+        Lista de HostedFunction
+    """
+    with open(path) as f:
+        manifest = json.load(f)
+    
+    entries = manifest.get('functions') if isinstance(manifest, dict) else manifest
+    if not entries:
+        raise ValueError(f"Manifesto {path} não define funções")
+    
+    fields = {'name', 'handler', 'input_key', 'output_key', 'period', 'ingest', 'pyfile',
+              'input_codec', 'output_codec', 'adaptive'}
+    functions = []
+    names = set()
+    output_keys = set()
+    
+    for entry in entries:
+        handler = entry.get('handler', '')
+        if '.' not in handler:
+            raise ValueError(f"Função {entry!r}: handler deve ter o formato module.function")
+        
+        name = entry.get('name') or handler
+        output_key = entry.get('output_key')
+        if not output_key:
+            raise ValueError(f"Função '{name}' sem output_key")
+        if name in names:
+            raise ValueError(f"Nome de função duplicado no manifesto: '{name}'")
+        if output_key in output_keys:
+            raise ValueError(f"output_key duplicado no manifesto: '{output_key}'")
+        
+        unknown = set(entry) - fields
+        if unknown:
+            log.warning(f"⚠️  Função '{name}': campos ignorados {sorted(unknown)}")
+        
+        names.add(name)
+        output_keys.add(output_key)
+        functions.append(HostedFunction(
+            name,
+            handler=handler,
+            input_key=entry.get('input_key', REDIS_INPUT_KEY),
+            output_key=output_key,
+            period=float(entry.get('period', MONITORING_PERIOD)),
+            ingest=entry.get('ingest', INGEST_MODE).lower(),
+            pyfile=entry.get('pyfile', PYFILE_PATH),
+            input_codec=entry.get('input_codec', INPUT_CODEC).lower(),
+            output_codec=entry.get('output_codec', OUTPUT_CODEC).lower(),
+            adaptive=bool(entry.get('adaptive', ADAPTIVE_PERIOD)),
+        ))
+    
+    return functions
+
+
+def load_hosted_functions(functions: list) -> dict:
+    """
+    Carrega o código das funções, importando cada módulo uma única vez por
+    origem (pyfile ou ZIP).
+    
+    Returns:
+        Dicionário nome da função -> (handler, função de lote ou None)
+    """
+    modules = {}
+    handlers = {}
+    for function in functions:
+        key = (function.source_id, function.module_name)
+        if key not in modules:
+            modules[key] = load_user_module(function.module_name, function.pyfile)
+        handlers[function.name] = resolve_user_functions(modules[key], function.handler)
+    return handlers
+
+
+def create_handler_watchers(functions: list) -> list:
+    """
+    Cria um HandlerWatcher por origem de código (pyfile ou ZIP).
+    
+    Returns:
+        Lista de pares (watcher, funções dessa origem)
+    """
+    if (RELOAD_ZIP_CHECK_INTERVAL if ZIP_URL else RELOAD_CHECK_INTERVAL) <= 0:
+        return []
+    
+    by_source = {}
+    for function in functions:
+        by_source.setdefault(function.source_id, []).append(function)
+    
+    watchers = []
+    for source_functions in by_source.values():
+        module_names = sorted({function.module_name for function in source_functions})
+        watcher = HandlerWatcher(source_functions[0].pyfile, module_names)
+        for function in source_functions:
+            function.context.function_getmtime = watcher.mtime()
+        watchers.append((watcher, source_functions))
+    return watchers
+
+
+def check_handler_watchers(watchers: list, engine):
+    """Recarrega (entre invocações) as funções cujo código mudou."""
+    for watcher, functions in watchers:
+        modules = watcher.check()
+        if not modules:
+            continue
+        
+        handlers = {}
+        for function in functions:
+            try:
+                handlers[function.name] = resolve_user_functions(modules[function.module_name], function.handler)
+            except Exception as e:
+                log.error(f"❌ [{function.name}] Recarga falhou, mantendo handler anterior: {e}")
+                continue
+            function.context.function_getmtime = watcher.mtime()
+        
+        if handlers:
+            engine.reload(handlers)
+
+
+def state_location(function, multiple: bool):
+    """Chave Redis e arquivo do estado de uma função (por função no manifesto)."""
+    if not multiple:
+        return STATE_KEY, STATE_FILE
+    
+    safe_name = ''.join(c if c.isalnum() or c in '-_.' else '_' for c in function.name)
+    root, ext = os.path.splitext(STATE_FILE)
+    return f"{function.output_key}:state", f"{root}-{safe_name}{ext}"
+
+
+class FunctionScheduler:
+    """
+    Scheduler único para as funções de um manifesto.
+    
+    Cada função é lida sem bloquear quando seu período vence:
+    - funções 'poll' que vencem juntas são lidas em um único round-trip
+      (CHANGE_SCRIPT ou MGET)
+    - funções 'notify' compartilham uma assinatura pubsub e são antecipadas
+      quando a chave de entrada é escrita
+    - funções 'list'/'stream' usam poll() da fonte e, com backlog (lote
+      cheio), são lidas de novo em seguida
+    """
+    
+    def __init__(self, redis_client, functions: list):
+        self.redis_client = redis_client
+        self.functions = functions
+        self.detection = CHANGE_DETECTION
+        self.script = create_change_script(redis_client, CHANGE_DETECTION)
+        self.pubsub = None
+        self.channels = {}
+        
+        notify = [function for function in functions if function.ingest == 'notify']
+        if notify and keyspace_notifications_enabled(redis_client):
+            db = redis_client.connection_pool.connection_kwargs.get('db', 0)
+            for function in notify:
+                self.channels.setdefault(f"__keyspace@{db}__:{function.input_key}", []).append(function)
+            self.pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            self.pubsub.subscribe(*self.channels)
+        elif notify:
+            log.warning("⚠️  Keyspace notifications desabilitadas no Redis "
+                        "(notify-keyspace-events sem 'K$'). Usando polling.")
+        
+        now = time.monotonic()
+        for function in functions:
+            function.next_run = now
+    
+    def _notified(self, message):
+        if message and message.get('type') == 'message':
+            for function in self.channels.get(_text(message['channel']), []):
+                function.next_run = 0.0
+            return True
+        return False
+    
+    def wait(self):
+        """Aguarda até a próxima função vencer ou uma notificação chegar."""
+        deadline = min(function.next_run for function in self.functions)
+        
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            
+            if self.pubsub is None:
+                time.sleep(remaining)
+                return
+            
+            if self._notified(self.pubsub.get_message(timeout=remaining)):
+                # Agrupar eventos acumulados em uma única rodada
+                while self._notified(self.pubsub.get_message(timeout=0)):
+                    pass
+                return
+    
+    def read(self):
+        """
+        Lê as entradas das funções vencidas.
+        
+        Returns:
+            Lista de pares (função, entradas)
+        """
+        now = time.monotonic()
+        due = [function for function in self.functions if function.next_run <= now]
+        
+        polled = [function for function in due if function.source.name == 'poll']
+        batches = self._read_polled(polled) if polled else []
+        
+        for function in due:
+            if function.source.name != 'poll':
+                batches.append((function, function.source.poll()))
+        
+        return batches
+    
+    def _read_polled(self, polled: list):
+        """
+        Lê as funções 'poll' vencidas em um round-trip: CHANGE_SCRIPT (só os
+        valores que mudaram voltam do servidor) ou MGET.
+        """
+        keys = [function.input_key for function in polled]
+        start = time.perf_counter()
+        batches = None
+        if self.script is not None:
+            try:
+                replies = self.script(keys=change_keys(keys, self.detection),
+                                      args=[function.source.token for function in polled])
+                batches = [(function, change_entries(reply)) for function, reply in zip(polled, replies)]
+            except redis.exceptions.ResponseError as e:
+                self.detection = change_script_failed(e)
+                self.script = None
+        
+        if batches is None:
+            values = self.redis_client.mget(keys)
+            batches = [(function, [(None, value)] if value else []) for function, value in zip(polled, values)]
+        
+        # Round-trip compartilhado: a mesma latência vale para cada função
+        elapsed = time.perf_counter() - start
+        for function in polled:
+            function.source.last_read_seconds = elapsed
+        return batches
+    
+    def reschedule(self, function, entries: list):
+        """Agenda a próxima leitura (imediata se a fonte tem backlog)."""
+        batch_size = getattr(function.source, 'batch_size', None)
+        if batch_size and len(entries) >= batch_size:
+            function.next_run = time.monotonic()
+        else:
+            delay = function.arrivals.next_delay() if function.arrivals else function.period
+            function.next_run = time.monotonic() + delay
+    
+    def close(self):
+        if self.pubsub is not None:
+            try:
+                self.pubsub.close()
+            except Exception:
+                pass
+
+
+# ============================================================================
+# RUNTIME ASSÍNCRONO (asyncio + redis.asyncio)
+# ============================================================================
+
+class AsyncPollingSource:
+    """
+    Versão asyncio de PollingSource: read(), ack() e close() são corrotinas.
+    
+    prefetch indica se a próxima leitura pode acontecer antes de as entradas
+    anteriores serem confirmadas. Por isso a leitura envia ao CHANGE_SCRIPT o
+    token da última entrada lida (read_token), não o da última confirmada:
+    uma amostra ainda em processamento volta como UNCHANGED, sem transferir o
+    payload de novo. Se o handler falhar, rewind() volta ao token confirmado
+    e a amostra é relida.
+    """
+    
+    name = 'poll'
+    prefetch = True
+    
+    def __init__(self, redis_client, key: str, period: float,
+                 detection: str = CHANGE_DETECTION):
+        self.redis_client = redis_client
+        self.key = key
+        self.period = period
+        self.schedule = None  # ArrivalEstimator (ADAPTIVE_PERIOD)
+        self.detection = detection
+        self.token = b''
+        self.read_token = b''
+        self.script = create_change_script(redis_client, detection)
+        self.last_read_seconds = None
+        self._first_read = True
+    
+    async def wait(self):
+        """Aguarda até o momento da próxima leitura."""
+        await asyncio.sleep(self.schedule.next_delay() if self.schedule else self.period)
+    
+    async def read(self):
+        """Lê a chave (a primeira leitura é imediata; as seguintes aguardam wait())."""
+        if self._first_read:
+            self._first_read = False
+        else:
+            await self.wait()
+        
+        start = time.perf_counter()
+        try:
+            if self.script is not None:
+                try:
+                    reply = await self.script(keys=change_keys([self.key], self.detection), args=[self.read_token])
+                    entries = change_entries(reply[0])
+                    if entries:
+                        self.read_token = entries[0][0]
+                    return entries
+                except redis.exceptions.ResponseError as e:
+                    self.detection = change_script_failed(e)
+                    self.script = None
+            
+            raw_data = await self.redis_client.get(self.key)
+            return [(None, raw_data)] if raw_data else []
+        finally:
+            self.last_read_seconds = time.perf_counter() - start
+    
+    async def ack(self, entry_ids):
+        for entry_id in entry_ids:
+            if entry_id is not None:
+                self.token = entry_id
+    
+    def rewind(self):
+        """Volta ao token confirmado (o handler falhou: a próxima leitura traz o valor)."""
+        self.read_token = self.token
+    
+    async def close(self):
+        pass
+
+
+class AsyncNotificationSource(AsyncPollingSource):
+    """Versão asyncio de KeyspaceNotificationSource."""
+    
+    name = 'notify'
+    
+    def __init__(self, redis_client, key: str, period: float):
+        super().__init__(redis_client, key, period)
+        
+        db = redis_client.connection_pool.connection_kwargs.get('db', 0)
+        self.channel = f"__keyspace@{db}__:{key}"
+        self.pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+    
+    async def read(self):
+        # Assinar antes da primeira leitura, para não perder eventos
+        if self._first_read:
+            await self.pubsub.subscribe(self.channel)
+        return await super().read()
+    
+    async def wait(self):
+        """Aguarda uma notificação na chave ou o timeout."""
+        deadline = time.monotonic() + self.period
+        
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            
+            message = await self.pubsub.get_message(timeout=remaining)
+            if message and message.get('type') == 'message':
+                # Descartar eventos acumulados: uma leitura basta
+                while await self.pubsub.get_message(timeout=0):
+                    pass
+                return
+    
+    async def close(self):
+        try:
+            await self.pubsub.close()
+        except Exception:
+            pass
+
+
+class AsyncListSource(AsyncPollingSource):
+    """Versão asyncio de ListSource (BLPOP + LPOP do backlog)."""
+    
+    name = 'list'
+    
+    def __init__(self, redis_client, key: str, period: float,
+                 batch_size: int = HANDLER_BATCH_SIZE):
+        super().__init__(redis_client, key, period, detection='none')
+        self.batch_size = batch_size
+        self._lpop_count_supported = True
+    
+    async def read(self):
+        item = await self.redis_client.blpop([self.key], timeout=self.period)
+        if item is None:
+            return []
+        
+        _, raw_data = item
+        entries = [(None, raw_data)]
+        
+        # Drenar backlog (LPOP com count requer Redis >= 6.2)
+        if self.batch_size > 1 and self._lpop_count_supported:
+            try:
+                backlog = await self.redis_client.lpop(self.key, self.batch_size - 1)
+            except redis.exceptions.ResponseError:
+                self._lpop_count_supported = False
+                backlog = None
+            entries.extend((None, raw) for raw in backlog or [])
+        
+        return entries
+
+
+class ThreadedSource:
+    """
+    Adapta uma fonte síncrona ao runtime asyncio, com read() e ack() em uma
+    thread dedicada. Usado no modo 'stream', cuja recuperação de pendentes
+    depende de a leitura seguinte acontecer só após o XACK (sem prefetch).
+    """
+    
+    prefetch = False
+    
+    def __init__(self, source):
+        self.source = source
+        self.name = source.name
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'source-{source.name}')
+    
+    async def read(self):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self.source.read)
+    
+    async def ack(self, entry_ids):
+        await asyncio.get_running_loop().run_in_executor(self.executor, self.source.ack, entry_ids)
+    
+    def rewind(self):
+        """Sem efeito: o stream reentrega as entradas não confirmadas."""
+    
+    async def close(self):
+        self.executor.shutdown(wait=True)
+        self.source.close()
+
+
+def create_async_source(redis_client, async_client, function):
+    """
+    Cria a fonte asyncio de uma função conforme seu modo de ingestão.
+    
+    Args:
+        redis_client: Cliente Redis síncrono (verificações e modo 'stream')
+        async_client: Cliente redis.asyncio
+        function: HostedFunction
+    """
+    mode = function.ingest
+    key = function.input_key
+    period = function.period
+    
+    if mode == 'notify':
+        if keyspace_notifications_enabled(redis_client):
+            return AsyncNotificationSource(async_client, key, period)
+        
+        log.warning("⚠️  Keyspace notifications desabilitadas no Redis "
+                    "(notify-keyspace-events sem 'K$'). Usando polling.")
+        return AsyncPollingSource(async_client, key, period)
+    
+    if mode == 'list':
+        return AsyncListSource(async_client, key, period)
+    
+    if mode == 'stream':
+        return ThreadedSource(StreamSource(redis_client, key, period))
+    
+    if mode != 'poll':
+        log.warning(f"⚠️  INGEST_MODE desconhecido '{mode}'. Usando polling.")
+    
+    source = AsyncPollingSource(async_client, key, period)
+    if function.arrivals:
+        # O atraso da próxima leitura depende da amostra anterior já processada
+        source.schedule = function.arrivals
+        source.prefetch = False
+    return source
+
+
+class AsyncFunctionRunner:
+    """
+    Executa uma função no runtime asyncio, sobrepondo as etapas:
+    - a próxima leitura acontece enquanto o handler roda (prefetch)
+    - o handler roda em um executor (thread), sem bloquear o event loop, com
+      o mesmo Context e contrato do modo síncrono
+    - a escrita dos resultados e o ack seguem em background, em ordem,
+      enquanto o handler processa a amostra seguinte
+    - o checkpoint de context.env é serializado entre invocações e gravado
+      em thread (Checkpointer)
+    """
+    
+    def __init__(self, function, source, engine, redis_client, executor):
+        self.function = function
+        self.source = source
+        self.engine = engine
+        self.redis_client = redis_client
+        self.executor = executor
+        self.queue = asyncio.Queue(maxsize=max(1, ASYNC_PREFETCH))
+        self.pending_write = None
+    
+    async def fetch(self):
+        """Lê a fonte continuamente e enfileira as entradas."""
+        while True:
+            try:
+                entries = await self.source.read()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.error(f"❌{self.function.label} Erro ao ler '{self.function.input_key}': {e}")
+                METRICS.inc('errors_total', function=self.function.name, stage='read')
+                await asyncio.sleep(MONITORING_PERIOD)
+                continue
+            
+            if not entries:
+                LOG_SUMMARY.idle(self.function.name)
+                log.debug(f"⏳ [{datetime.now().strftime('%H:%M:%S')}]{self.function.label} "
+                          f"Aguardando dados em '{self.function.input_key}'...")
+                continue
+            
+            await self.queue.put(entries)
+            if not self.source.prefetch:
+                await self.queue.join()
+    
+    async def consume(self):
+        """Processa as entradas enfileiradas, uma de cada vez."""
+        while True:
+            entries = await self.queue.get()
+            try:
+                await self.process(entries)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.error(f"❌{self.function.label} Erro durante execução: {e}", exc_info=True)
+            finally:
+                self.queue.task_done()
+    
+    async def process(self, entries: list):
+        function = self.function
+        samples, sample_ids, skipped_ids = function.select_samples(entries)
+        if not samples:
+            await self.source.ack(skipped_ids)
+            return
+        
+        timestamp = function.announce(samples)
+        
+        start_time = time.time()
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(
+                self.executor, self.engine.invoke, function.context, samples, function.profiler.next_mode()
+            )
+        except Exception:
+            function.record_handler(time.time() - start_time, len(samples), error=True)
+            self.source.rewind()
+            await self.source.ack(skipped_ids)
+            raise
+        finally:
+            function.collect_profile(self.engine)
+        elapsed_time = time.time() - start_time
+        function.record_handler(elapsed_time, len(samples))
+        
+        function.complete(samples)
+        
+        # Escrita + ack em background, encadeados com a escrita anterior
+        self.pending_write = asyncio.ensure_future(self.write(
+            self.pending_write, results, skipped_ids + sample_ids, timestamp, elapsed_time
+        ))
+        if not self.source.prefetch:
+            await self.pending_write
+    
+    async def write(self, previous, results: list, entry_ids: list, timestamp: str, elapsed_time: float):
+        if previous is not None:
+            await asyncio.wait([previous])
+        
+        try:
+            payloads = await self.function.sink.write_async(self.redis_client, results)
+        except Exception as e:
+            log.error(f"❌{self.function.label} Erro ao salvar resultado: {e}")
+            METRICS.inc('errors_total', function=self.function.name, stage='write')
+            return
+        self.function.record_write(payloads)
+        
+        await self.source.ack(entry_ids)
+        self.function.report(timestamp, elapsed_time, results, payloads)
+
+
+async def watch_handlers_async(watchers: list, engine):
+    """Verifica mudanças no código (fora do event loop) a cada segundo."""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(1)
+        try:
+            await loop.run_in_executor(None, check_handler_watchers, watchers, engine)
+        except Exception as e:
+            log.warning(f"⚠️  Erro ao verificar mudanças no handler: {e}")
+
+
+async def watch_profilers_async(functions: list, redis_client):
+    """Chaves de controle e gravação do profiling (fora do event loop)."""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(1)
+        try:
+            await loop.run_in_executor(None, check_profilers, functions, redis_client)
+        except Exception as e:
+            log.warning(f"⚠️  Erro ao verificar profiling: {e}")
+
+
+async def run_async(functions: list, engine, redis_client, watchers: list):
+    """
+    Loop asyncio: uma tarefa de leitura e uma de processamento por função,
+    todas no mesmo event loop e na mesma conexão redis.asyncio.
+    """
+    import redis.asyncio as redis_asyncio
+    
+    async_client = redis_asyncio.Redis(
+        host=REDIS_HOST,
+        port=REDIS_PORT,
+        socket_connect_timeout=10
+    )
+    executor = ThreadPoolExecutor(max_workers=max(1, EXECUTOR_WORKERS), thread_name_prefix='handler-async')
+    runners = [
+        AsyncFunctionRunner(function, create_async_source(redis_client, async_client, function),
+                            engine, async_client, executor)
+        for function in functions
+    ]
+    
+    # Ctrl+C/SIGTERM encerram o loop de forma ordenada
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    
+    tasks = [asyncio.ensure_future(runner.fetch()) for runner in runners]
+    tasks += [asyncio.ensure_future(runner.consume()) for runner in runners]
+    if watchers:
+        tasks.append(asyncio.ensure_future(watch_handlers_async(watchers, engine)))
+    tasks.append(asyncio.ensure_future(watch_profilers_async(functions, redis_client)))
+    
+    await stop.wait()
+    log.warning("\n\n⚠️  Runtime interrompido pelo usuário")
+    
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    
+    # Handlers em andamento terminam; escritas pendentes são concluídas
+    executor.shutdown(wait=True)
+    await asyncio.gather(*(runner.pending_write for runner in runners if runner.pending_write),
+                         return_exceptions=True)
+    for runner in runners:
+        await runner.source.close()
+    await async_client.close()
+
+
+# ============================================================================
+# RUNTIME PRINCIPAL
+# ============================================================================
+
+def check_data_changed(redis_client, last_data: dict, current_data: dict) -> bool:
+    """
+    Verifica se os dados mudaram desde a última execução.
+    
+    Args:
+        redis_client: Cliente Redis
+        last_data: Dados da última execução
+        current_data: Dados atuais
+    
+    Returns:
+        True se dados mudaram, False caso contrário
+    """
+    
+    if last_data is None:
+        return True
+    
+    # Comparar timestamps
+    last_ts = last_data.get('timestamp', '')
+    current_ts = current_data.get('timestamp', '')
+    
+    return last_ts != current_ts
+
+
+def validate_result(result) -> dict:
+    """Garante que o resultado do handler seja um dict JSON-encodable."""
+    if not isinstance(result, dict):
+        log.warning(f"⚠️  Aviso: Handler retornou {type(result)}, esperado dict")
+        result = {'error': 'Handler deve retornar dict', 'result': str(result)}
+    return result
+
+
+def invoke_handlers(handler_function, batch_function, context, samples: list) -> list:
+    """
+    Executa o handler sobre as amostras, em lote quando possível.
+    
+    Com mais de uma amostra e uma função de lote disponível, as amostras são
+    passadas em blocos de HANDLER_BATCH_SIZE; caso contrário o handler é
+    chamado uma vez por amostra.
+    
+    Args:
+        handler_function: Função handler do usuário
+        batch_function: Função de lote do usuário (ou None)
+        context: Contexto do runtime
+        samples: Amostras já parseadas, em ordem cronológica
+    
+    Returns:
+        Lista de resultados, um por amostra
+    """
+    
+    # Atualizar metadados do contexto
+    context.last_execution = datetime.now().isoformat()
+    
+    if batch_function is None or len(samples) == 1:
+        return [validate_result(handler_function(sample, context)) for sample in samples]
+    
+    results = []
+    for start in range(0, len(samples), HANDLER_BATCH_SIZE):
+        chunk = samples[start:start + HANDLER_BATCH_SIZE]
+        chunk_results = batch_function(chunk, context)
+        
+        if not isinstance(chunk_results, list) or len(chunk_results) != len(chunk):
+            raise ValueError(f"{HANDLER_BATCH_FUNCTION} deve retornar uma lista com "
+                             f"{len(chunk)} resultados")
+        
+        results.extend(validate_result(result) for result in chunk_results)
+    
+    return results
+
+
+def run_single(function, engine, redis_client, watchers: list):
+    """Loop de uma única função: a fonte bloqueia até o próximo dado."""
+    while True:
+        try:
+            # Recarregar o handler se o código mudou (entre invocações)
+            check_handler_watchers(watchers, engine)
+            check_profilers([function], redis_client)
+            
+            # Ler dados do Redis (a fonte aguarda o próximo dado)
+            entries = function.source.read()
+            
+            if not entries:
+                LOG_SUMMARY.idle(function.name)
+                log.debug(f"⏳ [{datetime.now().strftime('%H:%M:%S')}] Aguardando dados em '{function.input_key}'...")
+                continue
+            
+            function.process(entries, engine, redis_client)
+            
+        except KeyboardInterrupt:
+            log.warning("\n\n⚠️  Runtime interrompido pelo usuário")
+            break
+            
+        except Exception as e:
+            log.error(f"❌ Erro durante execução: {e}", exc_info=True)
+            METRICS.inc('errors_total', function=function.name, stage='loop')
+            
+            # Evitar loop apertado em caso de erro persistente (ex: Redis fora)
+            time.sleep(MONITORING_PERIOD)
+
+
+def run_scheduled(functions: list, engine, redis_client, watchers: list):
+    """Loop multi-função: um scheduler e uma conexão Redis para todas."""
+    scheduler = FunctionScheduler(redis_client, functions)
+    
+    while True:
+        try:
+            check_handler_watchers(watchers, engine)
+            check_profilers(functions, redis_client)
+            scheduler.wait()
+            
+            for function, entries in scheduler.read():
+                if not entries:
+                    LOG_SUMMARY.idle(function.name)
+                try:
+                    function.process(entries, engine, redis_client)
+                except KeyboardInterrupt:
+                    raise
+                except Exception as e:
+                    # Erro isolado: as demais funções seguem
+                    log.error(f"❌ [{function.name}] Erro durante execução: {e}", exc_info=True)
+                scheduler.reschedule(function, entries)
+            
+        except KeyboardInterrupt:
+            log.warning("\n\n⚠️  Runtime interrompido pelo usuário")
+            break
+            
+        except Exception as e:
+            log.error(f"❌ Erro durante execução: {e}", exc_info=True)
+            METRICS.inc('errors_total', function='scheduler', stage='loop')
+            
+            # Evitar loop apertado em caso de erro persistente (ex: Redis fora)
+            time.sleep(MONITORING_PERIOD)
+    
+    scheduler.close()
+
+
+def main():
+    """
+    Loop principal do runtime serverless.
+    
+    Fluxo:
+    1. Conectar ao Redis
+    2. Carregar função(ões) do usuário (variáveis de ambiente ou manifesto)
+    3. Loop infinito:
+       a. Aguardar e ler dados do Redis (polling, notificação ou BLPOP; com
+          várias funções, um scheduler único lê as que venceram)
+       b. Verificar se mudaram
+       c. Chamar handler (ou função de lote, se houver backlog)
+       d. Persistir context.env
+       e. Salvar resultado(s) no Redis em um único round-trip
+    """
+    
+    # Logs via fila (a escrita no stdout acontece em uma thread própria)
+    setup_logging()
+    
+    # Funções hospedadas
+    try:
+        functions = load_manifest() if FUNCTIONS_MANIFEST else [HostedFunction(HANDLER_FUNCTION)]
+    except Exception as e:
+        log.error(f"❌ Erro ao ler manifesto {FUNCTIONS_MANIFEST}: {e}")
+        sys.exit(1)
+    multiple = len(functions) > 1
+    
+    log.info("=" * 80)
+    log.info("🚀 Runtime Serverless Customizado - TP3")
+    log.info("=" * 80)
+    log.info(f"📍 Redis: {REDIS_HOST}:{REDIS_PORT}")
+    if FUNCTIONS_MANIFEST:
+        log.info(f"📋 Manifesto: {FUNCTIONS_MANIFEST} ({len(functions)} funções)")
+        for function in functions:
+            log.info(f"   • {function.name}: {function.handler} | {function.input_key} → "
+                     f"{function.output_key} | {function.period:g}s | {function.ingest}")
+    else:
+        log.info(f"📥 Input Key: {REDIS_INPUT_KEY}")
+        log.info(f"📤 Output Key: {REDIS_OUTPUT_KEY}")
+        log.info(f"⏱️  Monitoring Period: {MONITORING_PERIOD}s")
+        log.info(f"📡 Ingest Mode: {INGEST_MODE}")
+    if PROFILE_MODE != 'none':
+        log.info(f"🔬 Profiling: {PROFILE_MODE} a cada {PROFILE_EVERY} invocações → {PROFILE_OUTPUT}")
+    if CHANGE_DETECTION != 'none':
+        log.info(f"🔍 Detecção de mudança: {CHANGE_DETECTION}")
+    if ADAPTIVE_PERIOD:
+        log.info(f"📈 Período adaptativo: margem {ADAPTIVE_MARGIN}s | jitter {ADAPTIVE_JITTER:.0%} | "
+                 f"backoff até {ADAPTIVE_MAX_PERIOD:g}s")
+    if INGEST_MODE == 'stream' or any(function.ingest == 'stream' for function in functions):
+        log.info(f"🧵 Stream Group: {STREAM_GROUP} | Consumer: {STREAM_CONSUMER} | Batch: {STREAM_BATCH_SIZE}")
+    if RUNTIME_MODE == 'async':
+        log.info(f"🔀 Runtime Mode: async | Prefetch: {ASYNC_PREFETCH}")
+    if EXECUTOR_MODE != 'inline' or HANDLER_TIMEOUT > 0:
+        log.info(f"⚙️  Executor: {EXECUTOR_MODE} | Workers: {EXECUTOR_WORKERS} | "
+                 f"Timeout: {HANDLER_TIMEOUT or '-'}s por amostra")
+    if STATE_BACKEND != 'none':
+        log.info(f"💾 State Backend: {STATE_BACKEND} | Checkpoint a cada {CHECKPOINT_EVERY} execuções")
+    if not FUNCTIONS_MANIFEST:
+        log.info(f"🔧 Handler Function: {HANDLER_FUNCTION}")
+    if ZIP_URL:
+        log.info(f"📦 ZIP URL: {ZIP_URL}")
+    if LOG_SUMMARY_INTERVAL > 0:
+        log.info(f"📋 Logs: {LOG_FORMAT} | {LOG_LEVEL} | resumo a cada {LOG_SUMMARY_INTERVAL:g}s")
+    log.info("=" * 80)
+    
+    # Conectar ao Redis (um pool de conexões compartilhado por todas as
+    # funções; respostas em bytes, decodificadas só pelo codec de entrada)
+    log.info("\n🔌 Conectando ao Redis...")
+    try:
+        redis_client = redis.Redis(
+            host=REDIS_HOST,
+            port=REDIS_PORT,
+            socket_connect_timeout=10
+        )
+        redis_client.ping()
+        log.info("✅ Conectado ao Redis com sucesso!")
+    except Exception as e:
+        log.error(f"❌ Erro ao conectar ao Redis: {e}")
+        sys.exit(1)
+    
+    # Carregar função(ões) do usuário
+    log.info("\n📚 Carregando função do usuário...")
+    try:
+        handlers = load_hosted_functions(functions)
+    except Exception as e:
+        log.error(f"❌ Erro ao carregar função: {e}")
+        sys.exit(1)
+    
+    # Observar mudanças no código do handler (hot reload)
+    watchers = create_handler_watchers(functions)
+    
+    # Restaurar context.env do último checkpoint de cada função, se houver
+    state_client = create_state_redis_client() if STATE_BACKEND == 'redis' else None
+    for function in functions:
+        state_key, state_file = state_location(function, multiple)
+        state_backend = create_state_backend(STATE_BACKEND, state_key, state_file, state_client)
+        if state_backend:
+            function.checkpointer = Checkpointer(state_backend)
+            function.checkpointer.restore(function.context)
+    
+    # SIGTERM (rollout/restart do pod) encerra o loop como Ctrl+C, para o
+    # checkpoint final ser gravado
+    def handle_sigterm(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    
+    # Criar fontes de entrada (no scheduler multi-função, 'notify' usa a
+    # assinatura compartilhada e lê a chave como 'poll'; no modo async as
+    # fontes são criadas pelo run_async)
+    for function in functions:
+        if multiple:
+            function.label = f" [{function.name}]"
+        if RUNTIME_MODE == 'async':
+            continue
+        mode = 'poll' if multiple and function.ingest == 'notify' else function.ingest
+        function.source = create_input_source(redis_client, mode, function.input_key, function.period)
+        if function.arrivals:
+            function.source.schedule = function.arrivals
+        if not multiple:
+            log.info(f"📡 Fonte de entrada: {function.source.name}")
+    
+    # Workers pré-criados após carregar o handler (e restaurar o env)
+    engine = create_execution_engine(handlers)
+    log.info(f"⚙️  Motor de execução: {engine.name}")
+    
+    # Endpoint /metrics (thread em background)
+    METRICS.add_collector(lambda: collect_function_metrics(functions))
+    metrics_server = start_metrics_server()
+    
+    log.info("\n✨ Runtime iniciado! Aguardando dados...\n")
+    
+    if RUNTIME_MODE == 'async':
+        if EXECUTOR_MODE == 'inline' and HANDLER_TIMEOUT > 0:
+            log.warning("⚠️  HANDLER_TIMEOUT no modo async requer EXECUTOR_MODE=thread ou process")
+        asyncio.run(run_async(functions, engine, redis_client, watchers))
+    elif multiple:
+        run_scheduled(functions, engine, redis_client, watchers)
+    else:
+        run_single(functions[0], engine, redis_client, watchers)
+    
+    engine.close()
+    if metrics_server:
+        metrics_server.shutdown()
+    try:
+        check_profilers(functions, redis_client)
+    except Exception as e:
+        log.warning(f"⚠️  Erro ao gravar profiling: {e}")
+    for function in functions:
+        if function.source:
+            function.source.close()
+        if function.checkpointer:
+            function.checkpointer.close(function.context, function.execution_count)
+    LOG_SUMMARY.flush()
+    log.info("\n👋 Runtime encerrado")
 
 
 # ============================================================================
@@ -0,0 +1,674 @@
+"""
+Testes do runtime (Task 3).
+
+Uso (a partir de task3/; os testes com Redis usam o fakeredis):
+
+    pip install pytest fakeredis
+    python -m pytest -q test_runtime.py
+"""
+
+import collections
+import hashlib
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import runtime
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+requires_fakeredis = unittest.skipIf(fakeredis is None, "requer o pacote fakeredis")
+
+
+def _sample(index: int, **fields) -> dict:
+    """Amostra no formato do coletor, com timestamp a cada 5s."""
+    sample = {'timestamp': f'2025-01-01 00:{index // 12:02d}:{index % 12 * 5:02d}', 'cpu_percent-0': float(index)}
+    sample.update(fields)
+    return sample
+
+
+def _metrics() -> 'runtime.MetricsRegistry':
+    """Registro novo (habilitado) com as métricas declaradas pelo runtime."""
+    registry = runtime.MetricsRegistry()
+    registry.metadata = dict(runtime.METRICS.metadata)
+    return registry
+
+
+def _slow_handler(input_data, context):
+    time.sleep(5)
+    return {}
+
+
+def _fast_handler(input_data, context):
+    return {'ok': True}
+
+
+class ProcessEngineTimeoutTest(unittest.TestCase):
+    """HANDLER_TIMEOUT no motor de processos."""
+
+    def setUp(self):
+        handlers = {'slow': (_slow_handler, None), 'fast': (_fast_handler, None)}
+        self.engine = runtime.ProcessEngine(handlers, workers=1)
+        self.addCleanup(self.engine.close)
+
+    def test_timeout_raises_handler_timeout_and_replaces_worker_once(self):
+        replace = mock.patch.object(self.engine, '_replace', wraps=self.engine._replace)
+        with mock.patch.object(runtime, 'HANDLER_TIMEOUT', 0.2), replace as replaced:
+            with self.assertRaises(runtime.HandlerTimeout):
+                self.engine.invoke(runtime.Context(function_name='slow'), [{}])
+
+        self.assertEqual(replaced.call_count, 1)
+
+        # O worker novo atende normalmente
+        results = self.engine.invoke(runtime.Context(function_name='fast'), [{}])
+        self.assertEqual(results, [{'ok': True}])
+
+
+class MetricsRegistryRenderTest(unittest.TestCase):
+    """Formato de exposição do /metrics."""
+
+    def setUp(self):
+        self.registry = runtime.MetricsRegistry()
+        self.registry.describe('executions_total', 'counter', 'Execuções')
+        self.registry.describe('payload_bytes', 'histogram', 'Payloads', runtime.MetricsRegistry.SIZE_BUCKETS)
+
+    def test_large_counters_and_sums_keep_full_precision(self):
+        self.registry.inc('executions_total', 1234567)
+        for _ in range(40000):
+            self.registry.observe('payload_bytes', 251)
+
+        lines = self.registry.render().splitlines()
+        self.assertIn('serverless_runtime_executions_total 1234567', lines)
+        self.assertIn('serverless_runtime_payload_bytes_sum 10040000.0', lines)
+        self.assertIn('serverless_runtime_payload_bytes_bucket{le="1048576"} 40000', lines)
+
+
+class InvokeHandlersTest(unittest.TestCase):
+    """Invocação em lote (HANDLER_BATCH_FUNCTION) das amostras acumuladas."""
+
+    def setUp(self):
+        self.context = runtime.Context(function_name='fn')
+        self.chunks = []
+
+    def _handler(self, input_data, context):
+        return {'value': input_data['cpu_percent-0']}
+
+    def _batch(self, inputs, context):
+        self.chunks.append(len(inputs))
+        return [self._handler(input_data, context) for input_data in inputs]
+
+    def test_backlog_is_passed_in_chunks_of_batch_size(self):
+        samples = [_sample(index) for index in range(7)]
+
+        with mock.patch.object(runtime, 'HANDLER_BATCH_SIZE', 3):
+            results = runtime.invoke_handlers(self._handler, self._batch, self.context, samples)
+
+        self.assertEqual(self.chunks, [3, 3, 1])
+        self.assertEqual(results, [{'value': float(index)} for index in range(7)])
+
+    def test_single_sample_and_missing_batch_function_use_handler(self):
+        results = runtime.invoke_handlers(self._handler, self._batch, self.context, [_sample(1)])
+        self.assertEqual(results, [{'value': 1.0}])
+
+        samples = [_sample(index) for index in range(3)]
+        results = runtime.invoke_handlers(self._handler, None, self.context, samples)
+        self.assertEqual(results, [{'value': 0.0}, {'value': 1.0}, {'value': 2.0}])
+        self.assertEqual(self.chunks, [])
+
+    def test_batch_returning_wrong_number_of_results_is_rejected(self):
+        def short_batch(inputs, context):
+            return [{}] * (len(inputs) - 1)
+
+        with self.assertRaises(ValueError):
+            runtime.invoke_handlers(self._handler, short_batch, self.context, [_sample(0), _sample(1)])
+
+
+@requires_fakeredis
+class ExecutionCountTest(unittest.TestCase):
+    """executions_total conta só amostras processadas com sucesso."""
+
+    def test_failed_invocations_count_as_errors_not_executions(self):
+        redis_client = fakeredis.FakeRedis()
+        calls = []
+
+        def flaky_handler(input_data, context):
+            calls.append(input_data['timestamp'])
+            if len(calls) <= 2:
+                raise RuntimeError("falha temporária")
+            return {'value': input_data['cpu_percent-0']}
+
+        function = runtime.HostedFunction('flaky', input_key='in', output_key='out', ingest='stream')
+        function.source = runtime.StreamSource(redis_client, 'in', period=0.01)
+        engine = runtime.InlineEngine({'flaky': (flaky_handler, None)})
+        for index in range(3):
+            redis_client.xadd('in', {runtime.STREAM_FIELD: json.dumps(_sample(index))})
+
+        with mock.patch.object(runtime, 'METRICS', _metrics()) as metrics:
+            processed = 0
+            for _ in range(10):
+                try:
+                    processed += function.process(function.source.read(block=False), engine, redis_client)
+                except RuntimeError:
+                    pass
+
+        self.assertEqual(processed, 3)
+        self.assertEqual(function.execution_count, 3)
+        errors = metrics.counters[('errors_total', (('function', 'flaky'), ('stage', 'handler')))]
+        self.assertEqual(errors, 2)
+
+
+@requires_fakeredis
+class StreamSourceTest(unittest.TestCase):
+    """INGEST_MODE=stream: confirmação, reentrega e descarte de entradas."""
+
+    def setUp(self):
+        self.redis_client = fakeredis.FakeRedis()
+        self.source = runtime.StreamSource(self.redis_client, 'in', period=0.01)
+
+    def _add(self, payload) -> bytes:
+        return self.redis_client.xadd('in', {runtime.STREAM_FIELD: payload})
+
+    def _pending(self) -> int:
+        return self.redis_client.xpending('in', runtime.STREAM_GROUP)['pending']
+
+    def test_ack_removes_entries_from_the_pending_list(self):
+        entry_ids = [self._add(json.dumps(_sample(index))) for index in range(3)]
+
+        entries = self.source.read(block=False)
+        self.assertEqual([entry_id for entry_id, _ in entries], entry_ids)
+        self.assertEqual(json.loads(entries[0][1]), _sample(0))
+        self.assertEqual(self._pending(), 3)
+
+        self.source.ack([entry_id for entry_id, _ in entries])
+        self.assertEqual(self._pending(), 0)
+        self.assertEqual(self.source.read(block=False), [])
+
+    def test_unacked_entries_are_delivered_again(self):
+        for index in range(2):
+            self._add(json.dumps(_sample(index)))
+
+        first = self.source.read(block=False)
+        # Handler falhou: nada confirmado, o próximo read reprocessa o lote
+        self.assertEqual(self.source.read(block=False), first)
+
+        self._add(json.dumps(_sample(2)))
+        self.source.ack([entry_id for entry_id, _ in first])
+        (_, raw_data), = self.source.read(block=False)
+        self.assertEqual(json.loads(raw_data), _sample(2))
+
+    def test_poison_entry_is_dropped_after_max_deliveries(self):
+        self.source.max_deliveries = 2
+        self._add(b'{sem json')
+
+        deliveries = [self.source.read(block=False) for _ in range(4)]
+
+        self.assertEqual([len(entries) for entries in deliveries], [1, 1, 1, 0])
+        self.assertEqual(self._pending(), 0)
+
+    def test_entries_without_payload_field_are_acked_and_skipped(self):
+        self.redis_client.xadd('in', {'outro': 'campo'})
+        self._add(json.dumps(_sample(0)))
+
+        (_, raw_data), = self.source.read(block=False)
+        self.assertEqual(json.loads(raw_data), _sample(0))
+        self.assertEqual(self._pending(), 1)
+
+
+def _counting_handler(input_data, context):
+    context.env['count'] = context.env.get('count', 0) + 1
+    return {'function': context.function_name, 'count': context.env['count'],
+            'cpu': input_data['cpu_percent-0']}
+
+
+class LoadManifestTest(unittest.TestCase):
+    """Leitura e validação do FUNCTIONS_MANIFEST."""
+
+    def _load(self, functions):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'functions.json')
+            with open(path, 'w') as f:
+                json.dump({'functions': functions}, f)
+            return runtime.load_manifest(path)
+
+    def test_each_function_gets_its_own_state(self):
+        a, b = self._load([
+            {'name': 'a', 'handler': 'handler_module.handler', 'input_key': 'in', 'output_key': 'out-a'},
+            {'name': 'b', 'handler': 'handler_module.handler', 'input_key': 'in', 'output_key': 'out-b',
+             'period': 1, 'output_codec': 'zlib'},
+        ])
+
+        self.assertIsNot(a.context, b.context)
+        self.assertIsNot(a.context.env, b.context.env)
+        self.assertEqual((a.context.function_name, b.context.function_name), ('a', 'b'))
+        self.assertEqual((a.sink.output_key, b.sink.output_key), ('out-a', 'out-b'))
+        self.assertEqual(b.period, 1.0)
+        self.assertEqual(b.sink.codec.name, 'zlib')
+        self.assertEqual(runtime.state_location(a, multiple=True)[0], 'out-a:state')
+        self.assertNotEqual(runtime.state_location(a, multiple=True)[1],
+                            runtime.state_location(b, multiple=True)[1])
+
+    def test_invalid_manifests_are_rejected(self):
+        invalid = [
+            [],
+            [{'handler': 'handler', 'output_key': 'out'}],
+            [{'handler': 'handler_module.handler'}],
+            [{'handler': 'handler_module.handler', 'output_key': 'out'},
+             {'handler': 'handler_module.handler', 'output_key': 'out-2'}],
+            [{'name': 'a', 'handler': 'handler_module.handler', 'output_key': 'out'},
+             {'name': 'b', 'handler': 'handler_module.handler', 'output_key': 'out'}],
+        ]
+        for functions in invalid:
+            with self.subTest(functions=functions), self.assertRaises(ValueError):
+                self._load(functions)
+
+
+@requires_fakeredis
+class FunctionSchedulerTest(unittest.TestCase):
+    """Várias funções em um scheduler: estado e saídas isolados por função."""
+
+    def setUp(self):
+        self.redis_client = fakeredis.FakeRedis()
+        self.functions = [
+            runtime.HostedFunction(name, handler='handler_module.handler', input_key=f'in-{name}',
+                                   output_key=f'out-{name}', ingest='poll', adaptive=False)
+            for name in ('a', 'b')
+        ]
+        for function in self.functions:
+            function.source = runtime.create_input_source(self.redis_client, 'poll', function.input_key, 0)
+        self.engine = runtime.InlineEngine({'a': (_counting_handler, None), 'b': (_counting_handler, None)})
+        self.scheduler = runtime.FunctionScheduler(self.redis_client, self.functions)
+        self.addCleanup(self.scheduler.close)
+
+    def _round(self):
+        with mock.patch.object(runtime, 'METRICS', _metrics()):
+            for function, entries in self.scheduler.read():
+                try:
+                    function.process(entries, self.engine, self.redis_client)
+                except RuntimeError:
+                    pass
+                self.scheduler.reschedule(function, entries)
+        for function in self.functions:
+            function.next_run = 0.0
+
+    def _output(self, key):
+        return json.loads(self.redis_client.get(key))
+
+    def test_functions_keep_separate_context_and_outputs(self):
+        self.redis_client.set('in-b', json.dumps(_sample(100)))
+        for index in range(3):
+            self.redis_client.set('in-a', json.dumps(_sample(index)))
+            self._round()
+
+        self.assertEqual(self._output('out-a'), {'function': 'a', 'count': 3, 'cpu': 2.0})
+        self.assertEqual(self._output('out-b'), {'function': 'b', 'count': 1, 'cpu': 100.0})
+        self.assertEqual([function.execution_count for function in self.functions], [3, 1])
+        self.assertEqual([function.context.env for function in self.functions], [{'count': 3}, {'count': 1}])
+
+    def test_failing_function_does_not_affect_the_others(self):
+        def failing_handler(input_data, context):
+            raise RuntimeError("falha só em b")
+        self.engine.reload({'b': (failing_handler, None)})
+
+        for index in range(2):
+            self.redis_client.set('in-a', json.dumps(_sample(index)))
+            self.redis_client.set('in-b', json.dumps(_sample(index)))
+            self._round()
+
+        self.assertEqual(self._output('out-a')['count'], 2)
+        self.assertIsNone(self.redis_client.get('out-b'))
+        self.assertEqual(self.functions[1].execution_count, 0)
+
+
+class CheckpointerTest(unittest.TestCase):
+    """Persistência de context.env (STATE_BACKEND) e warm start."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'state', 'context.pkl')
+        self.env = {'cpu_history': {'0': [1.5, 2.5, 3.5]}, 'counts': collections.Counter(a=2)}
+
+    def _round_trip(self, backend):
+        checkpointer = runtime.Checkpointer(backend, every=3, async_write=False)
+        context = runtime.Context(function_name='fn')
+        context.env = self.env
+
+        for execution_count in range(1, 3):
+            checkpointer.maybe_checkpoint(context, execution_count)
+        self.assertEqual(checkpointer.checkpoints, 0)
+        checkpointer.maybe_checkpoint(context, 3)
+        self.assertEqual(checkpointer.checkpoints, 1)
+
+        restored = runtime.Context(function_name='fn')
+        runtime.Checkpointer(backend, async_write=False).restore(restored)
+        self.assertEqual(restored.env, self.env)
+
+    def test_file_backend(self):
+        self._round_trip(runtime.FileStateBackend(self.path))
+
+    @requires_fakeredis
+    def test_redis_backend(self):
+        self._round_trip(runtime.RedisStateBackend('out:state', fakeredis.FakeRedis()))
+
+    def test_unreadable_keys_do_not_block_the_others(self):
+        fields = runtime.encode_env(dict(self.env, broken=1, **{'lambda': lambda: None}))
+        fields['broken'] = b'corrompido'
+
+        self.assertNotIn('lambda', fields)
+        self.assertEqual(runtime.decode_env(fields), self.env)
+
+    def test_close_writes_pending_executions(self):
+        backend = runtime.FileStateBackend(self.path)
+        checkpointer = runtime.Checkpointer(backend, every=100, async_write=True)
+        context = runtime.Context(function_name='fn')
+        context.env = self.env
+
+        checkpointer.maybe_checkpoint(context, 5)
+        checkpointer.close(context, 5)
+
+        restored = runtime.Context(function_name='fn')
+        runtime.Checkpointer(backend, async_write=False).restore(restored)
+        self.assertEqual(restored.env, self.env)
+
+    def test_missing_state_starts_empty(self):
+        context = runtime.Context(function_name='fn')
+        runtime.Checkpointer(runtime.FileStateBackend(self.path), async_write=False).restore(context)
+        self.assertEqual(context.env, {})
+
+
+class ArrivalEstimatorTest(unittest.TestCase):
+    """ADAPTIVE_PERIOD: agenda a leitura pela cadência do produtor."""
+
+    START = 1_700_000_000.0
+
+    def setUp(self):
+        self.estimator = runtime.ArrivalEstimator(5.0, margin=0.2, jitter=0.0, max_period=10.0)
+
+    def _observe(self, index: int, delay: float = 0.5):
+        """Amostra index (a cada 5s) lida delay segundos após o timestamp."""
+        sample_time = self.START + 5 * index
+        self.estimator.observe({'timestamp': sample_time}, received=sample_time + delay)
+        return sample_time + delay
+
+    def _next_delay(self, now: float) -> float:
+        with mock.patch.object(runtime.time, 'time', return_value=now):
+            return self.estimator.next_delay()
+
+    def test_learns_interval_and_reads_right_after_next_sample(self):
+        self.assertEqual(self._next_delay(self.START), 5.0)
+
+        self._observe(0)
+        # Aprendendo: lê a cada period / 4
+        self.assertEqual(self._next_delay(self.START), 1.25)
+
+        for index in range(1, 4):
+            now = self._observe(index)
+
+        self.assertEqual(self.estimator.interval, 5.0)
+        # timestamp + intervalo + offset (0.5s) + margem, contado a partir da leitura
+        self.assertAlmostEqual(self._next_delay(now), 5.2)
+
+    def test_drift_tracks_reads_later_than_the_minimum_offset(self):
+        for index in range(4):
+            self._observe(index)
+        self.assertAlmostEqual(self.estimator.drift, 0.0)
+
+        self._observe(4, delay=2.5)
+        self.assertAlmostEqual(self.estimator.drift, 0.2 * 2.0)
+
+        self._observe(5)
+        self.assertAlmostEqual(self.estimator.drift, 0.8 * 0.4)
+
+    def test_samples_skipped_by_the_producer_are_counted(self):
+        for index in (0, 1, 2, 3, 6):
+            self._observe(index)
+
+        self.assertEqual(self.estimator.skipped, 2)
+        self.assertEqual(self.estimator.interval, 5.0)
+
+    def test_backoff_without_new_data_is_exponential_and_capped(self):
+        for index in range(4):
+            now = self._observe(index)
+        self._next_delay(now)
+
+        delays = []
+        for _ in range(8):
+            self.estimator.duplicate()
+            delays.append(self._next_delay(now))
+
+        self.assertEqual(delays, [0.2, 0.4, 0.8, 1.6, 3.2, 6.4, 10.0, 10.0])
+        self.assertEqual((self.estimator.duplicates, self.estimator.idle_reads), (8, 8))
+
+        # Dado novo: volta a seguir o produtor
+        now = self._observe(4)
+        self.assertAlmostEqual(self._next_delay(now), 5.2)
+
+    def test_periodic_probe_at_half_the_interval(self):
+        for index in range(runtime.ArrivalEstimator.PROBE_EVERY):
+            now = self._observe(index)
+
+        # Metade do intervalo: detecta um produtor que passou a publicar mais rápido
+        self.assertAlmostEqual(self._next_delay(now), 2.5 + 0.2)
+        self.assertEqual(self.estimator.fresh_streak, 0)
+
+
+class CodecDetectionTest(unittest.TestCase):
+    """INPUT_CODEC=auto: formato do payload identificado pelo primeiro byte."""
+
+    def setUp(self):
+        self.sample = _sample(3, **{'virtual_memory-total': 8 * 1024 ** 3})
+
+    def test_json_payloads(self):
+        payload = json.dumps(self.sample)
+        for raw in (payload, payload.encode(), b'  ' + payload.encode()):
+            with self.subTest(raw=raw[:4]):
+                self.assertIs(runtime.detect_codec(raw), runtime.FAST_JSON_CODEC)
+                self.assertEqual(runtime.AUTO_CODEC.decode(raw), self.sample)
+
+        self.assertEqual(runtime.AUTO_CODEC.decode(b'[1, 2]'), [1, 2])
+
+    def test_zlib_payload(self):
+        raw = runtime.ZLIB_CODEC.encode(self.sample)
+        self.assertIs(runtime.detect_codec(raw), runtime.ZLIB_CODEC)
+        self.assertEqual(runtime.AUTO_CODEC.decode(raw), self.sample)
+
+    @unittest.skipIf(runtime.MSGPACK_CODEC is None, "requer o pacote msgpack")
+    def test_msgpack_payloads(self):
+        for obj in (self.sample, [self.sample] * 20, {str(i): i for i in range(20)}):
+            raw = runtime.MSGPACK_CODEC.encode(obj)
+            with self.subTest(first_byte=hex(raw[0])):
+                self.assertIs(runtime.detect_codec(raw), runtime.MSGPACK_CODEC)
+                self.assertEqual(runtime.AUTO_CODEC.decode(raw), obj)
+
+    def test_auto_codec_encodes_as_json(self):
+        self.assertEqual(json.loads(runtime.AUTO_CODEC.encode(self.sample)), self.sample)
+
+    def test_unknown_or_missing_codecs_fall_back_to_json(self):
+        self.assertIs(runtime.get_codec('yaml'), runtime.JSON_CODEC)
+        if runtime.MSGPACK_CODEC is None:
+            self.assertIs(runtime.get_codec('msgpack'), runtime.JSON_CODEC)
+        else:
+            self.assertIs(runtime.get_codec('msgpack'), runtime.MSGPACK_CODEC)
+
+
+@requires_fakeredis
+class OutputSinkTest(unittest.TestCase):
+    """Último resultado e série temporal (OUTPUT_HISTORY) em um round-trip."""
+
+    def setUp(self):
+        self.redis_client = fakeredis.FakeRedis()
+        self.results = [{'timestamp': _sample(index)['timestamp'], 'value': index} for index in range(3)]
+
+    def test_without_history_only_the_last_result_is_written(self):
+        sink = runtime.OutputSink('out', history='none', ttl=30)
+        sink.write(self.redis_client, self.results)
+
+        self.assertEqual(json.loads(self.redis_client.get('out')), self.results[-1])
+        self.assertTrue(0 < self.redis_client.ttl('out') <= 30)
+        self.assertEqual(self.redis_client.keys(), [b'out'])
+        self.assertEqual(sink.last_commands, 1)
+
+    def test_stream_history_keeps_every_result_in_order(self):
+        sink = runtime.OutputSink('out', history='stream', ttl=60)
+        sink.write(self.redis_client, self.results[:2])
+        sink.write(self.redis_client, self.results[2:])
+
+        entries = self.redis_client.xrange('out:history')
+        self.assertEqual([json.loads(fields[b'data']) for _, fields in entries], self.results)
+        self.assertNotIn(b'enc', entries[0][1])
+        self.assertTrue(0 < self.redis_client.ttl('out:history') <= 60)
+        self.assertEqual(sink.last_commands, 3)  # SET, XADD e EXPIRE
+
+    def test_stream_history_with_compressed_encoding(self):
+        sink = runtime.OutputSink('out', history='stream', encoding='zlib')
+        sink.write(self.redis_client, self.results)
+
+        (_, fields), *_ = self.redis_client.xrange('out:history')
+        self.assertEqual(fields[b'enc'], b'zlib')
+        self.assertEqual(runtime.get_codec('zlib').decode(fields[b'data']), self.results[0])
+        self.assertEqual(self.redis_client.ttl('out:history'), -1)
+
+    def test_zset_scores_follow_sample_timestamps(self):
+        sink = runtime.OutputSink('out', history='zset', maxlen=2, ttl=60)
+        sink.write(self.redis_client, [self.results[2], self.results[0]])
+        sink.write(self.redis_client, [self.results[1]])
+
+        members = self.redis_client.zrange('out:history', 0, -1, withscores=True)
+        # maxlen=2: o resultado mais antigo (value 0) é removido
+        self.assertEqual([json.loads(member.split(b'|', 1)[1])['value'] for member, _ in members], [1, 2])
+        self.assertEqual([score for _, score in members],
+                         [runtime.parse_sample_time(self.results[index]['timestamp']) for index in (1, 2)])
+        self.assertTrue(0 < self.redis_client.ttl('out:history') <= 60)
+
+    def test_zset_results_without_timestamp_use_write_time(self):
+        sink = runtime.OutputSink('out', history='zset')
+        before = time.time()
+        sink.write(self.redis_client, [{'value': 1}])
+
+        (member, score), = self.redis_client.zrange('out:history', 0, -1, withscores=True)
+        self.assertGreaterEqual(score, before)
+        self.assertEqual(json.loads(member.split(b'|', 1)[1]), {'value': 1})
+
+
+def _supports_sha1hex(redis_client) -> bool:
+    """O fakeredis não implementa redis.sha1hex (detecção 'digest')."""
+    try:
+        redis_client.eval("return redis.sha1hex('x')", 0)
+    except Exception:
+        return False
+    return True
+
+
+@requires_fakeredis
+class ChangeDetectionTest(unittest.TestCase):
+    """CHANGE_DETECTION: entradas sem mudança são descartadas antes do parse."""
+
+    def setUp(self):
+        self.redis_client = fakeredis.FakeRedis()
+        self.payload = json.dumps(_sample(0)).encode()
+        self.redis_client.set('in', self.payload)
+
+    def _source(self, detection: str) -> 'runtime.PollingSource':
+        return runtime.PollingSource(self.redis_client, 'in', period=0, detection=detection)
+
+    def test_version_token_skips_unchanged_input(self):
+        self.redis_client.set('in' + runtime.CHANGE_VERSION_SUFFIX, 1)
+        source = self._source('version')
+
+        self.assertEqual(source.poll(), [(b'1', self.payload)])
+        # Sem ack (handler falhou) o valor volta na próxima leitura
+        self.assertEqual(source.poll(), [(b'1', self.payload)])
+
+        source.ack([b'1'])
+        self.assertEqual(source.poll(), [(b'1', runtime.UNCHANGED)])
+
+        changed = json.dumps(_sample(1)).encode()
+        self.redis_client.set('in', changed)
+        self.redis_client.incr('in' + runtime.CHANGE_VERSION_SUFFIX)
+        self.assertEqual(source.poll(), [(b'2', changed)])
+
+    def test_missing_input_key(self):
+        self.redis_client.delete('in')
+        self.assertEqual(self._source('version').poll(), [])
+        self.assertEqual(self._source('raw').poll(), [])
+
+    def test_digest_token_skips_unchanged_input(self):
+        if not _supports_sha1hex(self.redis_client):
+            self.skipTest("servidor sem redis.sha1hex")
+        source = self._source('digest')
+
+        (token, payload), = source.poll()
+        self.assertEqual((token.decode(), payload), (hashlib.sha1(self.payload).hexdigest(), self.payload))
+        source.ack([token])
+        self.assertEqual(source.poll(), [(token, runtime.UNCHANGED)])
+
+    def test_script_failure_falls_back_to_raw(self):
+        source = self._source('digest')
+        source.script = mock.Mock(side_effect=runtime.redis.exceptions.ResponseError("NOSCRIPT desabilitado"))
+
+        self.assertEqual(source.poll(), [(None, self.payload)])
+        self.assertEqual((source.detection, source.script), ('raw', None))
+
+    def test_unchanged_entries_are_not_decoded_or_executed(self):
+        self.redis_client.set('in' + runtime.CHANGE_VERSION_SUFFIX, 1)
+        calls = []
+        function = runtime.HostedFunction('fn', input_key='in', output_key='out', adaptive=False)
+        function.source = self._source('version')
+        engine = runtime.InlineEngine({'fn': (lambda input_data, context: calls.append(input_data) or {}, None)})
+
+        with mock.patch.object(runtime, 'METRICS', _metrics()):
+            for _ in range(3):
+                function.process(function.source.poll(), engine, self.redis_client)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(function.unchanged_reads, 2)
+
+    def test_raw_mode_compares_the_bytes_of_the_last_sample(self):
+        function = runtime.HostedFunction('fn', input_key='in', output_key='out', adaptive=False)
+        function.source = self._source('raw')
+        engine = runtime.InlineEngine({'fn': (lambda input_data, context: {}, None)})
+        decode = mock.patch.object(function.input_codec, 'decode', wraps=function.input_codec.decode)
+
+        with mock.patch.object(runtime, 'METRICS', _metrics()), decode as decoded:
+            for _ in range(3):
+                function.process(function.source.poll(), engine, self.redis_client)
+
+        self.assertEqual(decoded.call_count, 1)
+        self.assertEqual((function.execution_count, function.unchanged_reads), (1, 2))
+
+
+@requires_fakeredis
+class AsyncPrefetchTokenTest(unittest.IsolatedAsyncioTestCase):
+    """
+    Token do CHANGE_SCRIPT com leitura antecipada no runtime asyncio (modo
+    'version': o fakeredis não implementa redis.sha1hex, usado por 'digest').
+    """
+
+    async def asyncSetUp(self):
+        self.redis_client = fakeredis.FakeAsyncRedis()
+        await self.redis_client.set('in', json.dumps(_sample(0)))
+        await self.redis_client.set('in' + runtime.CHANGE_VERSION_SUFFIX, 1)
+        self.source = runtime.AsyncPollingSource(self.redis_client, 'in', period=0, detection='version')
+
+    async def test_prefetch_before_ack_does_not_resend_the_payload(self):
+        (token, payload), = await self.source.read()
+        self.assertIsNot(payload, runtime.UNCHANGED)
+
+        # Próxima leitura antes do ack da amostra em processamento
+        self.assertEqual(await self.source.read(), [(token, runtime.UNCHANGED)])
+
+    async def test_rewind_after_handler_failure_reads_the_payload_again(self):
+        (token, payload), = await self.source.read()
+        self.source.rewind()
+        self.assertEqual(await self.source.read(), [(token, payload)])
+
+
+if __name__ == '__main__':
+    unittest.main()